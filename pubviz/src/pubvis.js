@@ -1,4 +1,7 @@
 PUBVIS = function () {
+    //keyword and author clouds of the whole corpus, precomputed by build_corpus.py
+    var corpus_aggregates = null;
+
     var make_it_all = function (params) {
         filename = params.filename;
         exclude_keywords = params.exclude_keywords
@@ -16,24 +19,97 @@ PUBVIS = function () {
 
     //access the bib.file, start the conversion into a json 
     //and start the representation of the data
-    //@param.filename = String (e.g "file.bib")
+    //a corpus compiled by scripts/utils/build_corpus.py (file.corpus.json next to file.bib)
+    //is preferred, it is already parsed and holds the keyword and author clouds.
+    //file.corpus.json is a manifest, the entries are in the shards it lists,
+    //which are fetched in parallel
+    //@param.filename = String (e.g "file.bib" or "file.corpus.json")
     var fetch_bibfile = function (filename) {
-        var result;
+        var corpus_filename = filename.replace(/\.bib$/, ".corpus.json");
 
-        $.get(filename, function (data) {
+        if (corpus_filename === filename && !/\.json$/.test(filename)) {
+            fetch_bibtex(filename);
+            return;
+        }
 
-            result = bib2json(data);
-            // console.log(result);
-            result = parseStringYearToCurrentYear(result);
-            // console.log(result);
-            display_data(result.json, prepare_errors(result.errors).error_text);
+        var fail = function () {
+            if (corpus_filename !== filename) {
+                //no compiled corpus, parse the bib file in the browser
+                fetch_bibtex(filename);
+            } else {
+                show_missing_file(filename);
+            }
+        };
+
+        $.getJSON(corpus_filename, function (manifest) {
+            var folder = corpus_filename.substring(0, corpus_filename.lastIndexOf("/") + 1);
+            var requests = $.map(manifest.shards, function (shard) {
+                return $.getJSON(folder + shard);
+            });
 
-        }).fail(function () {
-            $("#loading").hide();
-            $("body").append("<div id='error'> Sorry, the BibTex file cannot be found. </br></br>Please check if the the file '" + filename + "' contains a correct URL and/or correct filename.</div>");
+            $.when.apply($, requests).done(function () {
+                //one request resolves with its data, several with [data, status, xhr] each
+                var shards = requests.length === 1 ? [arguments[0]] : $.map(arguments, function (response) {
+                    return [response[0]];
+                });
+                manifest.entries = [].concat.apply([], $.map(shards, function (shard) {
+                    return [unpack_shard(shard)];
+                }));
+                display_corpus(manifest);
+            }).fail(fail);
+
+        }).fail(fail);
+    }
+
+    //a shard keeps its entries as rows [citationKey, entryType, value of each tag or null, ...]
+    var unpack_shard = function (shard) {
+        return $.map(shard.entries, function (row) {
+            var entry = { citationKey: row[0], entryType: row[1], entryTags: {} };
+            for (var i = 2; i < row.length; i++) {
+                if (row[i] !== null) {
+                    entry.entryTags[shard.tags[i - 2]] = row[i];
+                }
+            }
+            return entry;
         });
     }
 
+    var display_corpus = function (corpus) {
+        //the clouds are kept as rows [text, size, long_text / first_name]
+        corpus_aggregates = {
+            keywords: $.map(corpus.aggregates.keywords, function (row) {
+                return { text: row[0], size: row[1], long_text: row[2] };
+            }),
+            authors: $.map(corpus.aggregates.authors, function (row) {
+                return { text: row[0], size: row[1], first_name: row[2] };
+            })
+        };
+        var result = parseStringYearToCurrentYear({
+            json: corpus.entries,
+            errors: { index: [], errorMessage: [], errorEntry: [] }
+        });
+        display_data(result.json, prepare_errors(result.errors).error_text);
+    }
+
+    var display_bibtex = function (data) {
+        var result = bib2json(data);
+        // console.log(result);
+        result = parseStringYearToCurrentYear(result);
+        // console.log(result);
+        display_data(result.json, prepare_errors(result.errors).error_text);
+    }
+
+    var fetch_bibtex = function (filename) {
+        $.get(filename, display_bibtex).fail(function () {
+            show_missing_file(filename);
+        });
+    }
+
+    var show_missing_file = function (filename) {
+        $("#loading").hide();
+        $("body").append("<div id='error'> Sorry, the BibTex file cannot be found. </br></br>Please check if the the file '" + filename + "' contains a correct URL and/or correct filename.</div>");
+    }
+
     //return oneBigJson and errors in an object
     //@param.bibfile = bib data
     var bib2json = function (bibfile) {
@@ -477,7 +553,7 @@ PUBVIS = function () {
                 width: width / 2
             });
             //fetch the keywords
-            keywords = get_words(json).words;
+            keywords = corpus_aggregates ? $.extend(true, [], corpus_aggregates.keywords) : get_words(json).words;
 
             keywords = exclude_chosen_keywords(keywords);
 
@@ -503,7 +579,7 @@ PUBVIS = function () {
 
 
             //fetch the authors 
-            authors = get_authors(json).authors;
+            authors = corpus_aggregates ? $.extend(true, [], corpus_aggregates.authors) : get_authors(json).authors;
             //console.log( "authors" );
             //console.dir( authors );
 
@@ -1 +1,8 @@
-from bib_gen import GenerateBibtex
+def __getattr__(name):
+    # imported on first use, so `python -m scripts.GenerateBibtex.bib_gen` does not
+    # load bib_gen twice
+    if name == "GenerateBibtex":
+        from .bib_gen import GenerateBibtex
+
+        return GenerateBibtex
+    raise AttributeError(name)
@@ -0,0 +1,145 @@
+import re
+from typing import Dict, List, Optional
+from ..utils.bib_parser import loads
+from ..utils.bibtex_fetch import DOI_URL, NOT_FOUND, fetch_bibtex
+from ..utils.semantic_scholar import BATCH_URL, fetch_papers_batch
+from ..utils.title_scoring import title_tokens
+
+BIB_FIELDS = [
+    "title",
+    "authors",
+    "venue",
+    "year",
+    "externalIds",
+    "abstract",
+    "journal",
+    "url",
+]
+
+
+def paper_id_from_url(url: str) -> str:
+    """
+    "https://www.semanticscholar.org/paper/e784370c56d4eef9ddd26ed08e4cb683ff00e7c9"
+    => "e784370c56d4eef9ddd26ed08e4cb683ff00e7c9"
+    """
+    return url.strip().rstrip("/").split("/")[-1]
+
+
+def _bib_id(authors: List[str], year, title: str = "") -> str:
+    """
+    "Pomeroy_2019_snowmelt", the first significant title word tells apart
+    the many papers of an author in a year
+    """
+    surname = authors[0].split()[-1] if authors else "Anonymous"
+    surname = re.sub(r"[^\w]", "", surname) or "Anonymous"
+    words = [re.sub(r"[^\w]", "", w) for w in title_tokens(title)]
+    parts = [surname, str(year) if year else "", next((w for w in words if w), "")]
+    return "_".join(part for part in parts if part)
+
+
+def unique_key(key: str, seen: set) -> str:
+    """
+    `key`, or `key` + "a", "b", ... when it is already in `seen`, the
+    returned key is added to `seen`
+    """
+    candidate, n = key, 0
+    while candidate in seen:
+        n, suffix = n + 1, ""
+        i = n
+        while i:
+            i, r = divmod(i - 1, 26)
+            suffix = chr(ord("a") + r) + suffix
+        candidate = key + suffix
+    seen.add(candidate)
+    return candidate
+
+
+def bib_from_paper(paper: dict) -> Optional[Dict[str, str]]:
+    """
+    Build a bibtex entry (bibtexparser dict) from Semantic Scholar
+    graph API json. Returns None if the paper has no title.
+    """
+    if not paper or not paper.get("title"):
+        return None
+
+    authors = [a["name"] for a in paper.get("authors") or [] if a.get("name")]
+    journal = paper.get("journal") or {}
+    external_ids = paper.get("externalIds") or {}
+    year = paper.get("year")
+    venue = journal.get("name") or paper.get("venue") or ""
+
+    bib_dict = {
+        "ENTRYTYPE": "article" if venue else "misc",
+        "ID": _bib_id(authors, year, paper["title"]),
+        "title": paper["title"],
+        "author": ", ".join(authors),
+        "abstract": paper.get("abstract") or "",
+    }
+    optional = {
+        "journal": venue,
+        "year": str(year) if year else "",
+        "volume": (journal.get("volume") or "").strip(),
+        "pages": (journal.get("pages") or "").strip(),
+        "doi": external_ids.get("DOI") or "",
+        "url": paper.get("url") or "",
+    }
+    bib_dict.update({k: v for k, v in optional.items() if v})
+    return bib_dict
+
+
+def fetch_bib_doi(doi: str, abstract: str = "", base_url: str = DOI_URL) -> Optional[Dict[str, str]]:
+    """
+    Fetch the bibtex entry of a doi with doi.org content negotiation
+    (fetch_bibtex: timeouts, retries and the circuit breaker included)
+    """
+    result = fetch_bibtex(doi, base_url=base_url)
+    if not result.ok:
+        reason = "not found on doi.org" if result.status == NOT_FOUND else f"unavailable ({result.error})"
+        print(f"[INFO] doi {doi} {reason}")
+        return None
+
+    entries = loads(result.bibtex)
+    if not entries:
+        return None
+    bib_dict = entries[0]
+    bib_dict["abstract"] = abstract or ""
+    bib_dict["author"] = ", ".join(bib_dict.get("author", "").split(" and "))
+    return bib_dict
+
+
+def fetch_bibs_api(
+    urls: List[str], fallback=None, batch_url: str = BATCH_URL, doi_url: str = DOI_URL
+) -> List[Optional[Dict[str, str]]]:
+    """
+    Build bibtex entries for a list of Semantic Scholar landing pages without
+    a browser: the papers are fetched in bulk from the graph API, doi.org
+    content negotiation fills in papers the API has no authors for, and
+    `fallback(urls)` (e.g. the Selenium scraper) is called with the urls
+    that are still missing and returns their entries in the same order.
+
+    Returns one entry (or None) per url, in input order
+    """
+    paper_ids = [paper_id_from_url(url) for url in urls]
+    papers = fetch_papers_batch(paper_ids, fields=BIB_FIELDS, batch_url=batch_url)
+
+    bib_collection = []
+    for url, paper_id in zip(urls, paper_ids):
+        paper = papers.get(paper_id) or {}
+        bib_dict = bib_from_paper(paper)
+
+        doi = (paper.get("externalIds") or {}).get("DOI")
+        if (bib_dict is None or not bib_dict["author"]) and doi:
+            bib_dict = fetch_bib_doi(doi, paper.get("abstract"), doi_url) or bib_dict
+
+        bib_collection.append(bib_dict)
+
+    missing = [i for i, bib_dict in enumerate(bib_collection) if bib_dict is None]
+    if missing and fallback is not None:
+        scraped = fallback([urls[i] for i in missing])
+        for i, bib_dict in zip(missing, scraped):
+            bib_collection[i] = bib_dict
+
+    for url, bib_dict in zip(urls, bib_collection):
+        if bib_dict is None:
+            print(f"[INFO] Could not build bibtex for {url}")
+    return bib_collection
@@ -1,15 +1,32 @@
 import os
 import yaml
+import contextlib
 import pandas as pd
 from typing import Any
+from typing import Callable
 from typing import Dict
-from utils import extract_dois, fetch_bib, fetch_url_no_doi, get_url_from_doi
+from typing import List
+from typing import Optional
+from .utils import (
+    fetch_bib,
+    fetch_url_no_doi,
+    get_url_from_doi,
+)
+from .bib_api import fetch_bibs_api, unique_key
+from .browser_pool import close_pool, get_pool
+from .checkpoint import RunJournal
+from ..utils import metrics
+from ..utils.bibtex_fetch import DOI_URL
+from ..utils.doi import extract_doi_frame
+from ..utils.paths import in_root
+from ..utils.semantic_scholar import BATCH_URL, resolve_urls
+from ..utils.spreadsheet import CHUNK_SIZE, ChunkWriter, read_chunks, read_column
 from bibtexparser.bibdatabase import BibDatabase
 from bibtexparser.bwriter import BibTexWriter
 
 
 class GenerateBibtex:
-    def __init__(self, config_path: str = "scripts/config/config.yaml"):
+    def __init__(self, config_path: str = in_root("scripts/config/config.yaml")):
         assert os.path.exists(
             config_path
         ), f"[INFO] Config file {config_path} does not exist"
@@ -23,30 +40,117 @@ class GenerateBibtex:
         conf_file = yaml.full_load(open(self.config_path, "r"))
         return conf_file
 
-    def generate_bib(self, output_bib_path: str, input_file: str = None):
+    @metrics.timed()
+    def generate_bib(
+        self,
+        output_bib_path: str,
+        input_file: str = None,
+        mode: str = "api",
+        selenium_fallback: bool = False,
+        journal_path: str = None,
+    ):
         """
         Generate a bibtex collection file from a series of article
-        The bibtex is scraped from the semantic scholar landing scholar of
-        each article.
+        By default the bibtex is built from the Semantic Scholar API json
+        of each article (doi.org content negotiation fills the gaps).
+        mode="selenium" scrapes the semantic scholar landing page of each
+        article instead.
 
         Args:
         output_bib_path: output path of the bibtex collection file
         input_file: input excel file containing semanticscholar urls
+        mode: "api" or "selenium"
+        selenium_fallback: in "api" mode, scrape the articles the API
+        and doi.org could not produce an entry for
+        journal_path: checkpoint journal of the run, defaults to
+        `<output_bib_path>.journal.jsonl`. Articles already completed in
+        the journal are not fetched again, failed ones are retried.
+        The output holds the entries of the current urls only, in input
+        order, and is written as soon as the entries before are known.
 
         """
+        assert mode in ("api", "selenium"), f"[INFO] Unknown mode {mode}"
         if input_file:
-            paper_df = self._read_input_file(input_file)
-            self.url_list = list(paper_df["semantic_scholar_url"])
+            self.url_list = list(read_column(input_file, "semantic_scholar_url"))
+
+        url_list = list(dict.fromkeys(url for url in self.url_list if url))
+        assert len(url_list) != 0, "Semantic Scholar URL link is empty"
+
+        journal = RunJournal(journal_path or output_bib_path + ".journal.jsonl")
+        pending = [url for url in url_list if not journal.done(url)]
+        print(
+            f"[INFO] {len(url_list) - len(pending)} articles already in the journal, "
+            f"{len(pending)} to fetch"
+        )
 
-        assert len(self.url_list) != 0, "Semantic Scholar URL link is empty"
-        bib_collection = [fetch_bib(url) for url in self.url_list if url is not None]
-        db = BibDatabase()
-        db.entries = bib_collection
         writer = BibTexWriter()
         writer.indent = "    "  # indent entries with 4 spaces instead of one
         writer.comma_first = False  # place the comma at the beginning of the line
-        with open(output_bib_path, "w") as bibfile:
-            bibfile.write(writer.write(db))
+        writer.order_entries_by = None  # keep the input order, not sorted by ID
+
+        chunk_size = self.config_dict.get("bib_chunk_size", 50)
+        # citation keys already used in the output file
+        self._keys = set()
+        try:
+            with open(output_bib_path, "w") as bibfile:
+                position = {url: i for i, url in enumerate(url_list)}
+                written = 0
+
+                def write_until(end: int):
+                    # journal entries of urls no longer in the input are left out
+                    nonlocal written
+                    entries = [journal.entry(url) for url in url_list[written:end]]
+                    self._write_entries(bibfile, writer, [e for e in entries if e])
+                    written = end
+
+                for start in range(0, len(pending), chunk_size):
+                    chunk = pending[start : start + chunk_size]
+                    if mode == "selenium":
+                        bib_collection = self._scrape_bibs(chunk)
+                    else:
+                        bib_collection = fetch_bibs_api(
+                            chunk,
+                            fallback=self._scrape_bibs if selenium_fallback else None,
+                            batch_url=self.config_dict.get("batch_url", BATCH_URL),
+                            doi_url=self.config_dict.get("doi_url", DOI_URL),
+                        )
+                    for url, bib in zip(chunk, bib_collection):
+                        if bib is None:
+                            journal.record(url, "failed", error="no bibtex entry")
+                        else:
+                            journal.record(url, "ok", entry=bib)
+                    journal.sync()
+                    # every url before the next pending one is settled
+                    following = pending[start + chunk_size : start + chunk_size + 1]
+                    write_until(position[following[0]] if following else len(url_list))
+                write_until(len(url_list))
+        finally:
+            journal.close()
+            # headless browsers must not outlive the run
+            close_pool()
+
+    def _write_entries(self, bibfile, writer: BibTexWriter, entries: List[dict]):
+        if not entries:
+            return
+        db = BibDatabase()
+        # keys like "Pomeroy_2019" collide, bibtex keeps only one entry per key
+        db.entries = [
+            dict(entry, ID=unique_key(entry.get("ID") or "entry", self._keys))
+            for entry in entries
+        ]
+        bibfile.write(writer.write(db))
+        bibfile.flush()
+
+    def _scrape_bibs(self, url_list: List[str]) -> List:
+        """
+        Scrape bibtex for many articles across the browser pool,
+        in input order
+        """
+        pool = get_pool(
+            size=self.config_dict.get("browser_workers", 2),
+            recycle_after=self.config_dict.get("browser_recycle_after", 50),
+        )
+        return pool.map(fetch_bib, url_list)
 
     def _fetch_bib(self, url: str):
         """
@@ -54,47 +158,44 @@ class GenerateBibtex:
         """
         return fetch_bib(url)
 
-    def no_doi_fetch_url(self, input_file: str, output_file: str = None):
+    @metrics.timed()
+    def no_doi_fetch_url(
+        self, input_file: str, output_file: str = None, keep_columns: List[str] = ()
+    ):
         """
         This function generates the semantic scholar landing page URL for
         Articles in a CSV/XLSX file without a doi link
 
         Args:
         Input: csv/xlsx file containing the publications in the first column
+        output_file: csv file the rows are streamed to, chunk by chunk
+        keep_columns: other input columns copied to the output
 
         e.g of publication ==>
         "Wilson, H., Elliott, J., Macrae, M. and Glenn, A. (2019).
         Near-surface soils as a source of phosphorus in snowmelt runoff from cropland.
         Journal of Environmental Quality"
-        """
-
-        paper_df = self._read_input_file(input_file)
-        if "semantic_scholar_url" in list(paper_df.columns):
-            url_list = paper_df["semantic_scholar_url"].tolist()
-        else:
-            url_list = [None] * len(paper_df)
-            paper_df["semantic_scholar_url"] = url_list
-            paper_df = paper_df.fillna("")
-
-        for i in range(len(paper_df)):
-            publication = paper_df.loc[i][0].lower().strip()
 
-            if paper_df.loc[i]["semantic_scholar_url"] == "":
-                sem_landing_url = fetch_url_no_doi(publication)
-                url_list[i] = sem_landing_url
-
-        paper_df["semantic_scholar_url"] = url_list
+        Returns the spreadsheet with its urls when there is no output_file
+        """
 
-        if output_file:
-            paper_df.to_csv(output_file, index=False)
+        def resolve(paper_df: pd.DataFrame) -> pd.DataFrame:
+            publications = paper_df.iloc[:, 0].str.lower().str.strip()
+            pending = paper_df.index[paper_df["semantic_scholar_url"] == ""]
+            for i in pending:
+                paper_df.at[i, "semantic_scholar_url"] = fetch_url_no_doi(publications[i])
+            paper_df["semantic_scholar_url"] = paper_df["semantic_scholar_url"].fillna("")
+            return paper_df
 
-        self.url_list = url_list
-        return paper_df
+        return self._resolve_chunks(input_file, output_file, keep_columns, resolve)
 
     def fetch_url_with_doi(self, doi: str) -> str:
         return get_url_from_doi(doi, self.config_dict)
 
-    def fetch_semantic_scholar_url(self, input_file: str, output_file: str = None):
+    @metrics.timed()
+    def fetch_semantic_scholar_url(
+        self, input_file: str, output_file: str = None, keep_columns: List[str] = ()
+    ):
         """
         This function generates the semantic scholar landing page URL for
         Articles in a CSV/XLSX file with a doi link
@@ -103,78 +204,100 @@ class GenerateBibtex:
         Input: csv/xlsx file containing the publications in the first column
         The publications should contain a doi link in any of the formats
         'doi:10.2134/jeq2018.07.0280.' or 'https://doi.org/10.1016/j.jhydrol.2020.124541.'
+        output_file: csv file the rows are streamed to, chunk by chunk
+        keep_columns: other input columns copied to the output
 
         e.g of publication ==>
         "Wilson, H., Elliott, J., Macrae, M. and Glenn, A. (2019).
         Near-surface soils as a source of phosphorus in snowmelt runoff from cropland.
         Journal of Environmental Quality, 48(4):921-930. doi:10.2134/jeq2019.04.0155."
-        """
-        paper_df = self._read_input_file(input_file)
-
-        if "semantic_scholar_url" in list(paper_df.columns):
-            url_list = paper_df["semantic_scholar_url"].tolist()
-        else:
-            url_list = [None] * len(paper_df)
-            paper_df["semantic_scholar_url"] = url_list
-            paper_df = paper_df.fillna("")
-
-        for i in range(len(paper_df)):
-            publication = paper_df.loc[i][0].lower().strip()
-
-            if paper_df.loc[i]["semantic_scholar_url"] == "":
-                if publication.find("doi.org/", 0) != -1:
-                    print(f"[INFO] Article {i + 2}: doi number present in string")
-                    sem_landing_url = extract_dois(
-                        publication, self.config_dict, "doi.org/"
-                    )
-                elif publication.find("doi:", 0) != -1:
-                    print(f"[INFO] Article {i + 2}: doi number present in string")
-                    sem_landing_url = extract_dois(
-                        publication, self.config_dict, "doi:"
-                    )
-                else:
-                    publication = paper_df.loc[i][0]
-                    print(f"[INFO] Article {i + 2}: doi number absent in string")
-                    sem_landing_url = None  # fetch_url_no_doi(publication)
-
-                print(sem_landing_url)
-                url_list[i] = sem_landing_url
-            else:
-                pass
-
-        paper_df["semantic_scholar_url"] = url_list
 
-        if output_file:
-            paper_df.to_csv(output_file, index=False)
-
-        self.url_list = url_list
+        Returns the spreadsheet with its dois and urls when there is no output_file
+        """
+        counts = {"pending": 0, "no_doi": 0}
+
+        def resolve(paper_df: pd.DataFrame) -> pd.DataFrame:
+            # extract every doi of the chunk in one vectorized pass, then
+            # resolve the unique ones in bulk
+            dois = extract_doi_frame(paper_df.iloc[:, 0])
+            paper_df["doi"] = dois["doi"].fillna("")
+            paper_df["doi_source"] = dois["doi_source"]
+
+            pending = (paper_df["semantic_scholar_url"] == "") & dois["doi"].notna()
+            counts["pending"] += int(pending.sum())
+            counts["no_doi"] += int((dois["doi_source"] == "").sum())
+            url_map = resolve_urls(
+                dois.loc[pending, "doi"].unique(),
+                batch_url=self.config_dict.get("batch_url", BATCH_URL),
+            )
+            paper_df.loc[pending, "semantic_scholar_url"] = (
+                dois.loc[pending, "doi"].map(url_map).fillna("")
+            )
+            return paper_df
+
+        paper_df = self._resolve_chunks(input_file, output_file, keep_columns, resolve)
+        print(
+            f"[INFO] {counts['pending']} articles with a doi number resolved, "
+            f"{counts['no_doi']} without a doi number"
+        )
         return paper_df
 
-    def _read_input_file(self, input_file: str):
+    def _resolve_chunks(
+        self,
+        input_file: str,
+        output_file: Optional[str],
+        keep_columns: List[str],
+        resolve: Callable[[pd.DataFrame], pd.DataFrame],
+    ) -> Optional[pd.DataFrame]:
         """
-        Read excel file
+        Stream the publication column (the first one), the url column and
+        `keep_columns` of the input through `resolve`, chunk by chunk.
+        The resolved chunks are appended to output_file, or concatenated
+        and returned when there is none.
         """
-        assert os.path.exists(
-            input_file
-        ), f"[INFO] Input file {input_file} does not exist"
-        df = (
-            pd.read_excel(input_file, header=0).fillna("")
-            if input_file.endswith(".xlsx")
-            else pd.read_csv(input_file, header=0, encoding="iso8859_16").fillna("")
+        columns = [0, "semantic_scholar_url", *keep_columns]
+        chunksize = self.config_dict.get("input_chunk_size", CHUNK_SIZE)
+        self.url_list, frames = [], []
+        with ChunkWriter(output_file) if output_file else contextlib.nullcontext() as writer:
+            for chunk in read_chunks(input_file, columns, chunksize=chunksize):
+                chunk = resolve(self._with_url_column(chunk))
+                self.url_list.extend(url or None for url in chunk["semantic_scholar_url"])
+                if writer is None:
+                    frames.append(chunk)
+                else:
+                    writer.write(chunk)
+        if writer is not None:
+            print(f"[INFO] {writer.rows} articles written to {output_file}")
+            return None
+        return pd.concat(frames) if frames else pd.DataFrame()
+
+    def _with_url_column(self, paper_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Make sure the semantic_scholar_url column exists, "" marks a missing url
+        """
+        if "semantic_scholar_url" not in paper_df.columns:
+            paper_df["semantic_scholar_url"] = ""
+        paper_df["semantic_scholar_url"] = (
+            paper_df["semantic_scholar_url"].fillna("").astype(str)
         )
-        return df
+        return paper_df
 
 
 if __name__ == "__main__":
-    excel_file = "/Users/mac/Desktop/gwf_publications.csv"
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "input_file",
+        nargs="?",
+        default=in_root("data/gwf_2019_peer_review_articles.csv"),
+        help="publication spreadsheet (.csv or .xlsx)",
+    )
+    parser.add_argument("--urls", default="articles.csv", help="spreadsheet with the url column")
+    parser.add_argument("--output", default="publications_bibtex.bib")
+    parser.add_argument("--mode", choices=["api", "selenium"], default="api")
+    args = parser.parse_args()
+
     generator = GenerateBibtex()
-    # df = generator.fetch_semantic_scholar(excel_file)
-    # generator.generate_bib(
-    #     output_bib_path="output.bib",
-    #     input_file="/Users/mac/Desktop/gwf_publications_no_doi.csv",
-    # )
-
-    # generator._fetch_bib(
-    #     "https://www.semanticscholar.org/paper/e784370c56d4eef9ddd26ed08e4cb683ff00e7c9"
-    # )
-    print(generator.fetch_url_with_doi("10.5194/ESSD-12-629-2020"))
+    generator.fetch_semantic_scholar_url(args.input_file, args.urls)
+    generator.generate_bib(args.output, input_file=args.urls, mode=args.mode)
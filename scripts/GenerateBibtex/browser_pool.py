@@ -0,0 +1,159 @@
+import atexit
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+
+class BrowserPool:
+    """
+    Bounded pool of headless Firefox instances for Selenium scraping.
+
+    Browsers are only started when a page is first requested, at most
+    `size` of them exist at a time, and each one is restarted after
+    `recycle_after` pages to keep its memory in check.
+
+    Args:
+    size: maximum number of browsers
+    recycle_after: pages served by a browser before it is restarted
+    headless: run Firefox without a window
+    """
+
+    def __init__(self, size: int = 2, recycle_after: int = 50, headless: bool = True):
+        assert size > 0, "[INFO] Browser pool size must be positive"
+        self.size = size
+        self.recycle_after = recycle_after
+        self.headless = headless
+        self._idle = []
+        self._created = 0
+        # signalled whenever a browser goes back to the pool or a slot frees up
+        self._available = threading.Condition()
+        self._closed = False
+
+    def _start_browser(self):
+        from selenium.webdriver import Firefox
+        from selenium.webdriver.firefox.options import Options
+
+        opts = Options()
+        if self.headless:
+            opts.add_argument("--headless")
+        print("[INFO] Starting headless browser")
+        return Firefox(options=opts)
+
+    def _acquire(self):
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return [self._start_browser(), 0]
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _free_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, worker):
+        try:
+            worker[0].quit()
+        except Exception as e:
+            print(str(e))
+        self._free_slot()
+
+    def _release(self, worker):
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    @contextmanager
+    def browser(self):
+        """
+        Borrow a browser from the pool for one page
+        """
+        worker = self._acquire()
+        healthy = False
+        try:
+            yield worker[0]
+            healthy = True
+        finally:
+            worker[1] += 1
+            if self._closed or not healthy or worker[1] >= self.recycle_after:
+                self._discard(worker)
+            else:
+                self._release(worker)
+
+    def map(self, fn: Callable, urls: List[str]) -> List:
+        """
+        Call `fn(url, browser)` for every url across the pool,
+        results are returned in input order (None for urls that failed)
+        """
+
+        def run(url):
+            try:
+                with self.browser() as browser:
+                    return fn(url, browser)
+            except Exception as e:
+                print(f"[ERROR] {url}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(run, urls))
+
+    def close(self):
+        """
+        Quit the idle browsers, borrowed ones quit when they are returned
+        """
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            self._discard(worker)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(size: int = None, recycle_after: int = None) -> BrowserPool:
+    """
+    Process-wide pool, created on first use (2 browsers recycled after 50
+    pages unless given). Asking for a different size or recycle_after
+    than the open pool has is an error, close_pool() it first.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = BrowserPool(size=size or 2, recycle_after=recycle_after or 50)
+            atexit.register(_pool.close)
+        elif (size is not None and size != _pool.size) or (
+            recycle_after is not None and recycle_after != _pool.recycle_after
+        ):
+            raise ValueError(
+                f"[ERROR] browser pool already open with size {_pool.size} and "
+                f"recycle_after {_pool.recycle_after}"
+            )
+        return _pool
+
+
+def close_pool():
+    """
+    Quit the browsers of the process-wide pool, if it was ever used
+    """
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+from typing import Dict, List, Optional
+
+
+class RunJournal:
+    """
+    Append-only JSONL journal of a bibtex generation run.
+
+    Every processed article is appended as one line keyed by its semantic
+    scholar url (or doi): {"key", "status", "entry", "error", "time"}.
+    When a key appears several times the last line wins, so a rerun only
+    has to process keys that are missing or not "ok". A partially written
+    last line (crash during a write) is ignored on load.
+
+    Args:
+    path: journal file, created on first write
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, dict] = {}
+        self._file = None
+        self._torn_tail = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as journal:
+            for line in journal:
+                self._torn_tail = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.records.pop(record["key"], None)
+                self.records[record["key"]] = record
+        print(
+            f"[INFO] Journal {self.path}: {len(self.completed())} completed, "
+            f"{len(self.records) - len(self.completed())} failed"
+        )
+
+    def done(self, key: str) -> bool:
+        record = self.records.get(key)
+        return record is not None and record["status"] == "ok"
+
+    def record(
+        self, key: str, status: str, entry: dict = None, error: Optional[str] = None
+    ):
+        record = {
+            "key": key,
+            "status": status,
+            "entry": entry,
+            "error": error,
+            "time": time.time(),
+        }
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._torn_tail:
+                self._file.write("\n")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self.records.pop(key, None)
+        self.records[key] = record
+
+    def sync(self):
+        """
+        Make sure everything recorded so far survives a crash
+        """
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def entry(self, key: str) -> Optional[dict]:
+        """
+        Bibtex entry of a completed key, None otherwise
+        """
+        return self.records[key]["entry"] if self.done(key) else None
+
+    def completed(self) -> List[str]:
+        return [k for k, r in self.records.items() if r["status"] == "ok"]
@@ -1,38 +1,51 @@
-import os
 import re
-import json
-import time
-import requests
-import difflib
-import bibtexparser
-import pandas as pd
-from tqdm import tqdm
-import nltk
-from nltk.corpus import stopwords
-import selenium
-from selenium.webdriver import Firefox
-from selenium.webdriver.firefox.options import Options
-
-opts = Options()
-opts.add_argument("--headless")
-browser = Firefox(options=opts)
-
-nltk.download("stopwords")
-list_stopwords = list(stopwords.words("english"))
-
-
-def fetch_bib(url: str):
+from functools import lru_cache
+from .browser_pool import get_pool
+from ..utils import metrics
+from ..utils.bib_parser import loads
+from ..utils.http_cache import cached_get
+from ..utils.retry import fetch_with_retry
+from ..utils.title_index import get_title_index
+from ..utils.title_scoring import TitleScorer
+
+PAPER_URL = "https://api.semanticscholar.org/v1/paper/"
+SEARCH_URL = "https://api.semanticscholar.org/graph/v1/paper/search?"
+
+
+@lru_cache(maxsize=1)
+def get_stopwords() -> frozenset:
+    """
+    English stopwords, downloaded on first use
+    """
+    import nltk
+    from nltk.corpus import stopwords
+
+    nltk.download("stopwords", quiet=True)
+    return frozenset(stopwords.words("english"))
+
+
+@metrics.timed(items=lambda result, *args, **kwargs: 1)
+def fetch_bib(url: str, browser=None):
     """
     Crawl the Bibtex Entry of a Publication from Semantic Scholar
     with Selenium.
     Args::
     url: Link to the semantic scholar landing page of the publication
+    browser: Selenium driver to use, a browser is borrowed from the
+    shared pool when omitted
     output: Output Bib Text
 
     Example: fetch_bib("https://www.semanticscholar.org/paper/e784370c56d4eef9ddd26ed08e4cb683ff00e7c9")
     """
+    if browser is None:
+        with get_pool().browser() as browser:
+            return fetch_bib(url, browser)
+
+    import selenium.common.exceptions
+
     print(url)
     browser.get(url)
+    bib_text = None
 
     try:
         _ = browser.find_element_by_css_selector(
@@ -72,99 +85,47 @@ def fetch_bib(url: str):
             f"Paper has no abstract on Semantic Scholar, Element ==> (span[data-selenium-selector=text-truncator-text])"
         )
 
+    if bib_text is None:
+        return None
+
     # parse bibtex
-    bib_dict = bibtexparser.loads(bib_text).entries[0]
+    bib_dict = loads(bib_text)[0]
     bib_dict["abstract"] = abs_result if abs_result is not None else ""
     bib_dict["author"] = ", ".join(bib_dict["author"].split(" and "))
 
     return bib_dict
 
 
+@metrics.timed()
 def get_url_from_doi(doi: str, config: dict, retry_iter: int = 3):
     """
     This function used the article unique doi identifier to
     fetch the Semantic Scholar landing page URL using the
-    Semantic Scholar API. Sometimes the API times out, the function
-    automatically retries
+    Semantic Scholar API. Rate limits and timeouts are retried
+    with backoff by the shared retry policy, failures are recorded
+    in `get_policy().failures`
 
     Arguments:
     doi: str = article unique doi number
+    retry_iter: int = maximum number of retries
     Returns:
     Semantic Scholar Landing Page URL
     """
-    try:
-        api_url = config["paper_url"] + doi
-        r = requests.get(url=api_url.strip())
-        data = r.json()
-        if not "error" in list(data.keys()):
-            sem_landing_url = data["url"]
-    except KeyError as e:
-        iteration = retry_iter
-        sem_landing_url = None
-        while iteration != 0:
-            print("[ERROR] Timeout; Trying again")
-            iteration -= 1
-            time.sleep(500)
-            api_url = config["paper_url"] + doi
-            r = requests.get(url=api_url.strip())
-            data = r.json()
-            try:
-                sem_landing_url = data["url"]
-            except:
-                sem_landing_url = None
-            print(iteration)
-            if sem_landing_url != None:
-                break
-
-    return sem_landing_url
-
-
-def extract_dois(publication: str, config, split_string: str):
-    """
-    This function extracts the doi number from a piece of string
-    and then calls the `get_url_from_doi` to generate the landing
-    page of the article
-    """
+    api_url = config["paper_url"] + doi
+    result = fetch_with_retry(api_url.strip(), max_retries=retry_iter)
+    if result.ok and isinstance(result.data, dict):
+        return result.data.get("url")
+    return None
 
-    def publist2url(publication_list: list):
-        publication_list = [
-            item for item in publication_list[1:] if item.find("10.") != -1
-        ]
-        doi = publication_list[0].split()[0]
 
-        doi = (
-            doi
-            if not (doi.endswith(".") or doi.endswith(",") or doi.endswith(")"))
-            else doi[:-1]
-        )
-        doi = doi[doi.find("10.") :]
-        return doi
-
-    try:
-        publication_list = publication.split(split_string)
-        doi = publist2url(publication_list)
-        sem_landing_url = get_url_from_doi(doi, config)
-    except:
-        try:
-            publication_list = publication.replace(" ", "").split(split_string)
-            doi = publist2url(publication_list)
-            sem_landing_url = get_url_from_doi(doi, config)
-        except:
-            print("Could not fetch semantic scholar landing url")
-            sem_landing_url = None
-
-    return sem_landing_url
-
-
-def fetch_url_no_doi(publication: str):
+def build_search_query(publication: str, stopwords: frozenset = None) -> str:
     """
-    Fetch the Semantic Scholar landing page url for  an Article
-    without a doi link
+    Search query for a citation: up to six words of it that are not
+    initials, years, stopwords or words with digits / special characters
     """
     string_check = re.compile("[@_!#$%^&*()<>?/\|}{~:-]")
-    paper_url = "https://api.semanticscholar.org/v1/paper/"
-    search_url = "https://api.semanticscholar.org/graph/v1/paper/search?"
-    print(publication)
+    if stopwords is None:
+        stopwords = get_stopwords()
 
     pub = re.sub("([A-Z][.][A-Z][.][,])", "", publication)
     pub = re.sub("([A-Z][.][,])", "", publication)
@@ -173,7 +134,7 @@ def fetch_url_no_doi(publication: str):
     pub = re.sub("([(][0-9]{4}[)])", "", pub)
 
     pub = [i for item in pub.split(",") for i in item.strip().split()]
-    pub = [item for item in pub if item.lower() not in list_stopwords and len(item) > 2]
+    pub = [item for item in pub if item.lower() not in stopwords and len(item) > 2]
 
     pub = [
         item
@@ -188,24 +149,47 @@ def fetch_url_no_doi(publication: str):
             break
         except:
             i -= 1
+    return query
+
+
+@metrics.timed()
+def fetch_url_no_doi(
+    publication: str, paper_url: str = PAPER_URL, search_url: str = SEARCH_URL
+):
+    """
+    Fetch the Semantic Scholar landing page url for  an Article
+    without a doi link. Publications already in the local title index
+    (our .bib files and ref_CORE.json) are resolved offline, the remote
+    search is only used on a miss.
+    """
+    print(publication)
+
+    match = get_title_index().lookup(publication)
+    if match is not None:
+        print(f"[INFO] Found in local title index: {match['title']}")
+        if "semanticscholar.org/paper/" in match["url"]:
+            return match["url"]
+        if match["doi"]:
+            sem_landing_url = get_url_from_doi(match["doi"], {"paper_url": paper_url})
+            if sem_landing_url is not None:
+                return sem_landing_url
+
+    query = build_search_query(publication)
     print("[Query]:  " + query)
 
     PARAMS = {"offset": 0, "limit": 50, "query": query}
 
-    r = requests.get(url=search_url, params=PARAMS)
+    r = cached_get(search_url, params=PARAMS)
     try:
         data = r.json()
         if data["total"] > 1:
-            score = []
-            for paper in data["data"]:
-                temp = difflib.SequenceMatcher(None, paper["title"], publication)
-                score.append(temp.ratio())
-
-            url2 = paper_url + data["data"][score.index(max(score))]["paperId"]
+            scorer = TitleScorer(publication)
+            best, _ = scorer.best([paper["title"] for paper in data["data"]])
+            url2 = paper_url + data["data"][best]["paperId"]
         else:
             url2 = paper_url + data["data"][0]["paperId"]
 
-        r2 = requests.get(url=url2)
+        r2 = cached_get(url2)
         data2 = r2.json()
         sem_landing_url = data2["url"]
     except:
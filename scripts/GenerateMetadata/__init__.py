@@ -1 +1,8 @@
-from meta_gen import GenerateMetadata
+def __getattr__(name):
+    # imported on first use, so `python -m scripts.GenerateMetadata.meta_gen` does not
+    # load meta_gen twice
+    if name == "GenerateMetadata":
+        from .meta_gen import GenerateMetadata
+
+        return GenerateMetadata
+    raise AttributeError(name)
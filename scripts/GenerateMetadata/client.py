@@ -0,0 +1,217 @@
+import asyncio
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+from urllib.parse import urlparse
+from .helper import CITATION_URL, REFERENCES_URL, PAPER_URL, FIELDS
+from ..utils import metrics
+from ..utils.http_cache import get_cache
+from ..utils.rate_limit import TokenBucket
+from ..utils.retry import RetryPolicy, get_policy
+
+PAGE_SIZE = 999
+
+
+class AsyncSemanticScholarClient:
+    """
+    asyncio client for the Semantic Scholar API.
+
+    Responses go through the shared on-disk cache, only cache misses reach
+    the network. Those are paced by a token bucket (`requests_per_second`)
+    and at most `max_in_flight` of them are outstanding at any time. Failed
+    requests back off according to the shared retry policy without holding
+    one of the in-flight slots. The blocking
+    `requests` calls run on a thread pool with one keep-alive session per
+    worker, so the client works with the same stack as `helper.py`.
+
+    The url templates default to the public API, pointing them at a local
+    stub server is enough to exercise the client offline.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        requests_per_second: float = 1.0,
+        paper_url: str = PAPER_URL,
+        citation_url: str = CITATION_URL,
+        references_url: str = REFERENCES_URL,
+        timeout: float = 30,
+        policy: RetryPolicy = None,
+    ):
+        self.paper_url = paper_url
+        self.citation_url = citation_url
+        self.references_url = references_url
+        self.timeout = timeout
+        self.policy = policy or get_policy()
+        self.bucket = TokenBucket(requests_per_second)
+        self._max_in_flight = max_in_flight
+        self._semaphore = None
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _get(self, key: str, url: str):
+        return get_cache().fetch(
+            key, "GET", url, session=self._session(), timeout=self.timeout
+        )
+
+    async def _get_json(self, url: str) -> dict:
+        key, cached = get_cache().lookup("GET", url)
+        if cached is not None:
+            return cached.json()
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        loop = asyncio.get_running_loop()
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            if not self.policy.breaker.allow(host):
+                result = self.policy.result(
+                    url, error=RuntimeError(f"circuit open for {host}"), attempts=attempt
+                )
+                return {"error": result.error}
+
+            response, error = None, None
+            async with self._semaphore:
+                await self.bucket.acquire()
+                try:
+                    response = await loop.run_in_executor(
+                        self._executor, self._get, key, url
+                    )
+                except requests.RequestException as e:
+                    error = e
+
+            delay = self.policy.next_delay(url, attempt, response, error)
+            if delay is None:
+                result = self.policy.result(url, response, error, attempt + 1)
+                if isinstance(result.data, dict):
+                    return result.data
+                return {"error": result.error}
+            print(f"[ERROR] {error or response.status_code}; retrying in {delay:.1f}s")
+            # back off without holding a slot, other papers keep going
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def fetch_paper_metadata(self, paper_id: str, fields: list = FIELDS):
+        print(f"[INFO] paper id {paper_id}")
+        url = self.paper_url.replace("{paper_id}", paper_id)
+        data = await self._get_json(url)
+        if "error" in data:
+            return None
+        try:
+            return [data[i] for i in fields]
+        except KeyError:
+            return None
+
+    async def _fetch_pages(
+        self,
+        url_template: str,
+        paper_id: str,
+        key: str,
+        fields: list = FIELDS,
+        count: int = None,
+    ):
+        """
+        All pages of a citation or reference listing. With the number of
+        items known up front (`count`, e.g. citationCount) the pages after
+        the first one are requested concurrently, then paging goes on one
+        page at a time for as long as the last page is full, in case the
+        count was stale. Returns None, rather than part of the listing,
+        when a page could not be fetched.
+        """
+        url_template = url_template.replace("{paper_id}", paper_id)
+        url_template = url_template.replace("{fields}", ",".join(fields))
+
+        def page_url(offset):
+            return url_template.replace("{offset}", str(offset))
+
+        async def fetch_page(offset):
+            page = (await self._get_json(page_url(offset))).get("data")
+            if page is None:
+                print(f"[ERROR] page at offset {offset} of {paper_id} failed, listing dropped")
+            return page
+
+        page = await fetch_page(0)
+        if page is None:
+            return None
+        items = [x[key] for x in page]
+        if len(page) < PAGE_SIZE or "{offset}" not in url_template:
+            return items
+
+        offset = PAGE_SIZE
+        if count is not None and count > PAGE_SIZE:
+            offsets = range(PAGE_SIZE, count, PAGE_SIZE)
+            pages = await asyncio.gather(*[fetch_page(o) for o in offsets])
+            if any(page is None for page in pages):
+                return None
+            for page in pages:
+                items += [x[key] for x in page]
+            if len(pages[-1]) < PAGE_SIZE:
+                return items
+            offset = offsets[-1] + PAGE_SIZE
+
+        while True:
+            page = await fetch_page(offset)
+            if page is None:
+                return None
+            items += [x[key] for x in page]
+            if len(page) < PAGE_SIZE:
+                return items
+            offset += PAGE_SIZE
+
+    async def fetch_citations(
+        self, paper_id: str, fields: list = FIELDS, count: int = None
+    ) -> List:
+        return await self._fetch_pages(
+            self.citation_url, paper_id, "citingPaper", fields, count
+        )
+
+    async def fetch_references(
+        self, paper_id: str, fields: list = FIELDS, count: int = None
+    ) -> List:
+        return await self._fetch_pages(
+            self.references_url, paper_id, "citedPaper", fields, count
+        )
+
+    async def fetch_many(
+        self, paper_ids: Iterable[str], fields: list = FIELDS
+    ) -> Dict[str, List]:
+        """
+        Fetch metadata for every paper id concurrently, keyed by paper id
+        """
+        paper_ids = list(dict.fromkeys(paper_ids))
+        results = await asyncio.gather(
+            *[self.fetch_paper_metadata(pid, fields) for pid in paper_ids]
+        )
+        return dict(zip(paper_ids, results))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+@metrics.timed()
+def fetch_paper_metadata_batch(
+    paper_ids: Iterable[str],
+    fields: list = FIELDS,
+    max_in_flight: int = 8,
+    requests_per_second: float = 1.0,
+    **client_kwargs,
+) -> Dict[str, List]:
+    """
+    Blocking wrapper around `AsyncSemanticScholarClient.fetch_many`
+    """
+    client = AsyncSemanticScholarClient(
+        max_in_flight=max_in_flight,
+        requests_per_second=requests_per_second,
+        **client_kwargs,
+    )
+    try:
+        return asyncio.run(client.fetch_many(paper_ids, fields))
+    finally:
+        client.close()
@@ -0,0 +1,283 @@
+"""
+Breadth-first crawl of the citation / reference graph of the GWF papers.
+
+Starting from the GWF papers (depth 0), every paper of the frontier gets
+its citations and/or references fetched with the async client, the papers
+seen for the first time form the next frontier. A paper is expanded at
+most once, however many times it is reached. Papers are numbered in the
+order they are found and the edges are kept as (citing, cited) int32
+arrays, the graph is saved as a compressed .npz (and as parquet tables
+when pyarrow is installed).
+
+python -m scripts.GenerateMetadata.crawler --depth 2 -o files/citation_graph
+"""
+import asyncio
+import argparse
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .client import AsyncSemanticScholarClient
+from ..utils.paths import in_root
+
+GRAPH_PATH = "files/citation_graph"
+SEEDS_CSV = in_root("data/gwf_2019_peer_review_articles.csv")
+CRAWL_FIELDS = ["title", "year", "citationCount", "referenceCount"]
+DIRECTIONS = ("citations", "references", "both")
+CHUNK_SIZE = 200
+
+
+class CitationGraph:
+    """
+    Papers and (citing, cited) edges of a crawl. Paper attributes are
+    plain lists while crawling and numpy arrays once saved; unknown
+    years and counts are -1.
+    """
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.paper_ids: List[str] = []
+        self.titles: List[str] = []
+        self.depth: List[int] = []
+        self.year: List[int] = []
+        self.citation_count: List[int] = []
+        self.reference_count: List[int] = []
+        self._citing: List[np.ndarray] = []
+        self._cited: List[np.ndarray] = []
+        # _citing / _cited hold one array of unique edges
+        self._deduped = False
+
+    def __len__(self) -> int:
+        return len(self.paper_ids)
+
+    def add_paper(self, paper: dict, depth: int) -> int:
+        """
+        Number of the paper, -1 for papers without a Semantic Scholar id
+        """
+        paper_id = paper.get("paperId")
+        if not paper_id:
+            return -1
+        if paper_id in self.index:
+            return self.index[paper_id]
+        self.index[paper_id] = len(self.paper_ids)
+        self.paper_ids.append(paper_id)
+        self.titles.append(paper.get("title") or "")
+        self.depth.append(depth)
+        self.year.append(paper.get("year") or -1)
+        self.citation_count.append(_count(paper.get("citationCount")))
+        self.reference_count.append(_count(paper.get("referenceCount")))
+        return self.index[paper_id]
+
+    def add_edges(self, citing: List[int], cited: List[int]):
+        self._citing.append(np.asarray(citing, dtype=np.int32))
+        self._cited.append(np.asarray(cited, dtype=np.int32))
+        self._deduped = False
+
+    @property
+    def edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (citing, cited) arrays, every edge once even if it was found from
+        both of its ends
+        """
+        if not self._deduped:
+            citing = np.concatenate(self._citing or [np.zeros(0, dtype=np.int32)])
+            cited = np.concatenate(self._cited or [np.zeros(0, dtype=np.int32)])
+            keys = np.unique(citing.astype(np.int64) << 32 | cited.astype(np.int64))
+            self._citing = [(keys >> 32).astype(np.int32)]
+            self._cited = [(keys & 0xFFFFFFFF).astype(np.int32)]
+            self._deduped = True
+        return self._citing[0], self._cited[0]
+
+    def citations_in_graph(self) -> np.ndarray:
+        """
+        Number of crawled papers citing every paper
+        """
+        _, cited = self.edges
+        return np.bincount(cited, minlength=len(self))
+
+    def save(self, path: str = GRAPH_PATH):
+        citing, cited = self.edges
+        np.savez_compressed(
+            path + ".npz",
+            citing=citing,
+            cited=cited,
+            paper_ids=np.array(self.paper_ids, dtype=str),
+            titles=np.array(self.titles, dtype=str),
+            depth=np.array(self.depth, dtype=np.int8),
+            year=np.array(self.year, dtype=np.int16),
+            citation_count=np.array(self.citation_count, dtype=np.int32),
+            reference_count=np.array(self.reference_count, dtype=np.int32),
+        )
+        print(f"[INFO] {len(self)} papers and {len(citing)} edges saved to {path}.npz")
+
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("[INFO] pyarrow is not installed, skipping the parquet tables")
+            return
+        pd.DataFrame({"citing": citing, "cited": cited}).to_parquet(path + "_edges.parquet")
+        pd.DataFrame(
+            {
+                "paper_id": self.paper_ids,
+                "title": self.titles,
+                "depth": self.depth,
+                "year": self.year,
+                "citation_count": self.citation_count,
+                "reference_count": self.reference_count,
+            }
+        ).to_parquet(path + "_papers.parquet")
+
+    @classmethod
+    def load(cls, path: str = GRAPH_PATH) -> "CitationGraph":
+        graph = cls()
+        with np.load(path + ".npz") as data:
+            graph.paper_ids = data["paper_ids"].tolist()
+            graph.titles = data["titles"].tolist()
+            for name in ("depth", "year", "citation_count", "reference_count"):
+                setattr(graph, name, data[name].tolist())
+            graph._citing, graph._cited = [data["citing"]], [data["cited"]]
+        graph.index = {paper_id: i for i, paper_id in enumerate(graph.paper_ids)}
+        return graph
+
+
+def _count(value) -> int:
+    return value if isinstance(value, int) else -1
+
+
+async def _expand(client, graph: CitationGraph, node: int, direction: str):
+    """
+    (citations, references) of a paper, [] for the direction not crawled
+    and None for a listing that could not be fetched
+    """
+    paper_id = graph.paper_ids[node]
+    jobs = []
+    for name, fetch, count in (
+        ("citations", client.fetch_citations, graph.citation_count[node]),
+        ("references", client.fetch_references, graph.reference_count[node]),
+    ):
+        if direction in (name, "both"):
+            jobs.append(fetch(paper_id, CRAWL_FIELDS, count if count >= 0 else None))
+        else:
+            jobs.append(asyncio.sleep(0, result=[]))
+    return await asyncio.gather(*jobs)
+
+
+async def crawl_async(
+    client: AsyncSemanticScholarClient,
+    seeds: Iterable[str],
+    depth: int = 1,
+    direction: str = "both",
+    max_papers: int = None,
+) -> CitationGraph:
+    """
+    Crawl `depth` hops around the seed papers. Once the graph holds
+    `max_papers` papers no new papers are added, edges between the papers
+    already found are still recorded.
+    """
+    assert direction in DIRECTIONS, f"[INFO] direction must be one of {DIRECTIONS}"
+    graph = CitationGraph()
+    for seed in seeds:
+        graph.add_paper({"paperId": seed}, 0)
+    frontier = list(range(len(graph)))
+    failed = 0
+
+    for level in range(depth):
+        print(f"[INFO] depth {level + 1}: expanding {len(frontier)} papers")
+        found = []
+        for start in range(0, len(frontier), CHUNK_SIZE):
+            chunk = frontier[start : start + CHUNK_SIZE]
+            results = await asyncio.gather(
+                *[_expand(client, graph, node, direction) for node in chunk]
+            )
+            citing, cited = [], []
+            for node, (citations, references) in zip(chunk, results):
+                for papers, is_citation in ((citations, True), (references, False)):
+                    if papers is None:
+                        failed += 1
+                        continue
+                    for paper in papers:
+                        if (
+                            max_papers is not None
+                            and len(graph) >= max_papers
+                            and paper.get("paperId") not in graph.index
+                        ):
+                            continue
+                        size = len(graph)
+                        other = graph.add_paper(paper, level + 1)
+                        if other < 0:
+                            continue
+                        if len(graph) > size:
+                            found.append(other)
+                        citing.append(other if is_citation else node)
+                        cited.append(node if is_citation else other)
+            graph.add_edges(citing, cited)
+        frontier = found
+        if not frontier:
+            break
+    if failed:
+        print(f"[ERROR] {failed} listings could not be fetched, their edges are missing")
+    return graph
+
+
+def crawl(
+    seeds: Iterable[str],
+    depth: int = 1,
+    direction: str = "both",
+    max_papers: int = None,
+    max_in_flight: int = 8,
+    requests_per_second: float = 1.0,
+    **client_kwargs,
+) -> CitationGraph:
+    """
+    Blocking wrapper around `crawl_async`
+    """
+    client = AsyncSemanticScholarClient(
+        max_in_flight=max_in_flight,
+        requests_per_second=requests_per_second,
+        **client_kwargs,
+    )
+    try:
+        return asyncio.run(crawl_async(client, seeds, depth, direction, max_papers))
+    finally:
+        client.close()
+
+
+def citation_impact(graph: CitationGraph) -> Dict[str, int]:
+    """
+    Papers citing the seeds directly, and papers citing those in turn
+    """
+    citing, cited = graph.edges
+    seeds = np.flatnonzero(np.array(graph.depth) == 0)
+    first = np.unique(citing[np.isin(cited, seeds)])
+    second = np.setdiff1d(np.unique(citing[np.isin(cited, first)]), np.r_[first, seeds])
+    return {"seeds": len(seeds), "citing_seeds": len(first), "citing_those": len(second)}
+
+
+def read_seeds(csv_path: str = SEEDS_CSV) -> List[str]:
+    df = pd.read_csv(csv_path).fillna(0)
+    return [url.split("/")[-1] for url in df["semantic_scholar_url"] if url != 0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paper_ids", nargs="*", help="seed papers, the GWF papers if empty")
+    parser.add_argument("--csv", default=SEEDS_CSV)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--direction", choices=DIRECTIONS, default="both")
+    parser.add_argument("--max-papers", type=int, default=None)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--requests-per-second", type=float, default=1.0)
+    parser.add_argument("-o", "--output", default=GRAPH_PATH)
+    args = parser.parse_args()
+
+    graph = crawl(
+        args.paper_ids or read_seeds(args.csv),
+        depth=args.depth,
+        direction=args.direction,
+        max_papers=args.max_papers,
+        max_in_flight=args.max_in_flight,
+        requests_per_second=args.requests_per_second,
+    )
+    graph.save(args.output)
+    print(f"[INFO] {citation_impact(graph)}")
@@ -1,7 +1,11 @@
-import requests
-import time
 import json
+import asyncio
 import pandas as pd
+from typing import Dict
+from ..utils import metrics
+from ..utils.paths import in_root
+from ..utils.retry import fetch_with_retry
+from ..utils.semantic_scholar import BATCH_SIZE, fetch_papers_batch
 
 CITATION_URL = (
     "https://api.semanticscholar.org/graph/v1/paper/{paper_id}/citations?fields={fields}&offset={"
@@ -9,7 +13,7 @@ CITATION_URL = (
 )
 REFERENCES_URL = (
     "https://api.semanticscholar.org/graph/v1/paper/{paper_id}/references?fields={"
-    "fields}&offset=0&limit=999 "
+    "fields}&offset={offset}&limit=999 "
 )
 PAPER_URL = "https://api.semanticscholar.org/v1/paper/{paper_id}"
 
@@ -24,107 +28,122 @@ FIELDS = [
     "abstract",
     "citations",
 ]
+# v1 fields that the graph API nests under externalIds
+EXTERNAL_IDS = {"doi": "DOI", "arxivId": "ArXiv"}
 
 
-def fetch_citations(paper_id, citation_url: str = CITATION_URL):
+def _fetch_listing(method: str, paper_id: str, count: int = None, **client_kwargs):
+    # client.py takes its url templates from this module, import it late
+    from .client import AsyncSemanticScholarClient
+
+    client = AsyncSemanticScholarClient(**client_kwargs)
+    try:
+        return asyncio.run(getattr(client, method)(paper_id, count=count))
+    finally:
+        client.close()
+
+
+@metrics.timed()
+def fetch_citations(
+    paper_id: str, citation_url: str = CITATION_URL, count: int = None, **client_kwargs
+):
     """
     Fetch the citations of a paper from semantic scholar
     using the unique paper id
     e.g bac31808aa57418e0cf11b6de088a30a30196caa
+    Pages go through `AsyncSemanticScholarClient` (cache, rate limit,
+    retries), returns None when the paper is missing or a page failed
     """
-    offset = 0
     assert isinstance(paper_id, str)
+    return _fetch_listing(
+        "fetch_citations", paper_id, count, citation_url=citation_url, **client_kwargs
+    )
 
-    citation_url = citation_url.replace("{paper_id}", paper_id)
-    citation_url = citation_url.replace("{fields}", ",".join(FIELDS))
-
-    citation_url_new = citation_url.replace("{offset}", str(offset))
-    r = requests.get(url=citation_url_new)
-    data = r.json()
-
-    citation_list = []
-    citation_list += [x["citingPaper"] for x in data["data"]]
-
-    data_len = len(data["data"])
 
-    while data_len >= 999:
-        offset += 999
-        citation_url_new = citation_url.replace("{offset}", str(offset))
-        r = requests.get(url=citation_url_new)
-        data = r.json()
-        citation_list += [x["citingPaper"] for x in data["data"]]
-        data_len = len(data["data"])
-
-    return citation_list
-
-
-def fetch_references(paper_id: str, references_url: str = REFERENCES_URL):
+@metrics.timed()
+def fetch_references(
+    paper_id: str, references_url: str = REFERENCES_URL, count: int = None, **client_kwargs
+):
     """
-    Fetch the citations of a paper from semantic scholar
+    Fetch the references of a paper from semantic scholar
      using the unique paper id
     e.g bac31808aa57418e0cf11b6de088a30a30196caa
+    Same client and None on failure as `fetch_citations`
     """
-    offset = 0
-    references_url = references_url.replace("{paper_id}", paper_id)
-    references_url = references_url.replace("{fields}", ",".join(FIELDS))
-
-    references_url_new = references_url.replace("{offset}", str(offset))
-    r = requests.get(url=references_url_new)
-    data = r.json()
-
-    ref_list = []
-    ref_list += [x["citedPaper"] for x in data["data"]]
-
-    data_len = len(data["data"])
-
-    while data_len >= 999:
-        offset += 999
-        references_url_new = references_url.replace("{offset}", str(offset))
-        r = requests.get(url=references_url_new)
-        data = r.json()
-        ref_list += [x["citedPaper"] for x in data["data"]]
-        data_len = len(data["data"])
-
-    return ref_list
+    return _fetch_listing(
+        "fetch_references", paper_id, count, references_url=references_url, **client_kwargs
+    )
 
 
+@metrics.timed(items=lambda result, *args, **kwargs: 1)
 def fetch_paper_metadata(
     paper_id: str,
     fields: list = FIELDS,
     paper_url: str = PAPER_URL,
     retry_iter: int = 3,
 ):
+    """
+    Fetch the metadata of a paper, returns None when the paper is missing
+    or the request keeps failing (see `get_policy().failures`)
+    """
     print(f"[INFO] paper id {paper_id}")
     paper_url = paper_url.replace("{paper_id}", paper_id)
 
+    result = fetch_with_retry(paper_url, max_retries=retry_iter)
+    data = result.data
+    if not result.ok or not isinstance(data, dict) or "error" in data:
+        return None
     try:
-        r = requests.get(url=paper_url)
-        data = r.json()
-        if not "error" in list(data.keys()):
-            metadata = [data[i] for i in fields]
-        else:
-            metadata = None
-    except KeyError as e:
-        iteration = retry_iter
-        metadata = None
-        while iteration != 0:
-            print("[ERROR] Timeout; Trying again")
-            iteration -= 1
-            time.sleep(300)
-            r = requests.get(url=paper_url)
-            data = r.json()
-            metadata = [data[i] for i in fields]
-
-    return metadata
+        return [data[i] for i in fields]
+    except KeyError:
+        return None
+
+
+def _graph_fields(fields: list) -> list:
+    """
+    v1 field names => graph API field names used by the batch endpoint
+    """
+    graph_fields = []
+    for f in fields:
+        f = "externalIds" if f in EXTERNAL_IDS else f
+        if f not in graph_fields:
+            graph_fields.append(f)
+    return graph_fields
+
+
+def _graph_to_metadata(paper: dict, fields: list) -> list:
+    external_ids = paper.get("externalIds") or {}
+    return [
+        external_ids.get(EXTERNAL_IDS[f]) if f in EXTERNAL_IDS else paper.get(f)
+        for f in fields
+    ]
+
+
+@metrics.timed()
+def fetch_paper_metadata_bulk(
+    paper_ids: list, fields: list = FIELDS, batch_size: int = BATCH_SIZE
+) -> Dict[str, list]:
+    """
+    Fetch the metadata of many papers with the graph API batch endpoint,
+    in the same field order as `fetch_paper_metadata`. Paper ids can be
+    Semantic Scholar ids, DOIs or arXiv ids; missing papers map to None.
+    """
+    papers = fetch_papers_batch(
+        paper_ids, fields=_graph_fields(fields), batch_size=batch_size
+    )
+    return {
+        pid: None if paper is None else _graph_to_metadata(paper, fields)
+        for pid, paper in papers.items()
+    }
 
 
 if __name__ == "__main__":
-    df = pd.read_csv("data/gwf_2019_peer_review_articles.csv").fillna(0)
+    df = pd.read_csv(in_root("data/gwf_2019_peer_review_articles.csv")).fillna(0)
     paper_list = [
         url.split("/")[-1] for url in list(df["semantic_scholar_url"]) if url != 0
     ]
 
-    nl_metadata = {lis: fetch_paper_metadata(lis, fields=FIELDS) for lis in paper_list}
+    nl_metadata = fetch_paper_metadata_bulk(paper_list, fields=FIELDS)
 
     with open("files/gwf_paper_metadata.json", "w") as outfile:
         json.dump(nl_metadata, outfile)
@@ -1,33 +1,66 @@
-import os
-from typing import List
-from helper import fetch_citations, fetch_references, fetch_paper_metadata
+from typing import Dict, Iterable, List
+from .helper import (
+    fetch_citations,
+    fetch_references,
+    fetch_paper_metadata,
+    fetch_paper_metadata_bulk,
+)
+from .client import fetch_paper_metadata_batch
 
 
 class GenerateMetadata:
     def __init__(self) -> None:
         pass
 
-    def fetch_citations(self, paper_id: str) -> List:
-        citation_list = fetch_citations(paper_id)
+    def fetch_citations(self, paper_id: str, count: int = None) -> List:
+        """
+        Citing papers, `count` (citationCount) lets the pages after the
+        first one be fetched concurrently
+        """
+        citation_list = fetch_citations(paper_id, count=count)
         if citation_list is None:
-            print("[INFO] Paper with paper id {paper_id} not found")
+            print(f"[INFO] Paper with paper id {paper_id} not found")
         else:
             return citation_list
 
-    def fetch_references(self, paper_id: str) -> List:
-        ref_list = fetch_references(paper_id)
+    def fetch_references(self, paper_id: str, count: int = None) -> List:
+        ref_list = fetch_references(paper_id, count=count)
         if ref_list is None:
-            print("[INFO] Paper with paper id {paper_id} not found")
+            print(f"[INFO] Paper with paper id {paper_id} not found")
         else:
             return ref_list
 
     def fetch_paper_metadata(self, paper_id: str) -> List:
         metadata = fetch_paper_metadata(paper_id)
         if metadata is None:
-            print("[INFO] Paper with paper id {paper_id} not found")
+            print(f"[INFO] Paper with paper id {paper_id} not found")
         else:
             return metadata
 
+    def fetch_paper_metadata_batch(
+        self,
+        paper_ids: Iterable[str],
+        max_in_flight: int = 8,
+        requests_per_second: float = 1.0,
+    ) -> Dict[str, List]:
+        """
+        Fetch metadata for a list of paper ids, keeping up to `max_in_flight`
+        requests outstanding under a `requests_per_second` budget.
+        Papers that could not be found map to None.
+        """
+        return fetch_paper_metadata_batch(
+            paper_ids,
+            max_in_flight=max_in_flight,
+            requests_per_second=requests_per_second,
+        )
+
+    def fetch_paper_metadata_bulk(self, paper_ids: Iterable[str]) -> Dict[str, List]:
+        """
+        Fetch metadata for a list of paper ids (or DOIs / arXiv ids) with
+        a few hundred ids per request through the batch endpoint.
+        """
+        return fetch_paper_metadata_bulk(list(paper_ids))
+
 
 if __name__ == "__main__":
     met_gen = GenerateMetadata()
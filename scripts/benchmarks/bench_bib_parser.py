@@ -0,0 +1,61 @@
+"""
+Compare the project BibTeX parser with pybtex and bibtexparser on the
+repo's .bib files.
+
+pybtex errors are captured, otherwise it stops at the first of our
+comma separated author lists. For each parser the best of `--repeat` runs
+is reported together with the number of entries it returned.
+
+python -m scripts.benchmarks.bench_bib_parser
+"""
+import time
+import argparse
+import bibtexparser
+import pybtex.errors
+from pybtex.database import parse_file
+from ..utils.bib_parser import load
+from ..utils.paths import in_root
+
+
+def pybtex_parse(path):
+    # collect the errors instead of raising (or printing) them
+    with pybtex.errors.capture():
+        return parse_file(path, bib_format="bibtex").entries
+
+
+def bibtexparser_parse(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return bibtexparser.load(file).entries
+
+
+PARSERS = {
+    "bib_parser": load,
+    "bib_parser+persons": lambda path: load(path, persons=True),
+    "pybtex": pybtex_parse,
+    "bibtexparser": bibtexparser_parse,
+}
+
+
+def run(path: str, repeat: int):
+    print(path)
+    for name, parse in PARSERS.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            entries = parse(path)
+            best = min(best, time.perf_counter() - start)
+        print(f"  {name:<20} {best * 1000:8.1f} ms   {len(entries)} entries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--bib",
+        nargs="+",
+        default=[in_root("data/publications_bibtex.bib"), in_root("data/new_publications_bibtex.bib")],
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for path in args.bib:
+        run(path, args.repeat)
@@ -0,0 +1,197 @@
+"""
+Throughput and peak memory of the CPU-bound pipeline stages, offline.
+
+Every stage runs on the repo's own data files and on copies inflated
+`--factors` times (the inputs are simply repeated). Time is the best of
+`--repeat` runs, peak memory is measured with tracemalloc in one extra
+run. Stages whose dependencies are not installed (nltk) are reported as
+skipped.
+
+With --save the results become the baselines, otherwise they are
+compared with them and the run exits with status 1 when a stage is more
+than `--threshold` slower, or uses that much more memory, than its
+baseline. Baselines only mean something on the machine they were
+recorded on, so they are not committed: they live in
+scripts/benchmarks/baselines.json (git-ignored), or in the file named by
+GWF_BENCH_BASELINES / --baselines.
+
+python -m scripts.benchmarks.bench_stages --save
+python -m scripts.benchmarks.bench_stages --factors 1 10 100
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from ..utils.bib_parser import loads
+from ..utils.bibtex_to_CORE import bibdicts_to_CORES
+from ..utils.doi import extract_doi_frame, ref_extract
+from ..utils.paths import in_root
+from ..utils.spreadsheet import detect_encoding
+
+BASELINE_PATH = os.environ.get("GWF_BENCH_BASELINES") or os.path.join(
+    os.path.dirname(__file__), "baselines.json"
+)
+ARTICLES_CSV = in_root("data/gwf_2019_peer_review_articles.csv")
+BIB_PATH = in_root("data/publications_bibtex.bib")
+REF_CSV = in_root("data/ref_data.csv")
+FACTORS = [1, 10, 100]
+THRESHOLD = 0.25
+
+
+def _citations() -> List[str]:
+    df = pd.read_csv(ARTICLES_CSV, encoding="iso8859_16").fillna("")
+    return df.iloc[:, 0].astype(str).tolist()
+
+
+def _bib_text() -> str:
+    with open(BIB_PATH, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def _reftexts() -> List[str]:
+    df = pd.read_csv(REF_CSV, encoding=detect_encoding(REF_CSV)).fillna("")
+    return df["text"].astype(str).tolist()
+
+
+def stage_extract_doi_frame(factor: int):
+    # the doi extraction of GenerateBibtex.fetch_semantic_scholar_url
+    citations = pd.Series(_citations() * factor)
+    return len(citations), lambda: extract_doi_frame(citations)
+
+
+def stage_ref_extract(factor: int):
+    reftexts = _reftexts() * factor
+    return len(reftexts), lambda: [ref_extract(r) for r in reftexts]
+
+
+def stage_bib_parse(factor: int):
+    text = _bib_text() * factor
+    count = len(loads(text))
+    return count, lambda: loads(text)
+
+
+def stage_bibdicts_to_CORES(factor: int):
+    bibdicts = loads(_bib_text(), persons=True, strip_braces=True) * factor
+    return len(bibdicts), lambda: bibdicts_to_CORES(bibdicts)
+
+
+def stage_search_query(factor: int):
+    # the query building of GenerateBibtex.utils.fetch_url_no_doi
+    from ..GenerateBibtex.utils import build_search_query, get_stopwords
+
+    stopwords = get_stopwords()
+    citations = [c.lower().strip() for c in _citations()] * factor
+    return len(citations), lambda: [build_search_query(c, stopwords) for c in citations]
+
+
+STAGES: Dict[str, Callable[[int], Tuple[int, Callable]]] = {
+    "extract_doi_frame": stage_extract_doi_frame,
+    "ref_extract": stage_ref_extract,
+    "bib_parse": stage_bib_parse,
+    "bibdicts_to_CORES": stage_bibdicts_to_CORES,
+    "search_query": stage_search_query,
+}
+
+
+def measure(fn: Callable, repeat: int) -> Tuple[float, float]:
+    """
+    (best time in seconds, peak traced memory in MB)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2 ** 20
+
+
+def run(stages: List[str], factors: List[int], repeat: int) -> Dict[str, dict]:
+    results = {}
+    for name in stages:
+        for factor in factors:
+            key = f"{name}@{factor}x"
+            try:
+                items, fn = STAGES[name](factor)
+            except ImportError as e:
+                print(f"  {key:<26} skipped ({e})")
+                break
+            seconds, peak_mb = measure(fn, repeat)
+            results[key] = {
+                "items": items,
+                "seconds": round(seconds, 6),
+                "items_per_s": round(items / seconds, 1),
+                "peak_mb": round(peak_mb, 2),
+            }
+            print(
+                f"  {key:<26} {items:>8} items {seconds * 1000:10.1f} ms "
+                f"{items / seconds:12.0f} items/s {peak_mb:9.1f} MB"
+            )
+    return results
+
+
+def compare(results: Dict[str, dict], baselines: Dict[str, dict], threshold: float) -> List[str]:
+    """
+    Descriptions of the stages that regressed beyond `threshold`
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baselines.get(key)
+        if base is None:
+            continue
+        if result["items_per_s"] < base["items_per_s"] * (1 - threshold):
+            regressions.append(
+                f"{key}: {result['items_per_s']:.0f} items/s, baseline {base['items_per_s']:.0f}"
+            )
+        # tiny allocations are noise
+        if result["peak_mb"] > max(base["peak_mb"] * (1 + threshold), base["peak_mb"] + 1):
+            regressions.append(
+                f"{key}: peak {result['peak_mb']:.1f} MB, baseline {base['peak_mb']:.1f} MB"
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--factors", nargs="+", type=int, default=FACTORS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--baselines", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="store the results as baselines")
+    args = parser.parse_args()
+
+    print(f"[INFO] python {platform.python_version()} on {platform.machine()}")
+    results = run(args.stages, args.factors, args.repeat)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, "r", encoding="utf-8") as file:
+            baselines = json.load(file)
+
+    if args.save:
+        baselines.update(results)
+        with open(args.baselines, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=1, sort_keys=True)
+        print(f"[INFO] {len(results)} baselines saved to {args.baselines}")
+        sys.exit(0)
+
+    regressions = compare(results, baselines, args.threshold)
+    for regression in regressions:
+        print(f"[ERROR] regression {regression}")
+    if not baselines:
+        print(f"[INFO] no baselines in {args.baselines}, record them with --save")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,121 @@
+"""
+Compare title scorers for ranking search candidates against a citation.
+
+Ground truth comes from the repo's own data: every row of
+data/gwf_2019_peer_review_articles.csv whose semantic_scholar_url is also
+the url of an entry in data/publications_bibtex.bib is paired with that
+entry's title. For each citation the candidates are the true title plus
+the 49 other titles sharing the most tokens with it (hard negatives), just
+like a page of 50 search hits, in a random order (fixed by --seed). The
+.bib holds some papers twice with trivially different titles ("{CanRCM}4"
+and "CanRCM4"), titles normalizing to the true one are not negatives.
+
+The raw scores count a citation as correct only when the true title
+scores strictly higher than every other candidate, a tie is a miss. The
+TitleScorer methods are also ranked with TitleScorer.best, which breaks
+ties, to measure what fetch_url_no_doi actually picks. Most of the
+remaining top-1 misses are rows whose semantic_scholar_url points at a
+different paper than the citation.
+
+python -m scripts.benchmarks.bench_title_scoring
+"""
+import time
+import random
+import difflib
+import argparse
+import bibtexparser
+import pandas as pd
+from ..utils.paths import in_root
+from ..utils.spreadsheet import detect_encoding
+from ..utils.title_scoring import SCORERS, TitleScorer, normalize_title, title_tokens
+
+
+def load_cases(csv_path: str, bib_path: str, n_candidates: int = 50, seed: int = 0):
+    with open(bib_path, "r", encoding="utf-8") as file:
+        entries = bibtexparser.load(file).entries
+    titles = [e["title"] for e in entries]
+    url_to_title = {e.get("url", ""): e["title"] for e in entries}
+    token_sets = [set(title_tokens(t)) for t in titles]
+    normalized = [normalize_title(t) for t in titles]
+
+    df = pd.read_csv(csv_path, encoding=detect_encoding(csv_path)).fillna("")
+    rng = random.Random(seed)
+    cases = []
+    for citation, url in zip(df.iloc[:, 0], df["semantic_scholar_url"]):
+        if url not in url_to_title:
+            continue
+        truth = url_to_title[url]
+        truth_key = normalize_title(truth)
+        tokens = set(title_tokens(citation))
+        negatives = sorted(
+            (t for t, ts, key in zip(titles, token_sets, normalized) if key != truth_key),
+            key=lambda t: -len(set(title_tokens(t)) & tokens),
+        )[: n_candidates - 1]
+        candidates = [truth] + negatives
+        rng.shuffle(candidates)
+        cases.append((citation, candidates, candidates.index(truth)))
+    return cases
+
+
+def run(cases, name: str, score_fn):
+    """
+    Top-1 accuracy of raw scores, a tie with the true title is a miss
+    """
+    correct = ties = 0
+    start = time.perf_counter()
+    for citation, candidates, truth in cases:
+        scores = score_fn(citation, candidates)
+        other = max(s for i, s in enumerate(scores) if i != truth)
+        correct += scores[truth] > other
+        ties += scores[truth] == other
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<16} top-1 accuracy {correct / len(cases):6.1%}   "
+        f"{elapsed / len(cases) * 1000:8.2f} ms / citation   {ties} ties"
+    )
+
+
+def run_best(cases, method: str):
+    """
+    Top-1 accuracy of TitleScorer.best, ties broken as in production
+    """
+    correct = 0
+    start = time.perf_counter()
+    for citation, candidates, truth in cases:
+        best, _ = TitleScorer(citation, method=method).best(candidates)
+        correct += best == truth
+    elapsed = time.perf_counter() - start
+    label = f"{method} (best)"
+    print(
+        f"{label:<16} top-1 accuracy {correct / len(cases):6.1%}   "
+        f"{elapsed / len(cases) * 1000:8.2f} ms / citation"
+    )
+
+
+def difflib_scores(citation, candidates):
+    return [difflib.SequenceMatcher(None, t, citation).ratio() for t in candidates]
+
+
+def scorer_scores(method):
+    def score_fn(citation, candidates):
+        scorer = TitleScorer(citation, method=method)
+        return [scorer.score(t) for t in candidates]
+
+    return score_fn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default=in_root("data/gwf_2019_peer_review_articles.csv"))
+    parser.add_argument("--bib", default=in_root("data/publications_bibtex.bib"))
+    parser.add_argument("--seed", type=int, default=0, help="candidate order")
+    args = parser.parse_args()
+
+    cases = load_cases(args.csv, args.bib, seed=args.seed)
+    print(f"{len(cases)} citations with a known title, 50 candidates each\n")
+    run(cases, "difflib", difflib_scores)
+    for method in SCORERS:
+        run(cases, method, scorer_scores(method))
+    print()
+    for method in SCORERS:
+        run_best(cases, method)
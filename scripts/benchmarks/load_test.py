@@ -0,0 +1,217 @@
+"""
+Load test of the network stages against the local mock server.
+
+The mock (scripts/benchmarks/mock_server.py) is started in-process with
+the requested latency distribution and 429 rate, the response cache is
+bypassed and the shared retry policy gets a short backoff. Every stage
+is then run over the mock's papers with its production code path:
+
+    paper_metadata  AsyncSemanticScholarClient.fetch_paper_metadata
+    citations       AsyncSemanticScholarClient.fetch_citations (paginated)
+    doi_url         GenerateBibtex.utils.get_url_from_doi
+    search          GenerateBibtex.utils.fetch_url_no_doi (needs nltk)
+    bibtex          scripts.utils.bibtex_fetch.fetch_bibtex
+    end_to_end      GenerateBibtex: spreadsheet => urls => bib (api mode)
+
+For each stage the papers/s, the latency percentiles per paper (retries
+included), the requests and 429s seen by the server and the failed
+requests are reported. The latency of a paper in end_to_end is the time
+from the start of the run until its entry is in the journal, papers
+without an entry count as failed at the end of the run.
+
+python -m scripts.benchmarks.load_test --latency lognormal:0.05,0.5 --rate-429 0.05 --workers 16
+"""
+import io
+import os
+import sys
+import time
+import yaml
+import asyncio
+import argparse
+import contextlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..utils import http_cache, retry
+from ..utils.bibtex_fetch import fetch_bibtex
+from .mock_server import MockData, MockServer
+
+STAGES = ["paper_metadata", "citations", "doi_url", "search", "bibtex", "end_to_end"]
+
+
+def _threaded(fn: Callable, items: List, workers: int) -> List[Tuple[float, bool]]:
+    def timed(item):
+        start = time.perf_counter()
+        ok = fn(item)
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(timed, items))
+
+
+def _async(client, method: str, items: List) -> List[Tuple[float, bool]]:
+    async def timed(item):
+        start = time.perf_counter()
+        result = await getattr(client, method)(item)
+        return time.perf_counter() - start, result is not None
+
+    async def run():
+        return await asyncio.gather(*[timed(item) for item in items])
+
+    try:
+        return asyncio.run(run())
+    finally:
+        client.close()
+
+
+def _end_to_end(server: MockServer, dois: List[str]) -> List[Tuple[float, bool]]:
+    from ..GenerateBibtex.bib_gen import GenerateBibtex
+    from ..GenerateBibtex.checkpoint import RunJournal
+
+    data = server.data
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "config.yaml")
+        with open(config_path, "w") as file:
+            yaml.safe_dump(
+                {
+                    "paper_url": server.url + "/v1/paper/",
+                    "search_url": server.url + "/graph/v1/paper/search?",
+                    "batch_url": server.url + "/graph/v1/paper/batch",
+                    "doi_url": server.url + "/",
+                },
+                file,
+            )
+        articles = os.path.join(tmp, "articles.csv")
+        citations = [f"{data.papers[data.by_doi[doi]]['title']}. doi:{doi}" for doi in dois]
+        pd.DataFrame({"publication": citations}).to_csv(articles, index=False)
+
+        urls, bib = os.path.join(tmp, "urls.csv"), os.path.join(tmp, "publications.bib")
+        start = time.time()
+        generator = GenerateBibtex(config_path)
+        generator.fetch_semantic_scholar_url(articles, urls)
+        generator.generate_bib(bib, input_file=urls)
+        end = time.time()
+
+        journal = RunJournal(bib + ".journal.jsonl")
+        timings = []
+        for url in generator.url_list:
+            record = journal.records.get(url) if url else None
+            if record is None:
+                timings.append((end - start, False))
+            else:
+                timings.append((record["time"] - start, record["status"] == "ok"))
+        return timings
+
+
+def run_stage(name: str, server: MockServer, args) -> List[Tuple[float, bool]]:
+    data = server.data
+    paper_ids = data.ids[: args.papers]
+    dois = list(data.by_doi)[: args.papers]
+
+    if name in ("paper_metadata", "citations"):
+        from ..GenerateMetadata.client import AsyncSemanticScholarClient
+
+        client = AsyncSemanticScholarClient(
+            max_in_flight=args.workers,
+            requests_per_second=args.rps,
+            paper_url=server.url + "/v1/paper/{paper_id}",
+            citation_url=server.url
+            + "/graph/v1/paper/{paper_id}/citations?fields={fields}&offset={offset}&limit=999",
+            policy=retry.get_policy(),
+        )
+        method = "fetch_paper_metadata" if name == "paper_metadata" else "fetch_citations"
+        return _async(client, method, paper_ids)
+
+    if name == "doi_url":
+        from ..GenerateBibtex.utils import get_url_from_doi
+
+        config = {"paper_url": server.url + "/v1/paper/"}
+        return _threaded(
+            lambda doi: get_url_from_doi(doi, config) is not None, dois, args.workers
+        )
+
+    if name == "search":
+        from ..GenerateBibtex.utils import fetch_url_no_doi, get_stopwords
+
+        get_stopwords()
+        titles = [data.papers[p]["title"].lower() for p in paper_ids]
+        return _threaded(
+            lambda title: fetch_url_no_doi(
+                title,
+                paper_url=server.url + "/v1/paper/",
+                search_url=server.url + "/graph/v1/paper/search?",
+            )
+            is not None,
+            titles,
+            args.workers,
+        )
+
+    if name == "bibtex":
+        return _threaded(
+            lambda doi: fetch_bibtex(doi, base_url=server.url + "/").ok, dois, args.workers
+        )
+    if name == "end_to_end":
+        return _end_to_end(server, dois)
+    raise ValueError(f"[ERROR] unknown stage {name}")
+
+
+def report(name: str, timings: List[Tuple[float, bool]], seconds: float, before: dict, after: dict, failures: int):
+    latency = np.array([t for t, _ in timings]) * 1000
+    ok = sum(ok for _, ok in timings)
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99]) if len(latency) else (0, 0, 0)
+    requests = after.get("requests", 0) - before.get("requests", 0)
+    throttled = after.get("429", 0) - before.get("429", 0)
+    print(
+        f"  {name:<15} {len(timings):>5} papers ({ok} ok) {len(timings) / seconds:8.1f} papers/s   "
+        f"p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  max {latency.max(initial=0):7.1f} ms   "
+        f"{requests} requests, {throttled} x 429, {failures} failed"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--papers", type=int, default=None, help="papers per stage, all by default")
+    parser.add_argument("--workers", type=int, default=16, help="threads / requests in flight")
+    parser.add_argument("--rps", type=float, default=100.0, help="token bucket of the async client")
+    parser.add_argument("--latency", default="lognormal:0.05,0.5")
+    parser.add_argument("--rate-429", type=float, default=0.05)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--base-delay", type=float, default=0.05, help="retry backoff base")
+    parser.add_argument("--recordings", default=None, help="HTTP response cache to replay")
+    parser.add_argument("--verbose", action="store_true", help="keep the output of the stages")
+    args = parser.parse_args()
+
+    http_cache.configure(bypass=True)
+    server = MockServer(
+        MockData(recordings=args.recordings),
+        latency=args.latency,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+    )
+    print(
+        f"[INFO] {len(server.data.papers)} papers on {server.url}, latency {args.latency}, "
+        f"429 rate {args.rate_429}, {args.workers} workers"
+    )
+    with server:
+        for name in args.stages:
+            policy = retry.configure_policy(
+                base_delay=args.base_delay,
+                max_delay=2.0,
+                budget=retry.RetryBudget(max_retries=10 ** 6),
+            )
+            before = server.snapshot()
+            output = None if args.verbose else io.StringIO()
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(output or sys.stdout):
+                    timings = run_stage(name, server, args)
+            except ImportError as e:
+                print(f"  {name:<15} skipped ({e})")
+                continue
+            seconds = time.perf_counter() - start
+            report(name, timings, seconds, before, server.snapshot(), len(policy.failures))
@@ -0,0 +1,456 @@
+"""
+Local stand-in for the Semantic Scholar API and doi.org, to exercise the
+fetch paths offline with reproducible latency and failures.
+
+Endpoints (same paths as the real services):
+
+    GET  /v1/paper/{paper id or doi}
+    GET  /graph/v1/paper/search?query=...&offset=...&limit=...
+    GET  /graph/v1/paper/{paper id}/citations?offset=...&limit=...
+    GET  /graph/v1/paper/{paper id}/references?offset=...&limit=...
+    POST /graph/v1/paper/batch
+    GET  /{doi} with "Accept: application/x-bibtex" (doi.org)
+    GET  /__stats
+
+Responses recorded in the HTTP response cache (`--recordings
+.http_cache.sqlite`) are replayed as they are. Everything else is made up
+from the papers of the repo's .bib files: every paper gets a seeded
+number of synthetic citing papers, and one paper in `big_every` gets
+`big_count` of them so the listings paginate past 999 items.
+
+Every request waits for a delay drawn from `latency`
+("fixed:0.02", "uniform:0.01,0.1", "exponential:0.05" or
+"lognormal:0.05,0.5" = median, sigma) and is answered 429 with a
+Retry-After header with probability `rate_429`.
+
+python -m scripts.benchmarks.mock_server --port 8765 --latency lognormal:0.05,0.5 --rate-429 0.05
+"""
+import re
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+from ..utils.bib_parser import iter_entries
+from ..utils.doi import normalize_doi
+from ..utils.paths import in_root
+from ..utils.title_scoring import title_tokens
+
+BIB_PATHS = [in_root("data/publications_bibtex.bib"), in_root("data/new_publications_bibtex.bib")]
+PAGE_LIMIT = 999
+MEAN_CITATIONS = 20
+BIG_EVERY = 50
+BIG_COUNT = 2500
+REFERENCES = 15
+
+_S2_ID = re.compile(r"semanticscholar\.org/paper/(?:.*/)?([0-9a-f]{40})")
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Delay sampler of a "distribution:arguments" spec, see the module docstring
+    """
+    if not spec or spec == "none":
+        return lambda rng: 0.0
+    name, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if name == "fixed":
+        return lambda rng: values[0]
+    if name == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == "exponential":
+        return lambda rng: rng.expovariate(1 / values[0])
+    if name == "lognormal":
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0, sigma)
+    raise ValueError(f"[ERROR] unknown latency distribution {spec}")
+
+
+def _paper_id(*parts) -> str:
+    return hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()
+
+
+class MockData:
+    """
+    Papers served by the mock, keyed by Semantic Scholar id, plus the
+    recorded responses keyed by path and query
+    """
+
+    def __init__(
+        self,
+        bib_paths: List[str] = BIB_PATHS,
+        recordings: str = None,
+        mean_citations: int = MEAN_CITATIONS,
+        big_every: int = BIG_EVERY,
+        big_count: int = BIG_COUNT,
+        seed: int = 0,
+    ):
+        self.papers: Dict[str, dict] = {}
+        self.by_doi: Dict[str, str] = {}
+        self.bibtex: Dict[str, str] = {}
+        self.citation_count: Dict[str, int] = {}
+        self.recorded: Dict[str, Tuple[int, dict, bytes]] = {}
+        self.synthetic: Dict[str, dict] = {}
+        self._citing_cache: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+        for path in bib_paths:
+            for entry in iter_entries(path, strip_braces=True):
+                self._add_entry(entry)
+        rng = random.Random(seed)
+        for i, paper_id in enumerate(self.papers):
+            big = big_every and i % big_every == 0
+            self.citation_count[paper_id] = (
+                big_count if big else int(rng.expovariate(1 / mean_citations))
+            )
+        self.ids = list(self.papers)
+        if recordings:
+            self._load_recordings(recordings)
+
+    def _add_entry(self, entry: dict):
+        url = entry.get("url", "")
+        match = _S2_ID.search(url)
+        doi = normalize_doi(entry.get("doi", ""))
+        paper_id = match.group(1) if match else _paper_id(doi or entry.get("title", ""))
+        if paper_id in self.papers:
+            return
+        self.papers[paper_id] = {
+            "paperId": paper_id,
+            "title": entry.get("title", ""),
+            "year": int(entry["year"]) if entry.get("year", "").isdigit() else None,
+            "venue": entry.get("journal", ""),
+            "abstract": entry.get("abstract"),
+            "doi": doi or None,
+            "authors": [
+                {"name": name.strip()}
+                for name in re.split(r",| and ", entry.get("author", ""))
+                if name.strip()
+            ],
+        }
+        if doi:
+            self.by_doi[doi] = paper_id
+            fields = ",\n".join(
+                f"  {k} = {{{v}}}" for k, v in entry.items() if k not in ("ENTRYTYPE", "ID")
+            )
+            self.bibtex[doi] = f"@{entry['ENTRYTYPE']}{{{entry['ID']},\n{fields}\n}}"
+
+    def _load_recordings(self, path: str):
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute("SELECT url, status, headers, body FROM responses").fetchall()
+        finally:
+            conn.close()
+        for url, status, headers, body in rows:
+            body = bytes(body)
+            if body.lstrip().startswith(b"@"):
+                # doi.org redirects, the recorded url is the publisher's
+                found = re.search(rb"doi\s*=\s*[{\"]([^}\"]+)", body, re.IGNORECASE)
+                if found:
+                    key = "/" + normalize_doi(found.group(1).decode("utf-8", "replace"))
+                    self.recorded[key] = (status, json.loads(headers), body)
+                continue
+            parsed = urlparse(url)
+            key = parsed.path + ("?" + parsed.query if parsed.query else "")
+            self.recorded[key] = (status, json.loads(headers), body)
+        print(f"[INFO] {len(self.recorded)} recorded responses loaded from {path}")
+
+    def paper(self, identifier: str) -> Optional[dict]:
+        identifier = unquote(identifier)
+        if identifier.upper().startswith("DOI:"):
+            identifier = identifier[4:]
+        if identifier in self.papers:
+            return self.papers[identifier]
+        doi = normalize_doi(identifier)
+        if doi in self.by_doi:
+            return self.papers[self.by_doi[doi]]
+        return self.synthetic.get(identifier)
+
+    def citing(self, paper_id: str) -> List[dict]:
+        with self._lock:
+            if paper_id not in self._citing_cache:
+                rng = random.Random(paper_id)
+                year = self.papers[paper_id].get("year") or 2015
+                self._citing_cache[paper_id] = [
+                    {
+                        "paperId": _paper_id(paper_id, "citation", k),
+                        "title": f"Synthetic paper {k} citing {paper_id[:8]}",
+                        "year": year + rng.randint(0, 4),
+                        "citationCount": rng.randint(0, 30),
+                        "referenceCount": rng.randint(10, 60),
+                    }
+                    for k in range(self.citation_count[paper_id])
+                ]
+                for paper in self._citing_cache[paper_id]:
+                    self.synthetic[paper["paperId"]] = paper
+            return self._citing_cache[paper_id]
+
+    def references(self, paper_id: str) -> List[dict]:
+        rng = random.Random(paper_id + "references")
+        return [
+            self.graph_paper(other)
+            for other in rng.sample(self.ids, min(REFERENCES, len(self.ids)))
+            if other != paper_id
+        ]
+
+    def graph_paper(self, paper_id: str) -> dict:
+        paper = self.papers[paper_id]
+        return {
+            "paperId": paper_id,
+            "title": paper["title"],
+            "year": paper["year"],
+            "url": f"https://www.semanticscholar.org/paper/{paper_id}",
+            "externalIds": {"DOI": paper["doi"]} if paper["doi"] else {},
+            "citationCount": self.citation_count[paper_id],
+            "referenceCount": REFERENCES,
+        }
+
+    def v1_paper(self, paper: dict) -> dict:
+        paper_id = paper["paperId"]
+        return {
+            "paperId": paper_id,
+            "title": paper["title"],
+            "year": paper.get("year"),
+            "venue": paper.get("venue", ""),
+            "abstract": paper.get("abstract"),
+            "authors": paper.get("authors", []),
+            "doi": paper.get("doi"),
+            "arxivId": None,
+            "url": f"https://www.semanticscholar.org/paper/{paper_id}",
+            "citations": [],
+        }
+
+    def search(self, query: str) -> List[dict]:
+        tokens = set(title_tokens(query.replace("+", " ")))
+        scored = []
+        for paper_id, paper in self.papers.items():
+            shared = len(tokens & set(title_tokens(paper["title"])))
+            if shared:
+                scored.append((-shared, paper_id))
+        scored.sort()
+        return [{"paperId": p, "title": self.papers[p]["title"]} for _, p in scored]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "MockServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body, content_type: str = "application/json", headers: dict = None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method: str):
+        mock = self.server
+        parsed = urlparse(self.path)
+        if parsed.path == "/__stats":
+            return self._send(200, mock.snapshot())
+
+        endpoint = mock.endpoint(method, parsed.path)
+        delay, throttled = mock.draw()
+        time.sleep(delay)
+        mock.count(endpoint, throttled)
+        if throttled:
+            return self._send(
+                429, {"message": "Too Many Requests"}, headers={"Retry-After": str(mock.retry_after)}
+            )
+
+        recorded = mock.data.recorded.get(self.path) if method == "GET" else None
+        if recorded is None and endpoint == "bibtex":
+            recorded = mock.data.recorded.get("/" + normalize_doi(unquote(parsed.path[1:])))
+        if recorded is not None:
+            status, headers, body = recorded
+            return self._send(status, body, headers.get("Content-Type", "application/json"))
+
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null") if length else None
+        status, payload, content_type = mock.respond(endpoint, parsed.path, query, body)
+        self._send(status, payload, content_type)
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Threaded mock server, `start()` serves it from a background thread so
+    it can run in the same process as the code under test
+
+    Args:
+    port: 0 picks a free port
+    latency: delay distribution spec, see `parse_latency`
+    rate_429: probability of answering 429 instead
+    retry_after: Retry-After seconds sent with the 429s
+    """
+
+    daemon_threads = True
+    # the default backlog of 5 drops concurrent connects, which then wait
+    # for a SYN retransmit and show up as one second tail latency
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        data: MockData = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: str = "none",
+        rate_429: float = 0.0,
+        retry_after: float = 0.1,
+        seed: int = 0,
+    ):
+        super().__init__((host, port), _Handler)
+        self.data = data or MockData()
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw(self) -> Tuple[float, bool]:
+        with self._lock:
+            return self.latency(self._rng), self._rng.random() < self.rate_429
+
+    def count(self, endpoint: str, throttled: bool):
+        with self._lock:
+            self.stats[endpoint] += 1
+            self.stats["requests"] += 1
+            if throttled:
+                self.stats["429"] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+    @staticmethod
+    def endpoint(method: str, path: str) -> str:
+        if path.startswith("/v1/paper/"):
+            return "paper"
+        if path == "/graph/v1/paper/search":
+            return "search"
+        if path == "/graph/v1/paper/batch" and method == "POST":
+            return "batch"
+        if path.startswith("/graph/v1/paper/") and path.endswith("/citations"):
+            return "citations"
+        if path.startswith("/graph/v1/paper/") and path.endswith("/references"):
+            return "references"
+        if path.startswith("/graph/v1/paper/"):
+            return "graph_paper"
+        if path.startswith("/10."):
+            return "bibtex"
+        return "unknown"
+
+    def respond(self, endpoint: str, path: str, query: dict, body) -> Tuple[int, object, str]:
+        data = self.data
+        not_found = (404, {"error": "Paper not found"}, "application/json")
+        if endpoint == "paper":
+            paper = data.paper(path[len("/v1/paper/") :])
+            return (200, data.v1_paper(paper), "application/json") if paper else not_found
+        if endpoint == "graph_paper":
+            paper = data.paper(path[len("/graph/v1/paper/") :])
+            if paper is None:
+                return not_found
+            if paper["paperId"] in data.papers:
+                return 200, data.graph_paper(paper["paperId"]), "application/json"
+            return 200, paper, "application/json"
+        if endpoint == "batch":
+            papers = [data.paper(i) for i in (body or {}).get("ids", [])]
+            return (
+                200,
+                [data.graph_paper(p["paperId"]) if p and p["paperId"] in data.papers else p for p in papers],
+                "application/json",
+            )
+        if endpoint == "search":
+            hits = data.search(query.get("query", ""))
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 10))
+            return (
+                200,
+                {"total": len(hits), "offset": offset, "data": hits[offset : offset + limit]},
+                "application/json",
+            )
+        if endpoint in ("citations", "references"):
+            paper = data.paper(path.split("/")[4])
+            if paper is None or paper["paperId"] not in data.papers:
+                return not_found
+            paper_id = paper["paperId"]
+            if endpoint == "citations":
+                items = [{"citingPaper": p} for p in data.citing(paper_id)]
+            else:
+                items = [{"citedPaper": p} for p in data.references(paper_id)]
+            offset = int(query.get("offset", 0))
+            limit = min(int(query.get("limit", 100)), PAGE_LIMIT + 1)
+            page = {"offset": offset, "data": items[offset : offset + limit]}
+            if offset + limit < len(items):
+                page["next"] = offset + limit
+            return 200, page, "application/json"
+        if endpoint == "bibtex":
+            doi = normalize_doi(unquote(path[1:]))
+            if doi in data.bibtex:
+                return 200, data.bibtex[doi].encode(), "application/x-bibtex; charset=utf-8"
+            return 404, b"DOI Not Found", "text/html"
+        return 404, {"error": "unknown endpoint"}, "application/json"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="none")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--recordings", default=None, help="HTTP response cache to replay")
+    parser.add_argument("--big-every", type=int, default=BIG_EVERY)
+    parser.add_argument("--big-count", type=int, default=BIG_COUNT)
+    args = parser.parse_args()
+
+    data = MockData(recordings=args.recordings, big_every=args.big_every, big_count=args.big_count)
+    server = MockServer(
+        data,
+        port=args.port,
+        latency=args.latency,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+    )
+    print(f"[INFO] {len(data.papers)} papers served on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,380 @@
+"""
+Canonical author ids for the names found in the bib files, the GWF
+publication spreadsheet and the Semantic Scholar metadata.
+
+The same person shows up as "Pomeroy, J.W." (spreadsheet), "John W.
+Pomeroy" and "J. Pomeroy" (bib files). Names are parsed once (memoized)
+into surname, first name and initials, and only variants sharing a block
+(surname + first initial) are compared, so clustering stays linear in the
+number of names. Within a block a variant joins the author whose first
+names and initials it agrees with ("J. Pomeroy" joins "John W. Pomeroy",
+"James K. Pomeroy" does not), names sharing a Semantic Scholar author id
+always join.
+
+The table is kept in data/authors.json so the graph and stats builds only
+have to resolve the names they have not seen before:
+
+    {"version", "authors": {id: {"name", "variants": {name: count}, "s2_ids"}}}
+
+python -m scripts.utils.authors data/publications_bibtex.bib data/new_publications_bibtex.bib data/gwf_2019_peer_review_articles.csv
+"""
+import os
+import re
+import json
+import argparse
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from .bib_parser import iter_entries, split_persons
+from .build_corpus import decode_latex
+from .paths import in_root
+
+AUTHORS_PATH = in_root("data/authors.json")
+TABLE_VERSION = 1
+NAME_CACHE_SIZE = 1 << 18
+PARTICLES = {"van", "von", "de", "der", "den", "da", "del", "della", "di", "du", "la", "le", "dos", "st"}
+
+_YEAR = re.compile(r"\(\s*(?:19|20)\d\d[a-z]?\s*\)|[,\s](?:19|20)\d\d[a-z]?\s*[:.]")
+_INITIALS = re.compile(r"^(?:[A-Z]\.?\s*-?\s*){1,4}$")
+_LABEL = re.compile(r"^\W*[A-Z]?\d+\.\s+")
+_FULL_NAME = re.compile(r"^[A-Z][\w'\-]*(?:\s+[A-Z][\w'\-.]*){1,3}$")
+_NOT_LETTER = re.compile(r"[^a-z\s\-']")
+
+
+class Name(NamedTuple):
+    last: str
+    first: str
+    initials: str
+
+    @property
+    def block(self) -> Tuple[str, str]:
+        return self.last, self.initials[:1]
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return _NOT_LETTER.sub("", text.lower())
+
+
+def _is_initials(token: str) -> bool:
+    return "." in token or (token.isupper() and len(token) <= 3)
+
+
+def _given(tokens: List[str]) -> Tuple[str, str]:
+    """
+    First name (empty if only initials are given) and initials of the
+    given name tokens, "Karl-Erich" => ("karl-erich", "ke")
+    """
+    first, initials = "", ""
+    for token in tokens:
+        if _is_initials(token):
+            initials += "".join(c for c in _fold(token) if c.isalpha())
+            continue
+        parts = [p for p in _fold(token).split("-") if p]
+        if not first and not initials and parts:
+            first = "-".join(parts)
+        initials += "".join(p[0] for p in parts)
+    return first, initials
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def parse_name(name: str) -> Name:
+    """
+    "Pomeroy, J.W.", "John W. Pomeroy", "Pomeroy JW" => Name("pomeroy", ...)
+    """
+    name = " ".join(name.replace("{", "").replace("}", "").split())
+    if "," in name:
+        last, _, given = name.partition(",")
+        last_tokens, given_tokens = last.split(), given.replace(".", ". ").split()
+    else:
+        tokens = name.replace(".", ". ").split()
+        if len(tokens) > 1 and _is_initials(tokens[-1]) and not _is_initials(tokens[0]):
+            # citation style "Liu J."
+            split = next(i for i in range(1, len(tokens)) if _is_initials(tokens[i]))
+            last_tokens, given_tokens = tokens[:split], tokens[split:]
+        else:
+            split = len(tokens) - 1
+            while split > 1 and tokens[split - 1].lower() in PARTICLES:
+                split -= 1
+            last_tokens, given_tokens = tokens[split:], tokens[:split]
+    first, initials = _given(given_tokens)
+    last = " ".join(t for t in (_fold(t) for t in last_tokens) if t)
+    return Name(last, first, initials)
+
+
+def split_authors(value: str) -> List[str]:
+    """
+    Names of a bib author field as "First Last", the field may list them
+    separated by "and"s or by commas (see split_persons)
+    """
+    result = []
+    for name in split_persons(value):
+        if "," in name:
+            last, _, first = name.partition(",")
+            name = first.strip() + " " + last.strip()
+        name = " ".join(decode_latex(name).split())
+        if name:
+            result.append(name)
+    return result
+
+
+def _looks_like_name(piece: str) -> bool:
+    tokens = piece.split()
+    return (
+        0 < len(tokens) <= 5
+        and not re.search(r"\d", piece)
+        and all(
+            t.split("-")[0].lower() in PARTICLES or t.lstrip(".'")[:1].isupper() for t in tokens
+        )
+    )
+
+
+def split_citation_authors(citation: str) -> List[str]:
+    """
+    Authors of a spreadsheet citation, "Alcon, F., Brouwer, R. and
+    de-Miguel, M.D. (2019). Title..." => ["Alcon, F.", "Brouwer, R.",
+    "de-Miguel, M.D."]. Rows also come as "F. Last, F. Last, Title, ..." or
+    "First Last, First Last, 2019: Title", the names end at the first piece
+    that is not a name in the style of the first one.
+    """
+    match = _YEAR.search(citation)
+    text = citation[: match.start()] if match else citation
+    text = _LABEL.sub("", text.replace("*", ""))
+    pieces = [p.strip() for p in re.split(r",|\s+and\s+|\s*&\s*|^and\s+", text)]
+    pieces = [p for p in pieces if p]
+    full_names = bool(pieces) and bool(_FULL_NAME.match(pieces[0])) and not any(
+        _is_initials(token) for token in pieces[0].split()
+    ) and not (len(pieces) > 1 and _INITIALS.match(pieces[1]))
+    names, i = [], 0
+    while i < len(pieces):
+        # the last name can run into the title, "Carl Gutwin. Tracing ..."
+        piece = re.split(r"(?<=\w\w)\.(?:\s|$)", pieces[i], maxsplit=1)[0]
+        following = pieces[i + 1] if i + 1 < len(pieces) else ""
+        if not _looks_like_name(piece):
+            break
+        has_initials = any(_is_initials(token) for token in piece.split())
+        if piece == pieces[i] and not full_names and _INITIALS.match(following):
+            names.append(piece + ", " + following)
+            i += 2
+            continue
+        if not (has_initials or (full_names and _FULL_NAME.match(piece))):
+            break
+        names.append(piece)
+        if piece != pieces[i] and not pieces[i].endswith("."):
+            break
+        i += 1
+    return names
+
+
+def _compatible(name: Name, firsts: set, initials: str) -> bool:
+    if name.first and firsts and name.first not in firsts:
+        return False
+    return initials.startswith(name.initials) or name.initials.startswith(initials)
+
+
+class AuthorIndex:
+    """
+    Canonical author ids of name variants.
+
+    Names are collected with `add` and clustered by `resolve`, `canonical`
+    looks one name up (resolving it first if it is new).
+    """
+
+    def __init__(self):
+        self.authors: Dict[str, dict] = {}
+        self.variants: Dict[str, str] = {}
+        self._blocks: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        self._s2: Dict[str, str] = {}
+        # first names and longest initials of every author
+        self._profiles: Dict[str, Tuple[set, str]] = {}
+        self._pending: Counter = Counter()
+        self._pending_s2: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: str = AUTHORS_PATH) -> "AuthorIndex":
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        with open(path, "r", encoding="utf-8") as file:
+            table = json.load(file)
+        for author_id, author in table["authors"].items():
+            index._register(author_id, author["name"], author["variants"], author["s2_ids"])
+        return index
+
+    def save(self, path: str = AUTHORS_PATH):
+        self.resolve()
+        table = {"version": TABLE_VERSION, "authors": self.authors}
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(table, file, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def _register(self, author_id: str, name: str, variants: Dict[str, int], s2_ids: List[str]):
+        self.authors[author_id] = {"name": name, "variants": {}, "s2_ids": list(s2_ids)}
+        self._blocks[parse_name(name).block].append(author_id)
+        self._profiles[author_id] = (set(), "")
+        for variant, count in variants.items():
+            self._add_variant(author_id, variant, count)
+        for s2_id in s2_ids:
+            self._s2[s2_id] = author_id
+
+    def add(self, name: str, s2_id: str = None, count: int = 1):
+        """
+        Count a spelling, lookups that should not change the counts add
+        with count=0
+        """
+        name = " ".join(name.split())
+        if not parse_name(name).last:
+            return
+        if s2_id:
+            s2_id = str(s2_id)
+        author_id = self.variants.get(name)
+        if author_id is None:
+            self._pending[name] += count
+            if s2_id:
+                self._pending_s2[name] = s2_id
+            return
+        author = self.authors[author_id]
+        author["variants"][name] += count
+        if s2_id and s2_id not in self._s2:
+            author["s2_ids"].append(s2_id)
+            self._s2[s2_id] = author_id
+
+    def reset_counts(self):
+        """
+        Zero the variant counts before counting the sources again, the ids
+        stay as they are
+        """
+        for author in self.authors.values():
+            for variant in author["variants"]:
+                author["variants"][variant] = 0
+
+    def _add_variant(self, author_id: str, variant: str, count: int):
+        self.variants[variant] = author_id
+        self.authors[author_id]["variants"][variant] = count
+        name = parse_name(variant)
+        firsts, initials = self._profiles[author_id]
+        if name.first:
+            firsts.add(name.first)
+        if len(name.initials) > len(initials):
+            self._profiles[author_id] = firsts, name.initials
+
+    def _new_id(self, name: Name) -> str:
+        base = re.sub(r"[^a-z0-9]+", "-", f"{name.last} {name.initials}").strip("-") or "anonymous"
+        author_id, suffix = base, 2
+        while author_id in self.authors:
+            author_id, suffix = f"{base}-{suffix}", suffix + 1
+        return author_id
+
+    def resolve(self):
+        """
+        Assign the pending names to authors, the most complete names first
+        so that bare initials join an author with a full first name
+        """
+        def completeness(variant):
+            name = parse_name(variant)
+            return (not name.first, -len(name.initials), -self._pending[variant], variant)
+
+        touched = set()
+        for variant in sorted(self._pending, key=completeness):
+            name = parse_name(variant)
+            count, s2_id = self._pending[variant], self._pending_s2.get(variant)
+            author_id = self._s2.get(s2_id) if s2_id else None
+            if author_id is None:
+                candidates = [
+                    candidate
+                    for candidate in self._blocks[name.block]
+                    if _compatible(name, *self._profiles[candidate])
+                ]
+                if candidates:
+                    author_id = max(
+                        candidates, key=lambda a: sum(self.authors[a]["variants"].values())
+                    )
+            if author_id is None:
+                author_id = self._new_id(name)
+                self._register(author_id, variant, {}, [])
+            self._add_variant(author_id, variant, count)
+            if s2_id and s2_id not in self._s2:
+                self.authors[author_id]["s2_ids"].append(s2_id)
+                self._s2[s2_id] = author_id
+            touched.add(author_id)
+        for author_id in touched:
+            self._update_name(author_id)
+        self._pending.clear()
+        self._pending_s2.clear()
+
+    def _update_name(self, author_id: str):
+        """
+        Display name: the most used spelling with a full first name
+        """
+        variants = self.authors[author_id]["variants"]
+        full = [v for v in variants if parse_name(v).first] or list(variants)
+        self.authors[author_id]["name"] = max(full, key=lambda v: (variants[v], len(v), v))
+
+    def canonical(self, name: str) -> str:
+        """
+        Author id of a spelling, None if it is not a name
+        """
+        name = " ".join(name.split())
+        if name not in self.variants:
+            self.add(name, count=0)
+            self.resolve()
+        return self.variants.get(name)
+
+    def name(self, author_id: str) -> str:
+        return self.authors[author_id]["name"]
+
+
+def iter_bib_authors(path: str) -> Iterator[str]:
+    for entry in iter_entries(path):
+        yield from split_authors(entry.get("author", ""))
+
+
+def iter_csv_authors(path: str, column: str = "Refereed Publications") -> Iterator[str]:
+    import pandas as pd
+
+    for citation in pd.read_csv(path)[column].dropna():
+        yield from split_citation_authors(citation)
+
+
+def iter_s2_authors(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    (name, authorId) of the metadata written by GenerateMetadata/helper.py,
+    {paper_id: [authors, venue, ...]}
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        metadata = json.load(file)
+    for fields in metadata.values():
+        for author in (fields or [[]])[0] or []:
+            if author.get("name"):
+                yield author["name"], author.get("authorId")
+
+
+def build_index(paths: List[str], s2_paths: List[str] = (), table: str = AUTHORS_PATH) -> AuthorIndex:
+    index = AuthorIndex.load(table)
+    index.reset_counts()
+    for path in paths:
+        names = iter_csv_authors(path) if path.endswith(".csv") else iter_bib_authors(path)
+        for name in names:
+            index.add(name)
+    for path in s2_paths:
+        for name, s2_id in iter_s2_authors(path):
+            index.add(name, s2_id)
+    index.resolve()
+    for author_id in index.authors:
+        index._update_name(author_id)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", help=".bib files and publication spreadsheets (.csv)")
+    parser.add_argument("--s2", nargs="*", default=[], help="Semantic Scholar metadata json files")
+    parser.add_argument("-o", "--output", default=AUTHORS_PATH)
+    args = parser.parse_args()
+
+    index = build_index(args.files, args.s2, args.output)
+    index.save(args.output)
+    print(
+        f"[INFO] {len(index.variants)} name variants of {len(index.authors)} authors in {args.output}"
+    )
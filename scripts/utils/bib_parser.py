@@ -0,0 +1,367 @@
+import io
+import re
+import codecs
+from typing import Dict, Iterator, List
+
+CHUNK_SIZE = 64 * 1024
+MONTHS = {
+    "jan": "January", "feb": "February", "mar": "March", "apr": "April",
+    "may": "May", "jun": "June", "jul": "July", "aug": "August",
+    "sep": "September", "oct": "October", "nov": "November", "dec": "December",
+}
+PERSON_FIELDS = ("author", "editor")
+
+_ENTRY_START = re.compile(r"@\s*([A-Za-z_][\w\-]*)\s*([{(])")
+_ENTRY_PREFIX = re.compile(r"@\s*[\w\-]*\s*$")
+_KEY = re.compile(r"\s*([^,\s{}()=\"#]*)\s*")
+_FIELD = re.compile(r"[\s,]*([A-Za-z_][\w\-:.+/]*)\s*=\s*")
+_FIELD_PREFIX = re.compile(r"[\s,]*[\w\-:.+/]*\s*\Z")
+_BARE = re.compile(r"[\w\-.:+/']+")
+_SPACE = re.compile(r"\s*")
+_BRACES = re.compile(r"[{}]")
+_QUOTE = re.compile(r'[{}"]')
+_AND = re.compile(r"\s+and\s+|[{}]", re.IGNORECASE)
+_COMMA = re.compile(r",|[{}]")
+_SUFFIXES = {"jr", "sr", "ii", "iii", "iv"}
+
+
+class BibParseError(ValueError):
+    pass
+
+
+class _Incomplete(Exception):
+    # the buffer ends inside an entry, more input is needed
+    pass
+
+
+def _closing_brace(text: str, pos: int) -> int:
+    """
+    Index of the brace closing the group whose content starts at `pos`
+    """
+    depth = 1
+    for match in _BRACES.finditer(text, pos):
+        depth += 1 if match.group() == "{" else -1
+        if depth == 0:
+            return match.start()
+    raise _Incomplete()
+
+
+def _closing_quote(text: str, pos: int) -> int:
+    depth = 0
+    for match in _QUOTE.finditer(text, pos):
+        char = match.group()
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        elif depth == 0:
+            return match.start()
+    raise _Incomplete()
+
+
+def _skip_space(text: str, pos: int) -> int:
+    pos = _SPACE.match(text, pos).end()
+    if pos >= len(text):
+        raise _Incomplete()
+    return pos
+
+
+def _value(text: str, pos: int, macros: Dict[str, str]):
+    """
+    Parse `part # part # ...` and return the concatenated value
+    """
+    parts = []
+    while True:
+        pos = _skip_space(text, pos)
+        char = text[pos]
+        if char == "{":
+            end = _closing_brace(text, pos + 1)
+            parts.append(text[pos + 1 : end])
+            pos = end + 1
+        elif char == '"':
+            end = _closing_quote(text, pos + 1)
+            parts.append(text[pos + 1 : end])
+            pos = end + 1
+        else:
+            match = _BARE.match(text, pos)
+            if match is None:
+                raise BibParseError(f"unexpected {char!r} in a field value")
+            if match.end() == len(text):
+                raise _Incomplete()
+            word = match.group()
+            parts.append(macros.get(word.lower(), word))
+            pos = match.end()
+        pos = _skip_space(text, pos)
+        if text[pos] != "#":
+            return "".join(parts), pos
+        pos += 1
+
+
+def _clean(value: str, strip_braces: bool) -> str:
+    value = " ".join(value.split())
+    if (
+        strip_braces
+        and value.startswith("{")
+        and value.endswith("}")
+        and _closing_brace(value, 1) == len(value) - 1
+    ):
+        value = value[1:-1]
+    return value
+
+
+def _split_top_level(value: str, pattern) -> List[str]:
+    pieces, depth, start = [], 0, 0
+    for match in pattern.finditer(value):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+        elif depth == 0:
+            pieces.append(value[start : match.start()])
+            start = match.end()
+    pieces.append(value[start:])
+    return [" ".join(piece.split()) for piece in pieces if piece.strip()]
+
+
+def _is_name_list(pieces: List[str]) -> bool:
+    # "Last, First" and "Last, Jr, First" are one name, two pieces are two
+    # names only when both read "First Last" ("de Souza, João" does not)
+    if len(pieces) == 3:
+        return pieces[1].rstrip(".").lower() not in _SUFFIXES
+    if len(pieces) == 2:
+        return all(" " in piece for piece in pieces) and not pieces[0][:1].islower()
+    return len(pieces) > 3
+
+
+def split_persons(value: str) -> List[str]:
+    """
+    Split an author/editor field on the "and"s outside braces.
+
+    Most of our .bib files list the authors separated by commas instead
+    ("Razak Abu, Maureen G. Reed, Timothy D. Jardine"), a field without
+    any "and" is split on its commas unless they read as the commas of a
+    single "Last, First" or "Last, Jr, First" name. So is the part before
+    the "and" of a serial-comma list ("Razak Abu, Maureen G. Reed, and
+    Timothy D. Jardine"), fields where every name holds a comma ("Abu,
+    Razak and Reed, Maureen G.") are "Last, First" names.
+    """
+    names = [name.rstrip(",").strip() for name in _split_top_level(value, _AND)]
+    names = [name for name in names if name]
+    if len(names) > 1 and all("," in name for name in names):
+        return names
+    result = []
+    for name in names:
+        pieces = _split_top_level(name, _COMMA)
+        result.extend(pieces if _is_name_list(pieces) else [name])
+    return result
+
+
+def format_person(name: str) -> str:
+    """
+    "First von Last" => "von Last, First", names that already hold a comma
+    are kept, like str(pybtex.database.Person)
+    """
+    tokens, depth, current = [], 0, ""
+    for char in name:
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        if char.isspace() and depth == 0:
+            if current:
+                tokens.append(current)
+            current = ""
+            continue
+        if char == "," and depth == 0:
+            return " ".join(name.split())
+        current += char
+    if current:
+        tokens.append(current)
+    if len(tokens) < 2:
+        return " ".join(tokens)
+    last = len(tokens) - 1
+    while last > 1 and tokens[last - 1][:1].islower():
+        last -= 1
+    return " ".join(tokens[last:]) + ", " + " ".join(tokens[:last])
+
+
+def _parse_entry(text: str, pos: int, macros: Dict[str, str], strip_braces: bool):
+    """
+    Parse the @block starting at `pos`. Returns the entry (None for
+    @comment, @preamble and @string) and the position after the block.
+    """
+    match = _ENTRY_START.match(text, pos)
+    if match is None:
+        if _ENTRY_PREFIX.match(text, pos):
+            raise _Incomplete()
+        raise BibParseError("@ not followed by an entry type")
+    kind = match.group(1).lower()
+    close = "}" if match.group(2) == "{" else ")"
+    pos = match.end()
+
+    if kind == "comment":
+        if close == "}":
+            return None, _closing_brace(text, pos) + 1
+        end = text.find(")", pos)
+        if end == -1:
+            raise _Incomplete()
+        return None, end + 1
+
+    if kind == "preamble":
+        _, pos = _value(text, pos, macros)
+        pos = _skip_space(text, pos)
+        return None, pos + 1
+
+    fields = {}
+    if kind != "string":
+        key = _KEY.match(text, pos)
+        pos = key.end()
+        if pos >= len(text):
+            raise _Incomplete()
+        fields["ENTRYTYPE"] = kind
+        fields["ID"] = key.group(1)
+
+    while True:
+        pos = _skip_space(text, pos)
+        if text[pos] == ",":
+            pos += 1
+            continue
+        if text[pos] == close:
+            pos += 1
+            break
+        field = _FIELD.match(text, pos)
+        if field is None:
+            if _FIELD_PREFIX.match(text, pos):
+                raise _Incomplete()
+            raise BibParseError(f"expected a field in {fields.get('ID', kind)}")
+        if field.end() == len(text):
+            raise _Incomplete()
+        value, pos = _value(text, field.end(), macros)
+        if kind == "string":
+            macros[field.group(1).lower()] = value
+        else:
+            fields[field.group(1).lower()] = _clean(value, strip_braces)
+
+    if kind == "string":
+        return None, pos
+    return fields, pos
+
+
+def _read_chunks(source, start: int, end: int, chunk_size: int) -> Iterator[str]:
+    if isinstance(source, (bytes, bytearray)):
+        source = bytes(source[start:end])
+        yield source.decode("utf-8", errors="replace")
+        return
+
+    close = False
+    if not hasattr(source, "read"):
+        source, close = open(source, "rb"), True
+    try:
+        if start:
+            source.seek(start)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = source.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        yield decoder.decode(b"", final=True)
+    finally:
+        if close:
+            source.close()
+
+
+def _parse_chunks(
+    chunks: Iterator[str],
+    persons: bool,
+    strip_braces: bool,
+    strict: bool,
+    macros: Dict[str, str],
+) -> Iterator[dict]:
+    buffer, pos = "", 0
+    exhausted = False
+    while not exhausted:
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+        else:
+            buffer, pos = buffer[pos:] + chunk, 0
+        while True:
+            at = buffer.find("@", pos)
+            if at == -1:
+                pos = len(buffer)
+                break
+            try:
+                entry, pos = _parse_entry(buffer, at, macros, strip_braces)
+            except _Incomplete:
+                pos = at
+                if not exhausted:
+                    break
+                error = BibParseError("unterminated entry at the end of the input")
+            except BibParseError as e:
+                error = e
+            else:
+                if entry is not None:
+                    if persons:
+                        for field in PERSON_FIELDS:
+                            if field in entry:
+                                entry[field] = [
+                                    format_person(name)
+                                    for name in split_persons(entry[field])
+                                ]
+                    yield entry
+                continue
+            if strict:
+                raise error
+            print(f"[ERROR] {error}: {buffer[at:at + 60]!r}")
+            # resume at the next line starting an entry, an @ inside the
+            # broken entry (e.g. an email address) is not one
+            pos = buffer.find("\n@", at + 1)
+            pos = len(buffer) if pos == -1 else pos + 1
+
+
+def iter_entries(
+    source,
+    start: int = 0,
+    end: int = None,
+    persons: bool = False,
+    strip_braces: bool = False,
+    strict: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[dict]:
+    """
+    Lazily parse BibTeX entries from a path, a file object or bytes.
+
+    Entries are bibtexparser style dicts: lowercased field names plus
+    "ENTRYTYPE" and "ID". Values have their delimiters removed, whitespace
+    collapsed, @string macros (and the month abbreviations) expanded and
+    `#` concatenations joined. Files are read `chunk_size` bytes at a time,
+    so memory stays flat however large the file is.
+
+    Args:
+    source: path, binary/text file object or bytes
+    start, end: byte (character for text files) range to parse, `start` must be
+        the beginning of an entry or of the text between entries
+    persons: split author/editor into lists of "Last, First" names
+    strip_braces: also drop one pair of braces wrapping a whole value,
+        e.g. title = {{GWF}} => "GWF"
+    strict: raise BibParseError instead of skipping a malformed entry
+    """
+    chunks = _read_chunks(source, start, end, chunk_size)
+    return _parse_chunks(chunks, persons, strip_braces, strict, dict(MONTHS))
+
+
+def loads(text: str, **kwargs) -> List[dict]:
+    """
+    All entries of a BibTeX string, see `iter_entries`
+    """
+    return list(iter_entries(io.StringIO(text), **kwargs))
+
+
+def load(path, **kwargs) -> List[dict]:
+    return list(iter_entries(path, **kwargs))
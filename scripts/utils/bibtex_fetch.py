@@ -0,0 +1,137 @@
+import threading
+import requests
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from .doi import normalize_doi
+from .retry import RetryPolicy, fetch_with_retry
+
+DOI_URL = "https://doi.org/"
+BIBTEX_HEADERS = {"Accept": "application/x-bibtex"}
+DEFAULT_WORKERS = 16
+DEFAULT_TIMEOUT = (5, 20)
+
+OK = "ok"
+NOT_FOUND = "404"
+UNAVAILABLE = "unavailable"
+TIMEOUT = "timeout"
+
+
+@dataclass
+class BibtexResult:
+    """
+    Outcome of the content negotiation for one doi.
+    `status` is one of "ok", "404", "unavailable" or "timeout".
+    """
+
+    doi: str
+    status: str
+    bibtex: str = ""
+    error: Optional[str] = None
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status == OK
+
+
+def clean_doi(doi: str) -> str:
+    """
+    First doi of a "doi1;doi2" field without the trailing full stop
+    """
+    doi = (doi or "").split(";")[0].strip()
+    return doi[:-1] if doi.endswith(".") else doi
+
+
+_local = threading.local()
+
+
+def _session(pool_size: int) -> requests.Session:
+    # one keep-alive session per worker thread, doi.org redirects to a
+    # handful of publisher hosts so every host keeps its own connections
+    if not hasattr(_local, "session"):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return _local.session
+
+
+def fetch_bibtex(
+    doi: str,
+    timeout=DEFAULT_TIMEOUT,
+    policy: RetryPolicy = None,
+    base_url: str = DOI_URL,
+    pool_size: int = DEFAULT_WORKERS,
+) -> BibtexResult:
+    """
+    BibTeX of one doi through doi.org content negotiation. Answers (200 and
+    404) are cached, 429 / 5xx are retried by the shared retry policy and
+    its circuit breaker, failed requests end up in policy.failures.
+    """
+    result = fetch_with_retry(
+        base_url + doi,
+        headers=BIBTEX_HEADERS,
+        session=_session(pool_size),
+        policy=policy,
+        timeout=timeout,
+    )
+    return _to_result(doi, result.response, result.exception, from_cache=result.from_cache)
+
+
+def _to_result(doi, response, error, from_cache=False) -> BibtexResult:
+    if error is not None:
+        status = TIMEOUT if isinstance(error, requests.Timeout) else UNAVAILABLE
+        return BibtexResult(doi, status, error=f"{type(error).__name__}: {error}")
+    if response.status_code == 404:
+        return BibtexResult(doi, NOT_FOUND, error="HTTP 404", from_cache=from_cache)
+    bibtex = response.content.decode("utf-8", errors="replace").strip()
+    if response.status_code >= 400 or not bibtex.startswith("@"):
+        error = f"HTTP {response.status_code}" if response.status_code >= 400 else "not bibtex"
+        return BibtexResult(doi, UNAVAILABLE, error=error, from_cache=from_cache)
+    return BibtexResult(doi, OK, bibtex=bibtex, from_cache=from_cache)
+
+
+def fetch_bibtex_many(
+    dois: List[str],
+    workers: int = DEFAULT_WORKERS,
+    timeout=DEFAULT_TIMEOUT,
+    policy: RetryPolicy = None,
+    base_url: str = DOI_URL,
+) -> List[Optional[BibtexResult]]:
+    """
+    Fetch the BibTeX of many dois concurrently.
+
+    Dois are cleaned (see `clean_doi`) and de-duplicated case-insensitively,
+    so every distinct doi is requested once. Results come back in input
+    order; empty dois give None.
+
+    Args:
+    dois: list of doi strings, may contain "" and duplicates
+    workers: number of requests in flight
+    timeout: requests (connect, read) timeout
+    """
+    cleaned = [clean_doi(doi) for doi in dois]
+    unique: Dict[str, str] = {}
+    for doi in cleaned:
+        if doi:
+            unique.setdefault(normalize_doi(doi), doi)
+
+    results: Dict[str, BibtexResult] = {}
+    if unique:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {
+                key: pool.submit(fetch_bibtex, doi, timeout, policy, base_url, workers)
+                for key, doi in unique.items()
+            }
+            for key, future in futures.items():
+                results[key] = future.result()
+
+    counts: Dict[str, int] = {}
+    for result in results.values():
+        counts[result.status] = counts.get(result.status, 0) + 1
+    print(f"[INFO] BibTeX for {len(unique)} distinct dois: {counts}")
+
+    return [results[normalize_doi(doi)] if doi else None for doi in cleaned]
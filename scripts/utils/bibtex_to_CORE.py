@@ -1,50 +1,114 @@
-from pybtex.database import parse_string, parse_file, parse_bytes
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from glob import glob
 from pathlib import Path
+import copy
 import json
+import os
+import shutil
 import sys
+from . import metrics
+from .bib_parser import iter_entries
 
-def bibtex_to_dicts(bibtex_data):
-    bib_dict_list = []
-    for entry in bibtex_data.entries.values():
-        bibdict = {}
+TEMPLATE_PATH = Path(__file__).parent / "CORE_template.json"
+SHARD_BYTES = 4 * 1024 * 1024
+WRITE_BUFFER = 1024 * 1024
+
+@lru_cache(maxsize=1)
+def load_template():
+    with open(TEMPLATE_PATH, "r") as file:
+        return json.loads(file.read())
+
+def bibdict_to_CORE(bibdict):
+    # deep copy, the nested lists of the template must not be shared between records
+    CORE = copy.deepcopy(load_template())
+    for key, value in bibdict.items():
         try:
-            for field, value in entry.fields.items():
-                if type(value) == str and len(value) > 1 and value[0] == "{" and value[-1] == "}":
-                    bibdict[field] = value[1:-1]
-                else:
-                    bibdict[field] = value
-            for key, value in entry.persons.items():
-                bibdict[key] = [str(v) for v in value]
+            if key.lower() == "url":
+                CORE["downloadUrl"] = value
+            elif key.lower() == "journal":
+                CORE["journals"] = [value]
+            elif key.lower() == "keywords":
+                CORE["topics"] = value.split(", ")
+            elif key.lower() == "year":
+                CORE["year"] = int(value)
+            elif "author" in key.lower():
+                CORE["authors"] = value
+            elif key.lower() in CORE:
+                CORE[key.lower()] = value
         except Exception as e:
             print (str(e))
-        bib_dict_list.append(bibdict)
-    return bib_dict_list
+    return CORE
 
+@metrics.timed()
 def bibdicts_to_CORES(bib_dict_list):
-    CORES = []
-    with open("CORE_template.json", "r") as file:
-        template = json.loads(file.read())
-    for bibdict in bib_dict_list:
-        CORE = template.copy()
-        for key, value in bibdict.items():
-            try:
-                if key.lower() == "url":
-                    CORE["downloadUrl"] = value
-                elif key.lower() == "journal":
-                    CORE["journals"] = [value]
-                elif key.lower() == "keywords":
-                    CORE["topics"] = value.split(", ")
-                elif key.lower() == "year":
-                    CORE["year"] = int(value)
-                elif "author" in key.lower():
-                    CORE["authors"] = value
-                elif key.lower() in CORE:
-                    CORE[key.lower()] = value
-            except Exception as e:
-                print (str(e))
-        CORES.append(CORE)
-    return CORES
+    return [bibdict_to_CORE(bibdict) for bibdict in bib_dict_list]
+
+def has_macros(file):
+    file.seek(0)
+    return any(line.lstrip()[:7].lower() == b"@string" for line in file)
+
+def plan_shards(files, shard_bytes = SHARD_BYTES):
+    """
+    Split the input files into (path, start, end) byte ranges that begin at
+    an entry. Files defining @string macros are not split, the macros have
+    to be parsed together with the entries using them.
+    """
+    shards = []
+    for path in files:
+        size = os.path.getsize(path)
+        with open(path, "rb") as file:
+            if size <= shard_bytes or has_macros(file):
+                shards.append((path, 0, size))
+                continue
+            start = 0
+            while start < size:
+                file.seek(min(start + shard_bytes, size))
+                file.readline()
+                boundary = file.tell()
+                for line in iter(file.readline, b""):
+                    if line.lstrip().startswith(b"@"):
+                        break
+                    boundary += len(line)
+                end = min(boundary, size)
+                shards.append((path, start, end))
+                start = end
+    return shards
+
+def convert_shard(shard, output_path):
+    """
+    Convert one shard into a NDJSON part file, returns the number of records
+    """
+    path, start, end = shard
+    count = 0
+    entries = iter_entries(path, start, end, persons = True, strip_braces = True)
+    with open(output_path, "w", buffering = WRITE_BUFFER) as output_file:
+        for bibdict in entries:
+            output_file.write(json.dumps(bibdict_to_CORE(bibdict)) + "\r\n")
+            count += 1
+    return count
+
+@metrics.timed(items = lambda total, *args, **kwargs: total)
+def convert(files, destination, workers = None, shard_bytes = SHARD_BYTES):
+    """
+    Convert bibtex files into CORE records appended to `destination`.
+    Shards are converted in parallel into part files which are then
+    concatenated in input order.
+    """
+    shards = plan_shards(files, shard_bytes)
+    parts = [f"{destination}.part-{i:05d}" for i in range(len(shards))]
+    print (f"Converting {len(files)} files in {len(shards)} shards...")
+    total = 0
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        for shard, count in zip(shards, pool.map(convert_shard, shards, parts)):
+            print (f"Converted {count} entries of {shard[0]} [{shard[1]}:{shard[2]}]")
+            total += count
+    with open(destination, "ab") as output_file:
+        for part in parts:
+            with open(part, "rb") as part_file:
+                shutil.copyfileobj(part_file, output_file, WRITE_BUFFER)
+            os.remove(part)
+    return total
 
 def index():
     if len(sys.argv) < 3:
@@ -52,20 +116,10 @@ def index():
     filenames = sys.argv[1]
     files = glob(filenames)
     destination = Path(sys.argv[2]) / "CORES_formated.json"
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
 
-    for file in files:
-        try:
-            print (f"Converting for {file}...")
-            bibtex_data = parse_file(file, bib_format = "bibtex")
-            bib_dict_list = bibtex_to_dicts(bibtex_data)
-            CORES = bibdicts_to_CORES(bib_dict_list)
-            text = ""
-            for CORE in CORES:
-                text = text + json.dumps(CORE) + "\r\n"
-            with open(destination, "a") as output_file:
-                output_file.write(text)
-        except Exception as e:
-            print (str(e))
+    total = convert(files, destination, workers)
+    print (f"{total} CORE records written to {destination}")
 
 if __name__ == "__main__":
-    index()
\ No newline at end of file
+    index()
@@ -0,0 +1,303 @@
+"""
+Compile .bib files into the pre-parsed corpus loaded by pubviz.
+
+For every input `name.bib` this writes the manifest `name.corpus.json`
+and SHARDS entry files `name.corpus.0.json`, ... (read by
+pubviz/src/pubvis.js instead of parsing the BibTeX in the browser, the
+shards are fetched in parallel) and, when msgpack is installed, the whole
+corpus as `name.corpus.msgpack` for Python consumers. The manifest is
+
+    {"version", "source", "source_sha256", "count",
+     "shards": ["name.corpus.0.json", ...],
+     "aggregates": {"years", "types", "keywords", "authors"}}
+
+with the keyword and author clouds as rows of AGGREGATE_FIELDS, and a
+shard holds its entries as rows, {"tags": [tag, ...], "entries":
+[[citationKey, entryType, value of each tag or null, ...], ...]}, which
+pubvis turns back into {"citationKey", "entryType", "entryTags"} objects.
+Entries are normalized the way pubvis' bib2json does it (lowercase types
+and tags, braces dropped, LaTeX escapes decoded with the table of
+zotero-bibtex-parse.js, url derived from the doi) and only keep the tags
+pubvis reads (PUBVIZ_TAGS). The keyword and author aggregates use the
+exact rules of pubvis' get_words / get_authors, so the first render of
+the page can use them as they are.
+
+python -m scripts.utils.build_corpus data/publications_bibtex.bib data/new_publications_bibtex.bib
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from itertools import groupby
+from typing import Dict, List
+from .bib_parser import iter_entries
+
+CORPUS_VERSION = 2
+SHARDS = 4
+WORD_LIMIT = 30
+AGGREGATE_FIELDS = {"keywords": ("text", "size", "long_text"), "authors": ("text", "size", "first_name")}
+# tags shown or filtered on by pubvis.js, the doi only ends up in the url
+PUBVIZ_TAGS = {
+    "abstract", "address", "author", "booktitle", "edition", "journal", "keywords",
+    "notes", "number", "pages", "publisher", "school", "title", "url", "volume", "year",
+}
+ZOTERO_PARSER = os.path.join(
+    os.path.dirname(__file__), "..", "..", "pubviz", "lib", "zotero-bibtex-parse.js"
+)
+
+# pubvis runs its regular expressions without the unicode flag
+_JS_TITLE_WORD = re.compile(r"\w\S*", re.ASCII)
+_JS_SPECIAL = re.compile(r"[^\w\s\-]", re.ASCII)
+_JS_AUTHOR_SPLIT = re.compile(r",(?!\s)")
+
+
+@lru_cache(maxsize=1)
+def latex_table() -> Dict[str, str]:
+    """
+    The latexToUni table of the browser parser, so both decode alike
+    """
+    with open(ZOTERO_PARSER, "r", encoding="utf-8") as file:
+        source = file.read()
+    block = source[source.index("this.latexToUni = {") : source.index("String.prototype.addSlashes")]
+    table = {}
+    for key, value in re.findall(r'"((?:[^"\\]|\\.)*)"\s*:\s*"((?:[^"\\]|\\.)*)"', block):
+        key, value = (json.loads('"' + x.replace("\\'", "'") + '"') for x in (key, value))
+        table[key] = value
+    return table
+
+
+def decode_latex(value: str) -> str:
+    """
+    LatexToUTF8.decodeLatex of zotero-bibtex-parse.js: the longest escape
+    following a backslash is replaced, every other brace is dropped
+    """
+    table = latex_table()
+    longest = max(map(len, table))
+    result, pos = [], 0
+    while pos < len(value):
+        char = value[pos]
+        if char == "\\":
+            for size in range(min(longest, len(value) - pos - 1), 0, -1):
+                escape = value[pos + 1 : pos + 1 + size]
+                if escape in table:
+                    result.append(table[escape])
+                    pos += 1 + size
+                    break
+            else:
+                result.append(char)
+                pos += 1
+        elif char in "{}":
+            pos += 1
+        else:
+            result.append(char)
+            pos += 1
+    return "".join(result)
+
+
+def to_entry(bibdict: dict) -> dict:
+    tags = {
+        k: decode_latex(v) for k, v in bibdict.items() if k not in ("ENTRYTYPE", "ID")
+    }
+    if "doi" in tags and "url" not in tags:
+        tags["url"] = "http://dx.doi.org/" + tags["doi"]
+    return {
+        "citationKey": bibdict["ID"],
+        "entryType": bibdict["ENTRYTYPE"].lower(),
+        "entryTags": {k: v for k, v in tags.items() if k in PUBVIZ_TAGS},
+    }
+
+
+def _title_case(text: str) -> str:
+    return _JS_TITLE_WORD.sub(lambda m: m.group()[0].upper() + m.group()[1:].lower(), text)
+
+
+def _runs(items: List, key) -> List[tuple]:
+    """
+    (last item, length) of every run of equal keys in a sorted list
+    """
+    runs = []
+    for _, group in groupby(items, key=key):
+        group = list(group)
+        runs.append((group[-1], len(group)))
+    return runs
+
+
+def keyword_aggregate(entries: List[dict]) -> List[dict]:
+    """
+    Same result as get_words(json) in pubvis.js
+    """
+    values = [e["entryTags"]["keywords"] for e in entries if "keywords" in e["entryTags"]]
+    words = []
+    for word in ",".join(values).replace("_", " ").split(","):
+        word = _JS_SPECIAL.sub("", _title_case(word.strip()))
+        if word:
+            words.append(word)
+    words.sort(key=str.lower)
+    result = []
+    for word, count in _runs(words, key=lambda w: w):
+        text = word[:WORD_LIMIT] + "..." if len(word) > WORD_LIMIT else word
+        result.append({"text": text, "size": count, "long_text": word})
+    return result
+
+
+def author_aggregate(entries: List[dict]) -> List[dict]:
+    """
+    Same result as get_authors(json) in pubvis.js
+    """
+    values = [e["entryTags"]["author"] for e in entries if "author" in e["entryTags"]]
+    names = _JS_AUTHOR_SPLIT.split(",".join(",".join(values).split(" and ")))
+    people = []
+    for name in names:
+        comma = name.find(",")
+        if comma == -1:
+            space = name.find(" ")
+            first = name[:space].strip() if space != -1 else ""
+            # String.substr(-1) is the last character
+            last = name[space:].strip() if space != -1 else name[-1:].strip()
+        else:
+            last = name[:comma].strip()
+            first = name[comma:].replace(",", "").strip()
+        people.append({"text": last, "first_name": first})
+    people.sort(key=lambda p: p["text"])
+    result = [
+        {"text": p["text"], "size": count, "first_name": p["first_name"]}
+        for p, count in _runs(people, key=lambda p: p["text"])
+    ]
+    result.sort(key=lambda a: -a["size"])
+    return result
+
+
+def aggregates(entries: List[dict]) -> Dict[str, object]:
+    return {
+        "years": dict(Counter(e["entryTags"].get("year", "") for e in entries)),
+        "types": dict(Counter(e["entryType"] for e in entries)),
+        "keywords": keyword_aggregate(entries),
+        "authors": author_aggregate(entries),
+    }
+
+
+def build_corpus(bib_path: str) -> dict:
+    with open(bib_path, "rb") as file:
+        digest = hashlib.sha256(file.read()).hexdigest()
+    entries = [to_entry(bibdict) for bibdict in iter_entries(bib_path)]
+    return {
+        "version": CORPUS_VERSION,
+        "source": os.path.basename(bib_path),
+        "source_sha256": digest,
+        "entries": entries,
+        "aggregates": aggregates(entries),
+    }
+
+
+def corpus_path(bib_path: str, extension: str = "json") -> str:
+    return re.sub(r"\.bib$", "", bib_path) + ".corpus." + extension
+
+
+def shard_paths(json_path: str) -> List[str]:
+    """
+    The shard files of the manifest `json_path`
+    """
+    stem = re.sub(r"\.json$", "", json_path)
+    return [f"{stem}.{i}.json" for i in range(SHARDS)]
+
+
+def _dump(data, path: str):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+
+
+def pack_shard(entries: List[dict]) -> dict:
+    tags = sorted({tag for entry in entries for tag in entry["entryTags"]})
+    rows = []
+    for entry in entries:
+        row = [entry["citationKey"], entry["entryType"]] + [entry["entryTags"].get(t) for t in tags]
+        while row[-1] is None:
+            row.pop()
+        rows.append(row)
+    return {"tags": tags, "entries": rows}
+
+
+def unpack_shard(shard: dict) -> List[dict]:
+    return [
+        {
+            "citationKey": row[0],
+            "entryType": row[1],
+            "entryTags": {t: v for t, v in zip(shard["tags"], row[2:]) if v is not None},
+        }
+        for row in shard["entries"]
+    ]
+
+
+def write_shards(corpus: dict, json_path: str):
+    """
+    Write the manifest `json_path` and its shards
+    """
+    entries, paths = corpus["entries"], shard_paths(json_path)
+    size = -(-len(entries) // SHARDS)
+    for i, path in enumerate(paths):
+        _dump(pack_shard(entries[i * size : (i + 1) * size]), path)
+    manifest = {k: v for k, v in corpus.items() if k != "entries"}
+    manifest["aggregates"] = dict(corpus["aggregates"])
+    for name, fields in AGGREGATE_FIELDS.items():
+        manifest["aggregates"][name] = [[item[f] for f in fields] for item in corpus["aggregates"][name]]
+    manifest["count"] = len(entries)
+    manifest["shards"] = [os.path.basename(path) for path in paths]
+    _dump(manifest, json_path)
+
+
+def read_corpus(json_path: str) -> dict:
+    """
+    The corpus of the manifest `json_path`, entries of all shards included
+    """
+    with open(json_path, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    corpus = {k: v for k, v in manifest.items() if k not in ("count", "shards")}
+    for name, fields in AGGREGATE_FIELDS.items():
+        corpus["aggregates"][name] = [dict(zip(fields, row)) for row in corpus["aggregates"][name]]
+    corpus["entries"] = []
+    for name in manifest["shards"]:
+        with open(os.path.join(os.path.dirname(json_path), name), "r", encoding="utf-8") as file:
+            corpus["entries"].extend(unpack_shard(json.load(file)))
+    return corpus
+
+
+def _up_to_date(json_path: str, digest: str) -> bool:
+    if not all(os.path.exists(path) for path in [json_path] + shard_paths(json_path)):
+        return False
+    with open(json_path, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    return manifest.get("version") == CORPUS_VERSION and manifest.get("source_sha256") == digest
+
+
+def write_corpus(bib_path: str) -> dict:
+    """
+    Build the corpus of `bib_path` unless the existing one was built from
+    the same file content
+    """
+    json_path = corpus_path(bib_path)
+    corpus = build_corpus(bib_path)
+    if _up_to_date(json_path, corpus["source_sha256"]):
+        print(f"[INFO] {json_path} is up to date")
+        return corpus
+
+    write_shards(corpus, json_path)
+    print(f"[INFO] Wrote {len(corpus['entries'])} entries to {json_path} and {SHARDS} shards")
+
+    try:
+        import msgpack
+    except ImportError:
+        print("[INFO] msgpack is not installed, skipping the .msgpack corpus")
+        return corpus
+    with open(corpus_path(bib_path, "msgpack"), "wb") as file:
+        file.write(msgpack.packb(corpus, use_bin_type=True))
+    return corpus
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python -m scripts.utils.build_corpus FILE.bib [FILE.bib ...]")
+    for path in sys.argv[1:]:
+        write_corpus(path)
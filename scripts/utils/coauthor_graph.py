@@ -0,0 +1,411 @@
+"""
+Build the co-author graph shown by index.js (sigma.parsers.gexf) straight
+from the bib files, replacing the manual Gephi export.
+
+The bib files are streamed with bib_parser, author names are mapped to
+their canonical author id (scripts/utils/authors.py, the table in
+data/authors.json, --save-authors writes the new spellings back) so "M. Deen" and
+"M. Jamal Deen" are one node, and the co-authorships are summed into a
+sparse adjacency matrix. Positions come from ForceAtlas2 with Barnes-Hut
+repulsion (scripts/utils/force_atlas.py) and are written with the node and
+edge attributes of the Gephi file (author_name, num_authored, affiliation,
+count, viz:size/position/color).
+
+With --previous the bib files are taken as new publications on top of an
+existing graph: its nodes keep their ids, attributes, colors and
+positions, the new papers add to num_authored and the edge counts, new
+authors start next to their co-authors and the layout only runs a few
+iterations in which the previous nodes stay where they are.
+
+The graph is written to build/force_atlas_new.gexf unless -o says
+otherwise, copy it to gwf_co_author_graph/file/data/ (or use the pipeline's
+--publish) to put it on the site.
+
+python -m scripts.utils.coauthor_graph data/publications_bibtex.bib data/new_publications_bibtex.bib
+python -m scripts.utils.coauthor_graph new.bib --previous gwf_co_author_graph/file/data/force_atlas_new.gexf
+"""
+import os
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+from scipy.sparse import coo_matrix
+
+from .authors import AUTHORS_PATH, AuthorIndex, split_authors
+from .bib_parser import iter_entries
+from .force_atlas import force_atlas2
+from .paths import in_root
+
+GEXF_PATH = in_root("build/force_atlas_new.gexf")
+MIN_PAPERS = 2
+MAX_AUTHORS = 50
+ITERATIONS = 500
+INCREMENTAL_ITERATIONS = 100
+MIN_SIZE, MAX_SIZE = 70.0, 300.0
+DEFAULT_COLOR = (192, 192, 192)
+NODE_ATTRIBUTES = [
+    ("author_id", "author_id", "integer"),
+    ("author_name", "author_name", "string"),
+    ("num_authored", "num_authored", "integer"),
+    ("modularity_class", "Modularity Class", "integer"),
+    ("affiliation", "affiliation", "string"),
+    ("url", "url", "string"),
+]
+
+@lru_cache(maxsize=None)
+def _pairs(k: int) -> Tuple[np.ndarray, np.ndarray]:
+    return np.triu_indices(k, 1)
+
+
+class CoauthorGraph:
+    """
+    Authors and co-authorship counts, papers are added one at a time and
+    the pairs are only summed (as a sparse matrix) when asked for
+    """
+
+    def __init__(self, authors: AuthorIndex = None):
+        self.authors = authors if authors is not None else AuthorIndex()
+        self.index: Dict[str, int] = {}
+        self.keys: List[str] = []
+        self.names: List[Counter] = []
+        self.papers: List[np.ndarray] = []
+        self.sources: List[np.ndarray] = []
+        self.targets: List[np.ndarray] = []
+        self.counts: List[np.ndarray] = []
+        # attributes of nodes coming from a previous graph
+        self.previous: Dict[int, dict] = {}
+
+    def node(self, key: str) -> int:
+        if key not in self.index:
+            self.index[key] = len(self.names)
+            self.keys.append(key)
+            self.names.append(Counter())
+        return self.index[key]
+
+    def add_paper(self, authors: List[str], max_authors: int = MAX_AUTHORS):
+        ids = []
+        for name in authors:
+            author_id = self.authors.canonical(name)
+            if author_id is None:
+                continue
+            node = self.node(author_id)
+            self.names[node][name] += 1
+            ids.append(node)
+        ids = np.unique(ids)
+        self.papers.append(ids)
+        # huge author lists would add k^2 edges without telling much
+        if 1 < len(ids) <= max_authors:
+            first, second = _pairs(len(ids))
+            self.add_edges(ids[first], ids[second], np.ones(len(first), dtype=np.int64))
+
+    def add_bib(self, path: str, max_authors: int = MAX_AUTHORS) -> int:
+        papers = [split_authors(entry.get("author", "")) for entry in iter_entries(path)]
+        papers = [authors for authors in papers if authors]
+        # resolve the new spellings of the whole file at once, full names first
+        for authors in papers:
+            for name in authors:
+                self.authors.add(name, count=0)
+        self.authors.resolve()
+        for authors in papers:
+            self.add_paper(authors, max_authors)
+        return len(papers)
+
+    def add_edges(self, sources, targets, counts):
+        self.sources.append(np.asarray(sources, dtype=np.int64))
+        self.targets.append(np.asarray(targets, dtype=np.int64))
+        self.counts.append(np.asarray(counts, dtype=np.int64))
+
+    def num_authored(self) -> np.ndarray:
+        n = len(self.names)
+        authored = np.zeros(n, dtype=np.int64)
+        if self.papers:
+            authored += np.bincount(np.concatenate(self.papers), minlength=n)
+        for node, attributes in self.previous.items():
+            authored[node] += attributes["num_authored"]
+        return authored
+
+    def adjacency(self):
+        """
+        Upper triangular CSR matrix of the co-authorship counts
+        """
+        n = len(self.names)
+        empty = [np.zeros(0, dtype=np.int64)]
+        sources = np.concatenate(self.sources + empty)
+        targets = np.concatenate(self.targets + empty)
+        weights = np.concatenate(self.counts + empty)
+        rows, cols = np.minimum(sources, targets), np.maximum(sources, targets)
+        return coo_matrix((weights, (rows, cols)), shape=(n, n)).tocsr()
+
+    def label(self, node: int) -> str:
+        if node in self.previous:
+            return self.previous[node]["label"]
+        return self.authors.name(self.keys[node])
+
+    def author_name(self, node: int) -> str:
+        names = self.names[node]
+        if node in self.previous and "author_name" in self.previous[node]["attributes"]:
+            return self.previous[node]["attributes"]["author_name"]
+        return names.most_common(1)[0][0]
+
+
+def _tag(element) -> str:
+    return element.tag.rsplit("}", 1)[-1]
+
+
+def read_gexf(path: str) -> Tuple[List[dict], List[Tuple[str, str, int]]]:
+    """
+    Nodes (id, label, attributes, position, color) and edges
+    (source, target, count) of a GEXF file
+    """
+    nodes, edges = [], []
+    for _, element in ET.iterparse(path):
+        tag = _tag(element)
+        if tag == "node":
+            node = {"id": element.get("id"), "label": element.get("label", ""), "attributes": {}}
+            for child in element.iter():
+                child_tag = _tag(child)
+                if child_tag == "attvalue":
+                    node["attributes"][child.get("for")] = child.get("value")
+                elif child_tag == "position":
+                    node["position"] = (float(child.get("x")), float(child.get("y")))
+                elif child_tag == "color":
+                    node["color"] = tuple(int(child.get(c)) for c in "rgb")
+            nodes.append(node)
+            element.clear()
+        elif tag == "edge":
+            count = 1
+            for child in element.iter():
+                if _tag(child) == "attvalue" and child.get("for") == "count":
+                    count = int(float(child.get("value")))
+            edges.append((element.get("source"), element.get("target"), count))
+            element.clear()
+    return nodes, edges
+
+
+def load_previous(graph: CoauthorGraph, path: str) -> Dict[int, str]:
+    """
+    Add the nodes and edges of a previous GEXF to `graph`, returns the
+    GEXF id of every node
+    """
+    nodes, edges = read_gexf(path)
+    ids = {}
+    for node in nodes:
+        name = node["attributes"].get("author_name") or node["label"]
+        key = graph.authors.canonical(name) or name
+        if key in graph.index:
+            # two authors of the previous graph share a key, keep both
+            key += "|" + node["id"]
+        index = graph.node(key)
+        graph.previous[index] = {
+            "label": node["label"],
+            "attributes": node["attributes"],
+            "num_authored": int(node["attributes"].get("num_authored") or 0),
+            "position": node.get("position"),
+            "color": node.get("color"),
+        }
+        ids[node["id"]] = index
+    if edges:
+        sources, targets, counts = zip(*[(ids[s], ids[t], c) for s, t, c in edges])
+        graph.add_edges(sources, targets, counts)
+    return {index: gexf_id for gexf_id, index in ids.items()}
+
+
+def initial_positions(adjacency, previous_pos: Dict[int, Tuple[float, float]], n: int, seed: int = 0):
+    """
+    Keep the previous positions, put a new node at the mean position of its
+    placed co-authors (or at random when it has none)
+    """
+    rng = np.random.default_rng(seed)
+    if previous_pos:
+        placed_pos = np.array(list(previous_pos.values()))
+        spread = placed_pos.std(axis=0).mean() or 1.0
+        center = placed_pos.mean(axis=0)
+    else:
+        spread, center = np.sqrt(n) * 10, np.zeros(2)
+    pos = center + rng.uniform(-1, 1, size=(n, 2)) * spread
+    placed = np.zeros(n, dtype=bool)
+    for node, xy in previous_pos.items():
+        pos[node] = xy
+        placed[node] = True
+    if placed.any() and not placed.all():
+        symmetric = (adjacency + adjacency.T).tocsr()
+        symmetric.data[:] = 1
+        neighbours = symmetric @ placed.astype(float)
+        sums = symmetric @ (pos * placed[:, None])
+        near = ~placed & (neighbours > 0)
+        jitter = rng.normal(scale=spread * 0.05, size=(near.sum(), 2))
+        pos[near] = sums[near] / neighbours[near, None] + jitter
+    return pos
+
+
+def build(
+    bib_paths: List[str],
+    previous: str = None,
+    min_papers: int = MIN_PAPERS,
+    max_authors: int = MAX_AUTHORS,
+    iterations: int = None,
+    seed: int = 0,
+    authors: AuthorIndex = None,
+) -> dict:
+    """
+    Build the graph and its layout. Returns the nodes (with position,
+    size and color) and edges to write.
+    """
+    graph = CoauthorGraph(authors)
+    gexf_ids = load_previous(graph, previous) if previous else {}
+    for path in bib_paths:
+        start = time.perf_counter()
+        count = graph.add_bib(path, max_authors)
+        print(f"[INFO] Read {count} papers from {path} in {time.perf_counter() - start:.2f}s")
+
+    authored = graph.num_authored()
+    keep = (authored >= min_papers) | np.isin(np.arange(len(authored)), list(graph.previous))
+    new_index = np.cumsum(keep) - 1
+    adjacency = graph.adjacency()[keep][:, keep].tocoo()
+    kept = np.flatnonzero(keep)
+    print(f"[INFO] {len(kept)} authors with >= {min_papers} papers, {adjacency.nnz} co-author pairs")
+
+    previous_pos = {
+        new_index[node]: attributes["position"]
+        for node, attributes in graph.previous.items()
+        if attributes["position"] is not None
+    }
+    pos = initial_positions(adjacency, previous_pos, len(kept), seed)
+    if iterations is None:
+        iterations = INCREMENTAL_ITERATIONS if previous_pos else ITERATIONS
+    fixed = np.zeros(len(kept), dtype=bool)
+    fixed[list(previous_pos)] = True
+    start = time.perf_counter()
+    pos = force_atlas2(
+        (adjacency.row, adjacency.col, adjacency.data),
+        len(kept),
+        pos,
+        iterations,
+        seed=seed,
+        fixed=fixed,
+    )
+    print(f"[INFO] {iterations} ForceAtlas2 iterations in {time.perf_counter() - start:.2f}s")
+
+    authored = authored[keep]
+    low, high = authored.min(initial=0), authored.max(initial=0)
+    sizes = MIN_SIZE + (authored - low) * (MAX_SIZE - MIN_SIZE) / max(high - low, 1)
+
+    used_ids = {int(i) for i in gexf_ids.values() if str(i).isdigit()}
+    next_id = max(used_ids, default=-1) + 1
+    nodes = []
+    for new, node in enumerate(kept):
+        before = graph.previous.get(node)
+        if node in gexf_ids:
+            gexf_id = gexf_ids[node]
+        else:
+            gexf_id, next_id = str(next_id), next_id + 1
+        attributes = dict(before["attributes"]) if before else {}
+        attributes["author_name"] = graph.author_name(node)
+        attributes["num_authored"] = str(authored[new])
+        nodes.append({
+            "id": gexf_id,
+            "label": graph.label(node),
+            "attributes": attributes,
+            "size": sizes[new],
+            "position": pos[new],
+            "color": (before or {}).get("color") or DEFAULT_COLOR,
+        })
+    edges = [
+        (nodes[s]["id"], nodes[t]["id"], int(c))
+        for s, t, c in zip(adjacency.row, adjacency.col, adjacency.data)
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+
+def write_gexf(path: str, nodes: List[dict], edges: List[Tuple[str, str, int]]):
+    """
+    Write the graph in the layout of the Gephi export read by index.js
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        write = file.write
+        write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        write(
+            '<gexf xmlns="http://www.gexf.net/1.3" version="1.3" '
+            'xmlns:viz="http://www.gexf.net/1.3/viz" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            'xsi:schemaLocation="http://www.gexf.net/1.3 http://www.gexf.net/1.3/gexf.xsd">\n'
+        )
+        write(f'  <meta lastmodifieddate="{date.today().isoformat()}">\n')
+        write("    <creator>scripts/utils/coauthor_graph.py</creator>\n")
+        write("    <description></description>\n  </meta>\n")
+        write('  <graph defaultedgetype="undirected" mode="static">\n')
+        write('    <attributes class="node" mode="static">\n')
+        for attribute, title, kind in NODE_ATTRIBUTES:
+            if attribute == "modularity_class":
+                write(
+                    f'      <attribute id="{attribute}" title="{title}" type="{kind}">\n'
+                    "        <default>0</default>\n      </attribute>\n"
+                )
+            else:
+                write(f'      <attribute id="{attribute}" title="{title}" type="{kind}"></attribute>\n')
+        write("    </attributes>\n")
+        write('    <attributes class="edge" mode="static">\n')
+        write('      <attribute id="count" title="count" type="integer"></attribute>\n')
+        write("    </attributes>\n    <nodes>\n")
+        for node in nodes:
+            write(f'      <node id={quoteattr(node["id"])} label={quoteattr(node["label"])}>\n')
+            write("        <attvalues>\n")
+            for attribute, _, _ in NODE_ATTRIBUTES:
+                value = node["attributes"].get(attribute)
+                if value not in (None, ""):
+                    write(
+                        f'          <attvalue for="{attribute}" value={quoteattr(str(value))}></attvalue>\n'
+                    )
+            write("        </attvalues>\n")
+            x, y = node["position"]
+            r, g, b = node["color"]
+            write(f'        <viz:size value="{node["size"]:.6g}"></viz:size>\n')
+            write(f'        <viz:position x="{x:.8g}" y="{y:.8g}"></viz:position>\n')
+            write(f'        <viz:color r="{r}" g="{g}" b="{b}"></viz:color>\n')
+            write("      </node>\n")
+        write("    </nodes>\n    <edges>\n")
+        for i, (source, target, count) in enumerate(edges):
+            write(f'      <edge id="{i}" source={quoteattr(source)} target={quoteattr(target)}>\n')
+            write("        <attvalues>\n")
+            write(f'          <attvalue for="count" value="{count}"></attvalue>\n')
+            write("        </attvalues>\n      </edge>\n")
+        write("    </edges>\n  </graph>\n</gexf>\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bib", nargs="+", help="bib files (the new ones with --previous)")
+    parser.add_argument("-o", "--output", default=GEXF_PATH)
+    parser.add_argument("--previous", help="GEXF graph the bib files are added to")
+    parser.add_argument("--min-papers", type=int, default=MIN_PAPERS)
+    parser.add_argument("--max-authors", type=int, default=MAX_AUTHORS)
+    parser.add_argument("--iterations", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--authors", default=AUTHORS_PATH, help="canonical author table")
+    parser.add_argument(
+        "--save-authors", action="store_true", help="write the new spellings to the author table"
+    )
+    args = parser.parse_args()
+
+    authors = AuthorIndex.load(args.authors)
+
+    graph = build(
+        args.bib,
+        args.previous,
+        args.min_papers,
+        args.max_authors,
+        args.iterations,
+        args.seed,
+        authors,
+    )
+    if args.save_authors:
+        authors.save(args.authors)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    write_gexf(args.output, graph["nodes"], graph["edges"])
+    print(f"[INFO] Wrote {len(graph['nodes'])} nodes and {len(graph['edges'])} edges to {args.output}")
@@ -0,0 +1,310 @@
+"""
+Find the publications that appear more than once across the .bib files
+and CORE json lines files (ref_CORE.json, CORES_formated.json after a
+rerun, ...) and write one canonical CORE corpus.
+
+Records are matched on their normalized DOI first. Records with
+different titles spellings are found with MinHash + LSH over the title
+trigrams: every record gets NUM_PERM min-hashes computed in one numpy
+pass, records sharing all ROWS hashes of a band become candidates and
+candidates are only merged when the exact trigram Jaccard similarity is
+at least TITLE_THRESHOLD, their years are at most a year apart, their
+entry types (article, misc, ...) agree when both are known, only both or
+neither title starts with "Dataset for" / "Data for" (a dataset is not
+its paper) and their clusters do not carry different DOIs (two records
+with different DOIs never end up together through a third record
+without one). Work is
+linear in the number of records (plus the candidates), no pair of
+records is compared blindly.
+
+Every cluster keeps its most complete record (DOI first, then the number
+of filled fields, then the input order) and fills that record's empty
+fields from the others. The merge decisions are written next to the
+corpus so they can be reviewed.
+
+python -m scripts.utils.dedup data/publications_bibtex.bib data/new_publications_bibtex.bib data/ref_CORE.json
+"""
+import re
+import json
+import argparse
+from itertools import combinations
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from .bib_parser import iter_entries
+from .bibtex_to_CORE import bibdict_to_CORE
+from .doi import normalize_doi
+from .paths import in_root
+from .title_scoring import trigrams
+
+CORPUS_PATH = in_root("data/canonical_CORE.json")
+DECISIONS_PATH = in_root("data/dedup_decisions.json")
+NUM_PERM = 64
+ROWS = 4
+TITLE_THRESHOLD = 0.8
+MIN_TRIGRAMS = 12
+MAX_BUCKET = 32
+MAX_YEAR_GAP = 1
+_PRIME = (1 << 31) - 1
+_DATASET_TITLE = re.compile(r"^\W*data(?:\s*set)?\s+(?:for|from)\b", re.IGNORECASE)
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    CORE records of a .bib file or of a CORE json lines file
+    """
+    if path.endswith(".bib"):
+        for entry in iter_entries(path, persons=True, strip_braces=True):
+            record = bibdict_to_CORE(entry)
+            record["enrichments"]["documentType"]["type"] = entry["ENTRYTYPE"].lower()
+            yield record
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _year(record: dict):
+    try:
+        return int(str(record.get("year") or "")[:4])
+    except ValueError:
+        return None
+
+
+def _entry_type(record: dict):
+    document_type = (record.get("enrichments") or {}).get("documentType") or {}
+    return (document_type.get("type") or "").lower() or None
+
+
+def _is_dataset(record: dict) -> bool:
+    return bool(_DATASET_TITLE.match(record.get("title") or ""))
+
+
+def minhash(grams: List[set], num_perm: int = NUM_PERM, seed: int = 1) -> np.ndarray:
+    """
+    (len(grams), num_perm) MinHash signatures of sets of strings, empty
+    sets get an all-max signature that never collides with a real one
+    """
+    vocabulary: Dict[str, int] = {}
+    ids = [vocabulary.setdefault(g, len(vocabulary)) for s in grams for g in s]
+    sizes = np.array([len(s) for s in grams], dtype=np.int64)
+    signatures = np.full((len(grams), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    if not ids:
+        return signatures
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+    x = np.array(ids, dtype=np.uint64) + np.uint64(1)
+    # (a * x + b) mod p is a random permutation of the ids as long as they
+    # are below p, and a * x + b < 2^63 does not overflow
+    hashed = (x[:, None] * a[None, :] + b[None, :]) % np.uint64(_PRIME)
+
+    filled = sizes > 0
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])[filled]
+    signatures[filled] = np.minimum.reduceat(hashed, starts, axis=0)
+    return signatures
+
+
+def lsh_candidates(
+    signatures: np.ndarray, rows: int = ROWS, max_bucket: int = MAX_BUCKET
+) -> Iterator[Tuple[int, int]]:
+    """
+    Pairs of records that share a band of their signatures. Buckets
+    larger than `max_bucket` (e.g. many copies of one title) only pair
+    their first member with the others.
+    """
+    n, num_perm = signatures.shape
+    weights = np.uint64(0x9E3779B97F4A7C15) ** np.arange(rows, dtype=np.uint64)
+    for start in range(0, num_perm - rows + 1, rows):
+        with np.errstate(over="ignore"):
+            keys = (signatures[:, start : start + rows] * weights).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        bounds = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1], True])
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            if end - begin < 2:
+                continue
+            members = order[begin:end].tolist()
+            if len(members) <= max_bucket:
+                yield from combinations(members, 2)
+            else:
+                yield from ((members[0], other) for other in members[1:])
+
+
+class UnionFind:
+    """
+    Clusters of records. A cluster holds at most one DOI, clusters with
+    different DOIs are never united, not even through a record without one.
+    The entry type and dataset flag of a cluster are kept the same way for
+    `kind_conflict`.
+    """
+
+    def __init__(
+        self, n: int, dois: List[str] = None, types: List[str] = None, datasets: List[bool] = None
+    ):
+        self.parent = list(range(n))
+        # DOI, entry type and dataset flag of each cluster, kept at its root
+        self.doi = list(dois) if dois is not None else [""] * n
+        self.type = list(types) if types is not None else [None] * n
+        self.dataset = list(datasets) if datasets is not None else [False] * n
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> bool:
+        i, j = self.find(i), self.find(j)
+        if i == j or self.conflict(i, j):
+            return False
+        root, child = min(i, j), max(i, j)
+        self.parent[child] = root
+        self.doi[root] = self.doi[root] or self.doi[child]
+        self.type[root] = self.type[root] or self.type[child]
+        self.dataset[root] = self.dataset[root] or self.dataset[child]
+        return True
+
+    def conflict(self, i: int, j: int) -> bool:
+        """
+        True when the clusters of i and j carry different DOIs
+        """
+        a, b = self.doi[self.find(i)], self.doi[self.find(j)]
+        return bool(a and b and a != b)
+
+    def kind_conflict(self, i: int, j: int) -> bool:
+        """
+        True when the clusters of i and j carry different entry types, or
+        only one of them is a dataset
+        """
+        i, j = self.find(i), self.find(j)
+        a, b = self.type[i], self.type[j]
+        return bool(a and b and a != b) or self.dataset[i] != self.dataset[j]
+
+
+def find_duplicates(
+    records: List[dict], threshold: float = TITLE_THRESHOLD
+) -> Tuple[UnionFind, List[dict]]:
+    """
+    Cluster the records, returns the clusters and the decisions
+    (pairs that were merged, with the reason)
+    """
+    dois = [normalize_doi(r.get("doi") or "") for r in records]
+    clusters = UnionFind(
+        len(records),
+        dois,
+        types=[_entry_type(r) for r in records],
+        datasets=[_is_dataset(r) for r in records],
+    )
+    decisions = []
+
+    first_with_doi: Dict[str, int] = {}
+    for i, doi in enumerate(dois):
+        if not doi:
+            continue
+        if doi in first_with_doi:
+            if clusters.union(first_with_doi[doi], i):
+                decisions.append({"a": first_with_doi[doi], "b": i, "reason": "doi"})
+        else:
+            first_with_doi[doi] = i
+
+    grams = [trigrams(r.get("title") or "") for r in records]
+    grams = [g if len(g) >= MIN_TRIGRAMS else set() for g in grams]
+    years = [_year(r) for r in records]
+    signatures = minhash(grams)
+    checked = set()
+    for i, j in lsh_candidates(signatures):
+        i, j = min(i, j), max(i, j)
+        if (i, j) in checked or not grams[i] or clusters.find(i) == clusters.find(j):
+            continue
+        checked.add((i, j))
+        if clusters.conflict(i, j) or clusters.kind_conflict(i, j):
+            continue
+        if years[i] and years[j] and abs(years[i] - years[j]) > MAX_YEAR_GAP:
+            continue
+        similarity = len(grams[i] & grams[j]) / len(grams[i] | grams[j])
+        if similarity >= threshold and clusters.union(i, j):
+            decisions.append(
+                {"a": i, "b": j, "reason": "title", "similarity": round(similarity, 3)}
+            )
+    return clusters, decisions
+
+
+def _filled(value) -> bool:
+    return value not in (None, "", [], {})
+
+
+def merge(records: List[dict]) -> dict:
+    """
+    The most complete record of a cluster, with its empty fields filled
+    from the other records
+    """
+    def completeness(item):
+        position, record = item
+        return (
+            not record.get("doi"),
+            -sum(_filled(v) for v in record.values()),
+            position,
+        )
+
+    ordered = [r for _, r in sorted(enumerate(records), key=completeness)]
+    canonical = dict(ordered[0])
+    for record in ordered[1:]:
+        for key, value in record.items():
+            if not _filled(canonical.get(key)) and _filled(value):
+                canonical[key] = value
+    return canonical
+
+
+def deduplicate(paths: List[str], threshold: float = TITLE_THRESHOLD) -> Tuple[List[dict], List[dict]]:
+    """
+    Canonical records (in input order of their first occurrence) and the
+    merge decisions
+    """
+    records, origins = [], []
+    for path in paths:
+        for position, record in enumerate(read_records(path)):
+            records.append(record)
+            origins.append({"source": path, "position": position})
+
+    clusters, decisions = find_duplicates(records, threshold)
+    members: Dict[int, List[int]] = {}
+    for i in range(len(records)):
+        members.setdefault(clusters.find(i), []).append(i)
+
+    corpus = [merge([records[i] for i in group]) for group in members.values()]
+
+    def describe(i):
+        return dict(origins[i], doi=records[i].get("doi"), title=records[i].get("title"))
+
+    for decision in decisions:
+        decision["a"], decision["b"] = describe(decision["a"]), describe(decision["b"])
+    return corpus, decisions
+
+
+def write_corpus(corpus: List[dict], path: str = CORPUS_PATH):
+    with open(path, "w", encoding="utf-8") as file:
+        for record in corpus:
+            file.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", help=".bib files and CORE json lines files")
+    parser.add_argument("-o", "--output", default=CORPUS_PATH)
+    parser.add_argument("--decisions", default=DECISIONS_PATH)
+    parser.add_argument("--threshold", type=float, default=TITLE_THRESHOLD)
+    args = parser.parse_args()
+
+    corpus, decisions = deduplicate(args.files, args.threshold)
+    write_corpus(corpus, args.output)
+    with open(args.decisions, "w", encoding="utf-8") as file:
+        json.dump(decisions, file, ensure_ascii=False, indent=1)
+    reasons = {r: sum(d["reason"] == r for d in decisions) for r in ("doi", "title")}
+    print(
+        f"[INFO] {len(corpus)} canonical records written to {args.output}, "
+        f"{reasons['doi']} merged on doi and {reasons['title']} on title ({args.decisions})"
+    )
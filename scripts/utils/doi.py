@@ -0,0 +1,80 @@
+import re
+import pandas as pd
+
+doi_reg = r'10\.\d+/[-\.;()/:\w]+'
+DOI_PATTERN = re.compile(doi_reg)
+
+# one pass over the citation: text before the doi, the marker that
+# introduced it (if any) and the doi itself
+CITATION_PATTERN = re.compile(
+    r"^(?P<residual_text>.*?)\s*"
+    r"(?P<marker>https?://(?:dx\.)?doi\.org/|doi:\s*)?"
+    r"(?P<doi>" + doi_reg + ")",
+    re.IGNORECASE | re.DOTALL,
+)
+DOI_SOURCES = {"doi.org/": "doi.org", "doi:": "doi:"}
+
+
+def normalize_doi(doi: str) -> str:
+    """
+    Lowercase a doi and drop punctuation that belongs to the sentence,
+    e.g. "10.2134/JEQ2019.04.0155." => "10.2134/jeq2019.04.0155"
+    """
+    doi = doi.strip().lower().rstrip(".,;:")
+    if doi.endswith(")") and doi.count("(") < doi.count(")"):
+        doi = doi[:-1].rstrip(".,;:")
+    return doi
+
+
+def ref_extract(reftext: str) -> dict:
+    """
+    Split a reference into its doi and the text before it,
+    {"doi": "", "text": reftext} when there is no doi
+    """
+    reftext = reftext.strip()
+    for prefix in ("doi:", "DOI:", "Doi:", "https://doi.org/"):
+        reftext = reftext.replace(prefix, "")
+
+    extract = {"doi": "", "text": ""}
+    m = re.findall(doi_reg, reftext)
+    if m:
+        extract["doi"] = m[0].strip()
+        extract["text"] = reftext.split(m[0])[0].strip()
+    else:
+        extract["text"] = reftext
+    return extract
+
+
+def extract_doi_frame(publications: pd.Series) -> pd.DataFrame:
+    """
+    Vectorized doi extraction over a column of free text citations.
+
+    Returns a DataFrame aligned with `publications` with the columns
+    doi: normalized doi or None
+    doi_source: "doi.org", "doi:", "bare" or "" when there is no doi
+    residual_text: the citation text before the doi
+    """
+    text = publications.fillna("").astype(str).str.strip()
+    found = text.str.extract(CITATION_PATTERN)
+    has_doi = found["doi"].notna()
+
+    doi = found["doi"].fillna("").str.lower().str.rstrip(".,;:")
+    unbalanced = doi.str.endswith(")") & (
+        doi.str.count(r"\(") < doi.str.count(r"\)")
+    )
+    doi = doi.where(~unbalanced, doi.str[:-1].str.rstrip(".,;:"))
+
+    marker = found["marker"].fillna("").str.lower().str.replace(
+        r"^https?://(?:dx\.)?", "", regex=True
+    )
+    marker = marker.str.replace(r"\s+", "", regex=True)
+    source = marker.map(DOI_SOURCES).fillna("bare").where(has_doi, "")
+
+    return pd.DataFrame(
+        {
+            "doi": doi.where(has_doi, None),
+            "doi_source": source,
+            "residual_text": found["residual_text"].where(has_doi, text).str.strip(),
+        },
+        index=publications.index,
+    )
@@ -1,19 +1,17 @@
 import sys
-import urllib.request
-from urllib.error import HTTPError
 import json
+from .bibtex_fetch import NOT_FOUND, fetch_bibtex_many
+from .record_store import RecordStore
+from .title_scoring import TitleScorer
 
-BASE_URL = 'http://dx.doi.org/'
+TITLE_MATCH = 0.9
 
 def load_ref_data():
     try:
-        file = open("ref_data.json", "r", errors = "ignore")
-        data = file.read()
-        file.close()
-        ref_data, missing_DOIs = [], []
-        ref_data = json.loads(data)
+        ref_data = RecordStore.open("ref_data.jsonl", legacy_json = "ref_data.json")
+        missing_DOIs = []
         
-        for iter, ref in enumerate(ref_data):
+        for iter, ref in ref_data.items():
             if ref["doi"] == "":
                 missing_DOIs.append(iter)
         return ref_data, missing_DOIs
@@ -21,35 +19,30 @@ def load_ref_data():
         print (str(e))
         exit(1)
  
-def get_bibtex(ref_data):
+def get_bibtex(ref_data, workers = 16):
+    # records lost from the store are skipped, the rest keep their index
+    refs = dict(ref_data.items())
     found_doi = [False for i in range(len(ref_data))]
-    for index in range(len(ref_data)):
-        if ref_data[index]["doi"] != "":
-            doi = ref_data[index]["doi"].split(";")[0]
-            if doi[-1] == ".":
-                doi = doi[:-1]
-            url = BASE_URL + doi
-            print (url)
-            
-            req = urllib.request.Request(url)
-            req.add_header('Accept', 'application/x-bibtex')
-            try:
-                with urllib.request.urlopen(req) as f:
-                    bibtex = f.read().decode()
-                try:
-                    title = bibtex.split("title = {")[1].split("}")[0]
-                    found_doi[index] = title.lower() in ref_data[index]["text"].lower()
-                    print (index, found_doi[index])
-                    if not found_doi[index]:
-                        print (title)
-                        print (ref_data[index]["text"])
-                except Exception as e:
-                    continue
-            except HTTPError as e:
-                if e.code == 404:
-                    print('DOI not found.')
-                else:
-                    print('Service unavailable.')
+    results = fetch_bibtex_many([ref["doi"] for ref in refs.values()], workers = workers)
+    for index, result in zip(refs, results):
+        if result is None:
+            continue
+        if result.status == NOT_FOUND:
+            print (index, 'DOI not found.')
+            continue
+        if not result.ok:
+            print (index, f'Service unavailable ({result.status}).')
+            continue
+        try:
+            title = result.bibtex.split("title = {")[1].split("}")[0]
+        except IndexError:
+            continue
+        text = refs[index]["text"]
+        found_doi[index] = TitleScorer(text).score(title) >= TITLE_MATCH
+        print (index, found_doi[index])
+        if not found_doi[index]:
+            print (title)
+            print (text)
             print ("#"*60)
     return found_doi
         
@@ -4,100 +4,62 @@ from requests.exceptions import Timeout
 import json
 from google import google
 import sys
-import urllib.request
-from urllib.error import HTTPError
-from pybtex.database import parse_string
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from . import metrics
+from .http_cache import CachedResponse, get_cache
+from .doi import doi_reg, ref_extract
+from .bib_parser import iter_entries
+from .bibtex_fetch import NOT_FOUND, clean_doi, fetch_bibtex_many
+from .rate_limit import TokenBucket
+from .record_store import RecordStore
 
 ref_data = []
 missing_DOIs = []
-doi_reg = r'10\.\d+/[-\.;()/:\w]+'
-BASE_URL = 'http://dx.doi.org/'
+REF_DATA_PATH = "ref_data.jsonl"
+BIBTEX_DATA_PATH = "bibtex_data.jsonl"
+
+def export_csv(records, filename):
+    # streams "doi,text" rows, commas inside the text become semicolons
+    with open(filename, "w") as file:
+        file.write("doi,text\n")
+        for ref in records:
+            doi = ref["doi"][:-1] if ref["doi"] != "" and ref["doi"][-1] == "." else ref["doi"]
+            file.write(doi + "," + ref["text"].replace(",", ";") + "\n")
+
+def _as_store(records, path):
+    if isinstance(records, RecordStore):
+        records.flush()
+        return records
+    # a plain list replaces the whole store
+    return RecordStore.replace(path, records)
 
-def ref_extract(reftext):
-    global doi_reg
-    
-    reftext = reftext.strip()
-    reftext = reftext.replace("doi:", "")
-    reftext = reftext.replace("DOI:", "")
-    reftext = reftext.replace("Doi:", "")
-    reftext = reftext.replace("https://doi.org/", "")
-    
-    extract = {"doi": "", "text": ""}
-    
-    m = re.findall(doi_reg, reftext)
-    if m:
-        extract["doi"] = m[0].strip()
-        extract["text"] = reftext.split(m[0])[0].strip()
-    else:
-        extract["text"] = reftext
-        
-    return extract
-    
 def save_ref_data(ref_data, csv = False):
-    file = open("ref_data.json", "w")
-    file.write(json.dumps(ref_data, indent = 2))
-    file.close()
-    
+    ref_data = _as_store(ref_data, REF_DATA_PATH)
     if csv:
-        data = "doi,text\n"
-        for ref in ref_data:
-            if ref["doi"] != "" and ref["doi"][-1] == ".":
-                data = data + ref["doi"][:-1] + "," + ref["text"].replace(",", ";") + "\n"
-            else:
-                data = data + ref["doi"] + "," + ref["text"].replace(",", ";") + "\n"
-        file = open("ref_data.csv", "w")
-        file.write(data)
-        file.close()
+        export_csv(ref_data, "ref_data.csv")
+    return ref_data
         
 def save_bibtex_data(bibtex_data, csv = False):
-    file = open("bibtex_data.json", "w")
-    file.write(json.dumps(bibtex_data, indent = 2))
-    file.close()
-    """
+    bibtex_data = _as_store(bibtex_data, BIBTEX_DATA_PATH)
     if csv:
-        data = "doi,bibtex,text\n"
-        for item in bibtex_data:
-            if item["doi"] != "" and item["doi"][-1] == ".":
-                data = data + item["doi"][:-1] + "," + item["bibtex"].replace(",", ";") + "," + item["text"].replace(",", ";") + "\n"
-            else:
-                data = data + item["doi"] + "," + item["bibtex"].replace(",", ";") + "," + item["text"].replace(",", ";") + "\n"
-        file = open("bibtex_data.csv", "w", encoding="utf-8")
-        file.write(data)
-        file.close()
-    """
-    if csv:
-        data = "doi,text\n"
-        for ref in bibtex_data:
-            if ref["doi"] != "" and ref["doi"][-1] == ".":
-                data = data + ref["doi"][:-1] + "," + ref["text"].replace(",", ";") + "\n"
-            else:
-                data = data + ref["doi"] + "," + ref["text"].replace(",", ";") + "\n"
-        file = open("ref_data.csv", "w")
-        file.write(data)
-        file.close()
+        export_csv(bibtex_data, "ref_data.csv")
+    return bibtex_data
         
 def load_bibtex_data():
     try:
-        file = open("bibtex_data.json", "r", errors = "ignore")
-        data = file.read()
-        file.close()
-        bibtex_data = []
-        bibtex_data = json.loads(data)
-        
-        return bibtex_data
+        return RecordStore.open(BIBTEX_DATA_PATH, legacy_json = "bibtex_data.json")
     except Exception as e:
         print (str(e))
         exit(1)
         
 def load_ref_data():
     try:
-        file = open("ref_data.json", "r", errors = "ignore")
-        data = file.read()
-        file.close()
-        ref_data, missing_DOIs = [], []
-        ref_data = json.loads(data)
+        ref_data = RecordStore.open(REF_DATA_PATH, legacy_json = "ref_data.json")
+        missing_DOIs = []
         
-        for iter, ref in enumerate(ref_data):
+        for iter, ref in ref_data.items():
             if ref["doi"] == "":
                 missing_DOIs.append(iter)
         return ref_data, missing_DOIs
@@ -105,6 +67,7 @@ def load_ref_data():
         print (str(e))
         exit(1)
         
+@metrics.timed(items = lambda result, *args, **kwargs: len(result[0]))
 def read_ref_data(filename):
     # reads new references from a file
     try:
@@ -123,94 +86,160 @@ def read_ref_data(filename):
         ref_data.append(extract)
         if extract["doi"] == "":
             missing_DOIs.append(iter)  
-    save_ref_data(ref_data)
+    ref_data = save_ref_data(ref_data)
     return ref_data, missing_DOIs
     
-def doi_search(ref_data, missing_DOIs, num_page = 1, num_links = 2):
-    try:
-        for iter, index in enumerate(missing_DOIs):
+_local = threading.local()
+_host_slots = {}
+_host_lock = threading.Lock()
+doi_bytes_reg = re.compile(doi_reg.encode())
+SCAN_CHUNK = 16 * 1024
+SCAN_MAX_BYTES = 4 * 1024 * 1024
+# google blocks clients that search faster than this
+SEARCHES_PER_SECOND = 0.2
+
+def _session():
+    # one keep-alive session per worker thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+def _host_slot(url, per_host):
+    host = urlparse(url).netloc
+    with _host_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(per_host)
+        return _host_slots[host]
+
+def scan_link_for_doi(link, per_host = 2, timeout = (5, 10)):
+    """
+    Stream a page and return the first DOI in it, without downloading
+    the rest of the page once a DOI is found. Scan results are kept in
+    the response cache, so a link is only downloaded once.
+    """
+    cache = get_cache()
+    key = None if cache.bypass else cache.key("SCAN", link)
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.content.decode() or None
+
+    doi = None
+    with _host_slot(link, per_host):
+        with _session().get(link, verify = False, timeout = timeout, stream = True) as r:
+            buffer = b""
+            read = 0
+            for chunk in r.iter_content(SCAN_CHUNK):
+                buffer += chunk
+                read += len(chunk)
+                match = doi_bytes_reg.search(buffer)
+                # a match touching the end of the buffer may be cut off
+                if match and match.end() < len(buffer):
+                    doi = match.group(0).decode()
+                    break
+                if read >= SCAN_MAX_BYTES:
+                    break
+                # keep a tail so DOIs spanning two chunks are found
+                buffer = buffer[-256:]
+            else:
+                match = doi_bytes_reg.search(buffer)
+                doi = match.group(0).decode() if match else None
+
+    if key is not None:
+        cache.put(key, CachedResponse(link, 200, {}, (doi or "").encode()))
+    return doi
+
+def _search_one(text, num_page, num_links, per_host, bucket):
+    bucket.acquire_sync()
+    search_results = google.search(text, num_page)
+    links = []
+    for result in search_results:
+        if result and result.link[-4:] in [".pdf", ".xls"]:
+            continue
+        if result:
+            links.append(result.link)
+        if len(links) == num_links:
+            break
+    for link in links:
+        try:
+            doi = scan_link_for_doi(link, per_host)
+        except Exception:
+            print('Something went wrong in http request. Skipping')
+            continue
+        if doi:
+            return doi
+    return None
+
+@metrics.timed(items = lambda result, ref_data, missing_DOIs, *args, **kwargs: len(missing_DOIs))
+def doi_search(ref_data, missing_DOIs, num_page = 1, num_links = 2, workers = 8, per_host = 2, save_every = 25,
+               searches_per_second = SEARCHES_PER_SECOND):
+    """
+    Search Google for the references without a DOI and scan the first
+    `num_links` result pages for one. References are searched by `workers`
+    threads with at most `per_host` concurrent downloads per host, and
+    ref_data is saved every `save_every` DOIs found and once at the end.
+    The Google searches of all workers share one token bucket of
+    `searches_per_second`, only the page scans run in parallel.
+    """
+    found = 0
+    bucket = TokenBucket(searches_per_second, capacity = 1)
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = {
+            executor.submit(_search_one, ref_data[index]["text"], num_page, num_links, per_host, bucket): index
+            for index in missing_DOIs
+        }
+        for iter, future in enumerate(as_completed(futures)):
+            index = futures[future]
             try:
-                print (f"{iter} Searching Google for article at index {index}...")
-                #print (ref_data[index]["text"])
-                search_results = google.search(ref_data[index]["text"], num_page)
-                print (f"{len(search_results)} results found")
-                c = 0
-                for result in search_results:
-                    if result and result.link[-4:] in [".pdf", ".xls"]:
-                        print ("PDF encountered and ignored")
-                        continue
-                    print (f"Searching link {c+1} for the DOI...")
-                    print (result.link[-10:])
-                    try:
-                        html = requests.get(result.link, verify = False, timeout=(5, 10))
-                        matches = re.findall(doi_reg, html.text)
-                        if matches:
-                            ref_data[index]["doi"] = matches[0]
-                            save_ref_data(ref_data)
-                            print (f"DOI found: {matches[0]} and saved!")
-                            break
-                    except Exception:
-                        print('Something went wrong in http request. Skipping')
-                        continue
-                    c += 1
-                    if c == num_links:
-                        break
-                print ("#"*90)
+                doi = future.result()
             except Exception as e:
                 print (str(e))
                 continue
-    except Exception as e:
-        print (str(e))
-        exit(1)
+            if doi:
+                ref = ref_data[index]
+                ref["doi"] = doi
+                ref_data[index] = ref
+                found += 1
+                print (f"{iter} DOI found for article at index {index}: {doi}")
+                if found % save_every == 0:
+                    save_ref_data(ref_data)
+            else:
+                print (f"{iter} No DOI found for article at index {index}")
+    save_ref_data(ref_data)
+    print (f"{found} DOIs found for {len(missing_DOIs)} references")
+    return ref_data
         
-def get_bibtex(ref_data):
+@metrics.timed()
+def get_bibtex(ref_data, workers = 16):
+    # all dois are fetched concurrently, results come back in ref_data order
+    dois = [ref["doi"] if ref["doi"] != "" and ref["text"] != 0 else "" for ref in ref_data]
+    results = fetch_bibtex_many(dois, workers = workers)
     bibtex_data = []
-    found_doi = [False for i in range(len(ref_data))]
-    for index in range(len(ref_data)):
-        print (index)
+    for index, ref in enumerate(ref_data):
         bibtex_data.append({
             "doi": "",
-            "text": ref_data[index]["text"],
+            "text": ref["text"],
             "bibtex": ""
         })
-        if ref_data[index]["doi"] != "" and ref_data[index]["text"] != 0:
-            doi = ref_data[index]["doi"].split(";")[0]
-            if doi[-1] == ".":
-                doi = doi[:-1]
-            url = BASE_URL + doi
-            
-            req = urllib.request.Request(url)
-            req.add_header('Accept', 'application/x-bibtex')
-            try:
-                with urllib.request.urlopen(req) as f:
-                    bibtex = f.read().decode()
-                bibtex_data[index]["doi"] = doi
-                bibtex_data[index]["bibtex"] = bibtex
-            except HTTPError as e:
-                if e.code == 404:
-                    print('DOI not found.')
-                else:
-                    print('Service unavailable.')
-            print ("#"*60)
+        result = results[index]
+        if result is None:
+            continue
+        if result.ok:
+            bibtex_data[index]["doi"] = clean_doi(dois[index])
+            bibtex_data[index]["bibtex"] = result.bibtex
+        elif result.status == NOT_FOUND:
+            print (index, 'DOI not found.')
+        else:
+            print (index, f'Service unavailable ({result.status}).')
     return bibtex_data
     
 def bibtex_to_dict(bibtex):
-    try:
-        bibdict = {}
-        #['doi', 'url', 'year', 'month', 'publisher', 'pages', 'title', 'journal', 'volume', 'number', 'booktitle', 'keywords']
-        bibtex = parse_string(bibtex, bib_format = "bibtex")
-        entry = bibtex.entries.values()[0]
-        
-        for field in entry.fields.keys():
-            bibdict[field] = entry.fields[field]
-        
-        for key in entry.persons.keys():
-            bibdict[key] = []
-            for people in entry.persons[key]:
-                bibdict[key].append(str(people))
-    except Exception as e:
-        pass
-    return bibdict
+    #['doi', 'url', 'year', 'month', 'publisher', 'pages', 'title', 'journal', 'volume', 'number', 'booktitle', 'keywords']
+    for entry in iter_entries(bibtex.encode(), persons = True):
+        entry.pop("ENTRYTYPE")
+        entry.pop("ID")
+        return entry
+    return {}
     
 def bibdict_to_CORE(bibdict, coreId):
     CORE = {
@@ -0,0 +1,254 @@
+import numpy as np
+from typing import Tuple
+
+MAX_DEPTH = 16
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """
+    Put a zero bit between the 16 low bits of every value
+    """
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+
+class QuadTree:
+    """
+    Quadtree of weighted points stored level by level in flat arrays.
+
+    Points are sorted by their Morton (z-order) code, so every cell is a
+    contiguous range [start, end) of the sorted points and the children of
+    a cell are a contiguous range of the cells one level down. The tree is
+    built with a handful of numpy passes per level, there is no Python
+    loop over points.
+
+    Args:
+    pos: (n, 2) positions
+    mass: (n,) weights
+    max_depth: depth at which cells become leaves even if they hold
+        several (coincident) points
+    """
+
+    def __init__(self, pos: np.ndarray, mass: np.ndarray, max_depth: int = MAX_DEPTH):
+        n = len(pos)
+        low = pos.min(axis=0)
+        size = max(float((pos.max(axis=0) - low).max()), 1e-9) * (1 + 1e-9)
+        cells = np.floor((pos - low) / size * (1 << max_depth)).astype(np.int64)
+        cells = np.clip(cells, 0, (1 << max_depth) - 1)
+        codes = _spread_bits(cells[:, 0]) | (_spread_bits(cells[:, 1]) << np.uint64(1))
+
+        self.order = np.argsort(codes, kind="stable")
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.order] = np.arange(n)
+        codes = codes[self.order]
+        sorted_mass = mass[self.order]
+        weighted = pos[self.order] * sorted_mass[:, None]
+
+        starts, ends, masses, centers, sizes, leaves, children = [], [], [], [], [], [], []
+        offset = 0
+        level_starts = np.array([0])
+        for level in range(max_depth + 1):
+            if level > 0:
+                prefix = codes >> np.uint64(2 * (max_depth - level))
+                level_starts = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+            level_ends = np.r_[level_starts[1:], n]
+            cell_mass = np.add.reduceat(sorted_mass, level_starts)
+            center = np.add.reduceat(weighted, level_starts, axis=0) / cell_mass[:, None]
+            leaf = (level_ends - level_starts == 1) | (level == max_depth)
+
+            starts.append(level_starts)
+            ends.append(level_ends)
+            masses.append(cell_mass)
+            centers.append(center)
+            sizes.append(np.full(len(level_starts), size / (1 << level)))
+            leaves.append(leaf)
+            children.append((level, offset, level_starts, level_ends))
+            offset += len(level_starts)
+            if leaf.all():
+                break
+
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.mass = np.concatenate(masses)
+        self.center = np.concatenate(centers)
+        self.size = np.concatenate(sizes)
+        self.leaf = np.concatenate(leaves)
+
+        # children of level l cells are the level l + 1 cells inside their range
+        self.first_child = np.zeros(offset, dtype=np.int64)
+        self.n_children = np.zeros(offset, dtype=np.int64)
+        for (_, level_offset, level_starts, level_ends), below in zip(
+            children, children[1:]
+        ):
+            _, below_offset, below_starts, _ = below
+            first = np.searchsorted(below_starts, level_starts)
+            last = np.searchsorted(below_starts, level_ends)
+            cells = slice(level_offset, level_offset + len(level_starts))
+            self.first_child[cells] = below_offset + first
+            self.n_children[cells] = last - first
+        self.n_children[self.leaf] = 0
+
+
+def _add_repulsion(force, pos, mass, coefficient, points, others, other_mass):
+    """
+    Add the repulsion of bodies at `others` on `points`, coincident bodies
+    do not push each other (as in Gephi)
+    """
+    delta = pos[points] - others
+    distance2 = (delta ** 2).sum(axis=1)
+    valid = distance2 > 0
+    factor = coefficient * mass[points[valid]] * other_mass[valid] / distance2[valid]
+    for axis in (0, 1):
+        force[:, axis] += np.bincount(
+            points[valid], weights=delta[valid, axis] * factor, minlength=len(pos)
+        )
+
+
+def barnes_hut_repulsion(
+    pos: np.ndarray, mass: np.ndarray, coefficient: float, theta: float = 1.2
+) -> np.ndarray:
+    """
+    ForceAtlas2 repulsion k * m_i * m_j / d on every point, approximated
+    with Barnes-Hut: a cell is used as a whole when size / distance < theta.
+
+    All points walk the tree together: the (point, cell) pairs still to
+    visit are kept in two arrays, accepted pairs are summed and the rest
+    are replaced by the pairs of the cells' children, O(n log n) overall.
+    """
+    n = len(pos)
+    tree = QuadTree(pos, mass)
+    force = np.zeros((n, 2))
+    points = np.arange(n)
+    cells = np.zeros(n, dtype=np.int64)
+
+    while len(points):
+        inside = (tree.rank[points] >= tree.start[cells]) & (
+            tree.rank[points] < tree.end[cells]
+        )
+        leaf = tree.leaf[cells]
+        delta = pos[points] - tree.center[cells]
+        distance2 = (delta ** 2).sum(axis=1)
+        far = ~inside & (tree.size[cells] ** 2 < theta ** 2 * distance2)
+        accept = leaf | far
+
+        # a leaf holding the point itself is either just the point or a
+        # bunch of (nearly) coincident points, which act one by one
+        own = leaf & inside
+        sources, others = points[accept & ~own], tree.center[cells[accept & ~own]]
+        other_mass = tree.mass[cells[accept & ~own]]
+        if own.any():
+            counts = tree.end[cells[own]] - tree.start[cells[own]]
+            steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            near = tree.order[np.repeat(tree.start[cells[own]], counts) + steps]
+            own_points = np.repeat(points[own], counts)
+            keep = near != own_points
+            sources = np.r_[sources, own_points[keep]]
+            others = np.r_[others, pos[near[keep]]]
+            other_mass = np.r_[other_mass, mass[near[keep]]]
+        _add_repulsion(force, pos, mass, coefficient, sources, others, other_mass)
+
+        points, cells = points[~accept], cells[~accept]
+        counts = tree.n_children[cells]
+        total = counts.sum()
+        steps = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        points = np.repeat(points, counts)
+        cells = np.repeat(tree.first_child[cells], counts) + steps
+    return force
+
+
+def force_atlas2(
+    edges: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    n_nodes: int,
+    pos: np.ndarray = None,
+    iterations: int = 300,
+    scaling: float = 2.0,
+    gravity: float = 1.0,
+    strong_gravity: bool = False,
+    edge_weight_influence: float = 1.0,
+    jitter_tolerance: float = 1.0,
+    theta: float = 1.2,
+    seed: int = 0,
+    fixed: np.ndarray = None,
+) -> np.ndarray:
+    """
+    ForceAtlas2 layout (Jacomy et al. 2014) with Barnes-Hut repulsion and
+    the adaptive speed of Gephi's implementation.
+
+    Args:
+    edges: (source, target, weight) arrays of an undirected graph, every
+        edge once
+    n_nodes: number of nodes, node masses are degree + 1
+    pos: (n, 2) start positions, e.g. the previous layout; random if None
+    iterations: number of steps, a warm start needs far fewer
+    fixed: boolean mask of nodes that push and pull but do not move
+    Returns:
+    (n, 2) positions
+    """
+    source, target, weight = edges
+    weight = np.asarray(weight, dtype=float) ** edge_weight_influence
+    mass = 1.0 + np.bincount(source, minlength=n_nodes) + np.bincount(
+        target, minlength=n_nodes
+    )
+    if pos is None:
+        rng = np.random.default_rng(seed)
+        pos = rng.uniform(-1, 1, size=(n_nodes, 2)) * np.sqrt(n_nodes) * 10
+    pos = np.array(pos, dtype=float)
+    if n_nodes < 2:
+        return pos
+
+    speed, speed_efficiency = 1.0, 1.0
+    old_force = np.zeros_like(pos)
+    for _ in range(iterations):
+        force = barnes_hut_repulsion(pos, mass, scaling, theta)
+
+        # linear attraction along the edges
+        delta = (pos[source] - pos[target]) * weight[:, None]
+        for axis in (0, 1):
+            force[:, axis] -= np.bincount(source, weights=delta[:, axis], minlength=n_nodes)
+            force[:, axis] += np.bincount(target, weights=delta[:, axis], minlength=n_nodes)
+
+        distance = np.sqrt((pos ** 2).sum(axis=1))
+        if strong_gravity:
+            force -= pos * (gravity * mass)[:, None]
+        else:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                pull = np.where(distance > 0, gravity * mass / distance, 0.0)
+            force -= pos * pull[:, None]
+
+        if fixed is not None:
+            force[fixed] = 0
+
+        # adaptive global speed
+        swinging = mass * np.sqrt(((force - old_force) ** 2).sum(axis=1))
+        traction = mass * np.sqrt(((force + old_force) ** 2).sum(axis=1)) / 2
+        total_swinging, total_traction = swinging.sum(), traction.sum()
+
+        optimal_jitter = 0.05 * np.sqrt(n_nodes)
+        jitter = jitter_tolerance * max(
+            np.sqrt(optimal_jitter),
+            min(10.0, optimal_jitter * total_traction / n_nodes ** 2),
+        )
+        if total_traction > 0 and total_swinging / total_traction > 2.0:
+            if speed_efficiency > 0.05:
+                speed_efficiency *= 0.5
+            jitter = max(jitter, jitter_tolerance)
+        target_speed = (
+            jitter * speed_efficiency * total_traction / total_swinging
+            if total_swinging > 0
+            else speed
+        )
+        if total_swinging > jitter * total_traction:
+            if speed_efficiency > 0.05:
+                speed_efficiency *= 0.7
+        elif speed < 1000:
+            speed_efficiency *= 1.3
+        speed += min(target_speed - speed, 0.5 * speed)
+
+        factor = speed / (1 + np.sqrt(speed * swinging))
+        pos += force * factor[:, None]
+        old_force = force
+    return pos
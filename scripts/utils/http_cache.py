@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+from typing import Dict, Optional
+from . import metrics
+from .paths import in_root
+
+DEFAULT_CACHE_PATH = os.environ.get("GWF_HTTP_CACHE") or in_root(".http_cache.sqlite")
+DEFAULT_TTL = 30 * 24 * 3600  # 30 days
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# doi.org answers 404 for unknown DOIs, which is as stable as a 200
+CACHEABLE_STATUS = (200, 404)
+
+
+def encode_json(json_body, headers: dict = None):
+    """
+    Serialize a JSON request body deterministically so equal bodies share a key
+    """
+    data = json.dumps(json_body, sort_keys=True).encode()
+    headers = dict(headers or {}, **{"Content-Type": "application/json"})
+    return data, headers
+
+
+class CachedResponse:
+    """
+    Minimal stand-in for `requests.Response` returned by every cached call,
+    whether it was served from disk or from the network.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        headers: Dict[str, str],
+        content: bytes,
+        from_cache: bool = False,
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        content_type = self.headers.get("Content-Type", "")
+        encoding = "utf-8"
+        if "charset=" in content_type:
+            encoding = content_type.split("charset=")[-1].split(";")[0].strip()
+        try:
+            return self.content.decode(encoding, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseCache:
+    """
+    Persistent HTTP response cache backed by SQLite.
+
+    Entries are addressed by the sha256 of the request (method, url, query
+    parameters, content-negotiation headers and body), expire after `ttl`
+    seconds and are evicted least-recently-used first once the stored bodies
+    exceed `max_bytes`. With `bypass=True` every call goes to the network and
+    nothing is read from or written to disk.
+
+    Args:
+    path: sqlite database file
+    ttl: time to live of an entry in seconds
+    max_bytes: size budget for the stored response bodies
+    bypass: skip the cache entirely
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        bypass: bool = False,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._bytes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, "
+                "body BLOB, size INTEGER, created REAL, accessed REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+            row = self._conn.execute("SELECT SUM(size) FROM responses").fetchone()
+            self._bytes = row[0] or 0
+        return self._conn
+
+    @staticmethod
+    def key(
+        method: str,
+        url: str,
+        params: dict = None,
+        headers: dict = None,
+        body: bytes = None,
+    ) -> str:
+        accept = (headers or {}).get("Accept", "")
+        parts = [
+            method.upper(),
+            url.strip(),
+            json.dumps(params or {}, sort_keys=True, default=str),
+            accept,
+        ]
+        digest = hashlib.sha256("\n".join(parts).encode())
+        if body:
+            digest.update(body)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT url, status, headers, body, created FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            now = time.time()
+            if row is None or now - row[4] > self.ttl:
+                if row is not None:
+                    self._delete(conn, key)
+                self.misses += 1
+                metrics.count_cache_lookup(False)
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+        metrics.count_cache_lookup(True)
+        return CachedResponse(row[0], row[1], json.loads(row[2]), row[3], True)
+
+    def put(self, key: str, response: CachedResponse):
+        size = len(response.content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            conn = self._connect()
+            self._delete(conn, key)
+            now = time.time()
+            conn.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    response.url,
+                    response.status_code,
+                    json.dumps(response.headers),
+                    response.content,
+                    size,
+                    now,
+                    now,
+                ),
+            )
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+
+    def _delete(self, conn: sqlite3.Connection, key: str):
+        row = conn.execute(
+            "SELECT size FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bytes -= row[0]
+
+    def _evict(self, conn: sqlite3.Connection):
+        """
+        Drop least recently used entries until the cache fits in max_bytes
+        """
+        cursor = conn.execute("SELECT key, size FROM responses ORDER BY accessed")
+        evicted = []
+        for key, size in cursor:
+            if self._bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._bytes -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def lookup(
+        self,
+        method: str,
+        url: str,
+        params: dict = None,
+        headers: dict = None,
+        data: bytes = None,
+    ):
+        """
+        Returns the cache key of a request and the cached response, if any.
+        The key is None when the cache is bypassed.
+        """
+        if self.bypass:
+            return None, None
+        key = self.key(method, url, params, headers, data)
+        return key, self.get(key)
+
+    def fetch(
+        self,
+        key: Optional[str],
+        method: str,
+        url: str,
+        params: dict = None,
+        headers: dict = None,
+        data: bytes = None,
+        session: requests.Session = None,
+        **kwargs,
+    ) -> CachedResponse:
+        """
+        Hit the network and store the response under `key`
+        """
+        session = session or requests
+        start = time.perf_counter()
+        try:
+            r = session.request(
+                method, url.strip(), params=params, headers=headers, data=data, **kwargs
+            )
+        except requests.RequestException as e:
+            metrics.observe_request(url, type(e).__name__, time.perf_counter() - start)
+            raise
+        metrics.observe_request(url, r.status_code, time.perf_counter() - start)
+        response = CachedResponse(r.url, r.status_code, dict(r.headers), r.content)
+        if key is not None and r.status_code in CACHEABLE_STATUS:
+            self.put(key, response)
+        return response
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        params: dict = None,
+        headers: dict = None,
+        data: bytes = None,
+        json_body=None,
+        session: requests.Session = None,
+        **kwargs,
+    ) -> CachedResponse:
+        """
+        Perform an HTTP request through the cache.
+        Extra keyword arguments (e.g. timeout) are passed to `requests`.
+        """
+        if json_body is not None:
+            data, headers = encode_json(json_body, headers)
+
+        key, cached = self.lookup(method, url, params, headers, data)
+        if cached is not None:
+            return cached
+        return self.fetch(
+            key, method, url, params, headers, data, session=session, **kwargs
+        )
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": self._bytes,
+        }
+
+
+_cache = None
+
+
+def get_cache() -> ResponseCache:
+    """
+    Process-wide cache shared by all fetch helpers. Set GWF_HTTP_CACHE_BYPASS=1
+    to disable it without touching code.
+    """
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            bypass=os.environ.get("GWF_HTTP_CACHE_BYPASS", "") not in ("", "0")
+        )
+    return _cache
+
+
+def configure(**kwargs) -> ResponseCache:
+    """
+    Replace the shared cache, e.g. configure(path="/tmp/cache.sqlite", bypass=True)
+    """
+    global _cache
+    _cache = ResponseCache(**kwargs)
+    return _cache
+
+
+def cached_get(url: str, params: dict = None, headers: dict = None, **kwargs):
+    return get_cache().request("GET", url, params=params, headers=headers, **kwargs)
+
+
+def cached_post(url: str, json_body=None, params: dict = None, **kwargs):
+    return get_cache().request(
+        "POST", url, params=params, json_body=json_body, **kwargs
+    )
@@ -0,0 +1,300 @@
+"""
+Lightweight metrics for the pipeline stages.
+
+Metrics are off unless GWF_METRICS names an output file (or `configure`
+is called). When off, every hook returns after a single flag check. When
+on, the process keeps
+
+    stage_seconds{stage}              histogram of the calls of a stage
+    stage_items_total{stage}          items handled (len of the result)
+    http_requests_total{host,status}  requests that reached the network
+    http_request_seconds{host}        histogram of their latency
+    http_retries_total{host}          retries scheduled by the retry policy
+    cache_lookups_total{result}       response cache hits and misses
+
+and writes them at exit: Prometheus text format if the file ends with
+.prom (for the node exporter's textfile collector), JSON lines otherwise.
+Items/sec of a stage is stage_items_total / stage_seconds_sum.
+
+GWF_PROFILE=bibtex_to_CORE.convert,... (or "all") profiles those stages
+with cProfile, or pyinstrument when GWF_PROFILER=pyinstrument, into
+GWF_PROFILE_DIR (default "profiles").
+
+GWF_METRICS=metrics.prom python -m scripts.GenerateBibtex.bib_gen
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms, keyed by name and
+    labels
+    """
+
+    def __init__(self):
+        self.counters: Dict[_Key, float] = {}
+        self.histograms: Dict[_Key, Histogram] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> _Key:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def to_jsonl(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append({"name": name, "type": "counter", "labels": dict(labels), "value": value})
+            for (name, labels), h in sorted(self.histograms.items()):
+                lines.append(
+                    {
+                        "name": name,
+                        "type": "histogram",
+                        "labels": dict(labels),
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "buckets": dict(zip(map(str, h.buckets + ("+Inf",)), h.counts)),
+                    }
+                )
+        return "".join(json.dumps(line) + "\n" for line in lines)
+
+    def to_prometheus(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines, typed = [], set()
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE gwf_{name} counter")
+                    typed.add(name)
+                lines.append(f"gwf_{name}{fmt(labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE gwf_{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(f"gwf_{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"gwf_{name}_sum{fmt(labels)} {h.sum}")
+                lines.append(f"gwf_{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_jsonl()
+        # write then rename, so a textfile collector never reads half a file
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(path + ".tmp", path)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _State:
+    enabled = False
+    metrics: Optional[Metrics] = None
+    path: Optional[str] = None
+    profile: frozenset = frozenset()
+    profile_dir = "profiles"
+    profiler = "cprofile"
+    profilers: Dict[str, object] = {}
+    profiling = False
+    registered = False
+
+
+_state = _State()
+
+
+def configure(
+    path: str = None,
+    profile: List[str] = (),
+    profile_dir: str = "profiles",
+    profiler: str = "cprofile",
+) -> Metrics:
+    """
+    Turn metrics on, `path` is written at exit when given
+    """
+    _state.metrics = _state.metrics or Metrics()
+    _state.enabled = True
+    _state.path = path
+    _state.profile = frozenset(profile)
+    _state.profile_dir = profile_dir
+    _state.profiler = profiler
+    if not _state.registered:
+        atexit.register(write)
+        _state.registered = True
+    return _state.metrics
+
+
+def enabled() -> bool:
+    return _state.enabled
+
+
+def get_metrics() -> Optional[Metrics]:
+    return _state.metrics if _state.enabled else None
+
+
+def write():
+    """
+    Write the metrics file and the profiles, also called at exit
+    """
+    if not _state.enabled:
+        return
+    if _state.path:
+        _state.metrics.write(_state.path)
+    for name, profiler in list(_state.profilers.items()):
+        os.makedirs(_state.profile_dir, exist_ok=True)
+        if _state.profiler == "pyinstrument":
+            with open(os.path.join(_state.profile_dir, name + ".html"), "w") as file:
+                file.write(profiler.output_html())
+        else:
+            profiler.dump_stats(os.path.join(_state.profile_dir, name + ".prof"))
+
+
+def _profiler(name: str):
+    # only one profiler can run at a time, nested stages are part of the outer one
+    if _state.profiling or (name not in _state.profile and "all" not in _state.profile):
+        return None
+    if name not in _state.profilers:
+        if _state.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+
+            _state.profilers[name] = Profiler()
+        else:
+            import cProfile
+
+            _state.profilers[name] = cProfile.Profile()
+    return _state.profilers[name]
+
+
+class _StageRun:
+    items = 0
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a block as one call of stage `name`, set `.items` on the yielded
+    object to count the items it handled
+    """
+    run = _StageRun()
+    if not _state.enabled:
+        yield run
+        return
+    profiler = _profiler(name)
+    if profiler is not None:
+        _state.profiling = True
+        # pyinstrument starts / stops, cProfile enables / disables
+        getattr(profiler, "enable", getattr(profiler, "start", None))()
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            getattr(profiler, "disable", getattr(profiler, "stop", None))()
+            _state.profiling = False
+        _state.metrics.observe("stage_seconds", elapsed, stage=name)
+        if run.items:
+            _state.metrics.inc("stage_items_total", run.items, stage=name)
+
+
+def _count_items(result, *args, **kwargs) -> int:
+    if isinstance(result, (str, bytes)) or not hasattr(result, "__len__"):
+        return 1
+    return len(result)
+
+
+def timed(name: str = None, items=_count_items):
+    """
+    Decorator recording every call of a function as stage `name` (the
+    module and function name by default). `items(result, *args, **kwargs)`
+    is the number of items handled, len() of the result unless it is a
+    single value.
+    """
+    def decorator(fn):
+        stage_name = name or f"{fn.__module__.split('.')[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return fn(*args, **kwargs)
+            with stage(stage_name) as run:
+                result = fn(*args, **kwargs)
+                run.items = items(result, *args, **kwargs)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def observe_request(url: str, status, seconds: float):
+    if not _state.enabled:
+        return
+    host = urlparse(url).netloc
+    _state.metrics.inc("http_requests_total", host=host, status=status)
+    _state.metrics.observe("http_request_seconds", seconds, host=host)
+
+
+def count_retry(url: str):
+    if _state.enabled:
+        _state.metrics.inc("http_retries_total", host=urlparse(url).netloc)
+
+
+def count_cache_lookup(hit: bool):
+    if _state.enabled:
+        _state.metrics.inc("cache_lookups_total", result="hit" if hit else "miss")
+
+
+if os.environ.get("GWF_METRICS") or os.environ.get("GWF_PROFILE"):
+    configure(
+        path=os.environ.get("GWF_METRICS") or None,
+        profile=[s for s in os.environ.get("GWF_PROFILE", "").split(",") if s],
+        profile_dir=os.environ.get("GWF_PROFILE_DIR", "profiles"),
+        profiler=os.environ.get("GWF_PROFILER", "cprofile"),
+    )
@@ -0,0 +1,14 @@
+"""
+Paths of the repository files, resolved against the repository root so
+the scripts work from any working directory.
+"""
+import os
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+
+def in_root(path: str) -> str:
+    """
+    `path` relative to the repository root, absolute paths are kept
+    """
+    return os.path.join(ROOT, path)
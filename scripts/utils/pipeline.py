@@ -0,0 +1,451 @@
+"""
+Build the site data from the publication spreadsheet in one command.
+
+The steps are stages of a DAG, a stage depends on the stages producing
+its inputs:
+
+    urls     spreadsheet           -> build/articles.csv (semantic scholar urls)
+    bib      build/articles.csv    -> build/publications_bibtex.bib
+    core     .bib                  -> build/CORES_formated.json
+    corpus   .bib                  -> build/publications_bibtex.corpus.json + shards (pubviz)
+    authors  .bib, spreadsheet     -> build/authors.json
+    graph    .bib, authors.json    -> build/force_atlas_new.gexf
+
+authors keeps the ids of the published data/authors.json and graph
+extends the published graph. Both read a copy of the published file in
+build/previous/, taken when it is missing (or with --refresh-previous),
+so publishing their own outputs does not make them run again.
+
+Every input, output and source file of a stage is hashed (sha256, reused
+while the file's size and mtime are unchanged) and the hashes of the last
+successful run are kept in build/.pipeline_state.json. A stage only runs
+again when one of these hashes or its parameters changed, or an output
+is missing or was modified. Stages whose dependencies are done run in
+parallel. --publish copies the outputs to where the site reads them
+(and rewrites the .corpus.msgpack of the published corpus). Paths in the
+repository are resolved against its root, whatever the working directory.
+
+python -m scripts.utils.pipeline --input data/gwf_2019_peer_review_articles.csv
+python -m scripts.utils.pipeline --publish
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
+from .paths import in_root
+
+SPREADSHEET = "data/gwf_2019_peer_review_articles.csv"
+BUILD_DIR = "build"
+STATE_FILE = ".pipeline_state.json"
+AUTHORS_TABLE = "data/authors.json"
+SITE_GEXF = "gwf_co_author_graph/file/data/force_atlas_new.gexf"
+CONFIG_PATH = "scripts/config/config.yaml"
+PREVIOUS_DIR = "previous"
+HASH_CHUNK = 1024 * 1024
+
+
+@dataclass
+class Stage:
+    """
+    One step of the pipeline
+
+    Args:
+    name: stage name
+    run: called with the stage once its inputs are up to date
+    inputs: files read by the stage
+    outputs: files written by the stage
+    code: source files of the stage, a change reruns it
+    params: settings of the stage, a change reruns it
+    """
+
+    name: str
+    run: Callable[["Stage"], None]
+    inputs: List[str]
+    outputs: List[str]
+    code: List[str] = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+
+
+class FileHashes:
+    """
+    sha256 of files, recomputed only when their size or mtime changed
+    """
+
+    def __init__(self, known: Dict[str, list] = None):
+        self.known = dict(known or {})
+        self._lock = threading.Lock()
+
+    def __call__(self, path: str) -> str:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            entry = self.known.get(path)
+        if entry is not None and entry[:2] == signature:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        with self._lock:
+            self.known[path] = signature + [digest.hexdigest()]
+        return digest.hexdigest()
+
+
+def _params_hash(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], build_dir: str = BUILD_DIR):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = os.path.join(in_root(build_dir), STATE_FILE)
+        self.state = {"stages": {}, "files": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                self.state = json.load(file)
+        self.hashes = FileHashes(self.state.get("files"))
+        self._lock = threading.Lock()
+
+        producers = {path: stage.name for stage in stages for path in stage.outputs}
+        self.deps = {
+            stage.name: sorted({producers[p] for p in stage.inputs if p in producers})
+            for stage in stages
+        }
+
+    def upstream(self, targets: List[str]) -> List[str]:
+        """
+        The targets and every stage they depend on, in dependency order
+        """
+        order, seen = [], set()
+
+        def visit(name, path=()):
+            if name in path:
+                raise ValueError(f"[ERROR] dependency cycle {' -> '.join(path + (name,))}")
+            if name in seen:
+                return
+            for dep in self.deps[name]:
+                visit(dep, path + (name,))
+            seen.add(name)
+            order.append(name)
+
+        for name in targets:
+            visit(name)
+        return order
+
+    def _signature(self, stage: Stage) -> dict:
+        return {
+            "inputs": {p: self.hashes(p) for p in stage.inputs + stage.code},
+            "params": _params_hash(stage.params),
+        }
+
+    def up_to_date(self, stage: Stage) -> bool:
+        recorded = self.state["stages"].get(stage.name)
+        if recorded is None or any(h is None for h in recorded["outputs"].values()):
+            return False
+        if set(recorded["outputs"]) != set(stage.outputs):
+            return False
+        if any(self.hashes(p) != h for p, h in recorded["outputs"].items()):
+            return False
+        signature = self._signature(stage)
+        return recorded["inputs"] == signature["inputs"] and recorded["params"] == signature["params"]
+
+    def _execute(self, stage: Stage):
+        missing = [p for p in stage.inputs if not os.path.exists(p)]
+        if missing:
+            raise FileNotFoundError(f"[ERROR] {stage.name}: missing inputs {missing}")
+        signature = self._signature(stage)
+        for path in stage.outputs:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        start = time.perf_counter()
+        stage.run(stage)
+        outputs = {p: self.hashes(p) for p in stage.outputs}
+        if any(h is None for h in outputs.values()):
+            raise FileNotFoundError(
+                f"[ERROR] {stage.name} did not write {[p for p, h in outputs.items() if h is None]}"
+            )
+        with self._lock:
+            self.state["stages"][stage.name] = dict(signature, outputs=outputs)
+            self.save()
+        print(f"[INFO] {stage.name} done in {time.perf_counter() - start:.1f}s")
+
+    def save(self):
+        with self.hashes._lock:
+            self.state["files"] = dict(self.hashes.known)
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.state, file, indent=1, sort_keys=True)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def run(self, targets: List[str] = None, force: List[str] = (), workers: int = 4, dry_run: bool = False) -> bool:
+        """
+        Bring the targets (all stages by default) up to date, returns False
+        if a stage failed
+        """
+        order = self.upstream(targets or list(self.stages))
+        status: Dict[str, str] = {}
+        pending = list(order)
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = [status.get(d) for d in self.deps[name]]
+                    if any(s in ("failed", "skipped") for s in deps):
+                        status[name] = "skipped"
+                        pending.remove(name)
+                        print(f"[ERROR] {name} skipped, a dependency failed")
+                    elif all(s in ("done", "fresh") for s in deps):
+                        pending.remove(name)
+                        stage = self.stages[name]
+                        # a dry run cannot know the new outputs of its dependencies
+                        rerun = name in force or (dry_run and "done" in deps)
+                        if not rerun and self.up_to_date(stage):
+                            status[name] = "fresh"
+                        elif dry_run:
+                            print(f"[INFO] {name} would run")
+                            status[name] = "done"
+                        else:
+                            print(f"[INFO] running {name}")
+                            running[pool.submit(self._execute, stage)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        status[name] = "done"
+                    except Exception as e:
+                        status[name] = "failed"
+                        print(f"[ERROR] {name} failed: {e}")
+        if not dry_run:
+            self.save()
+        fresh = [n for n in order if status[n] == "fresh"]
+        if fresh:
+            print(f"[INFO] up to date: {', '.join(fresh)}")
+        return all(s != "failed" and s != "skipped" for s in status.values())
+
+
+def _generate_bibtex():
+    from ..GenerateBibtex.bib_gen import GenerateBibtex
+
+    return GenerateBibtex(in_root(CONFIG_PATH))
+
+
+def run_urls(stage: Stage):
+    _generate_bibtex().fetch_semantic_scholar_url(stage.inputs[0], stage.outputs[0])
+
+
+def run_bib(stage: Stage):
+    _generate_bibtex().generate_bib(stage.outputs[0], input_file=stage.inputs[0])
+
+
+def run_core(stage: Stage):
+    from .bibtex_to_CORE import convert
+
+    # convert appends, a rerun starts from an empty file
+    if os.path.exists(stage.outputs[0]):
+        os.remove(stage.outputs[0])
+    convert(stage.inputs, stage.outputs[0])
+
+
+def run_corpus(stage: Stage):
+    from .build_corpus import build_corpus, write_shards
+
+    write_shards(build_corpus(stage.inputs[0]), stage.outputs[0])
+
+
+def run_authors(stage: Stage):
+    from .authors import build_index
+
+    # ids of the published table are kept
+    index = build_index(stage.inputs[:2], table=stage.params["table"])
+    index.save(stage.outputs[0])
+
+
+def run_graph(stage: Stage):
+    from .authors import AuthorIndex
+    from .coauthor_graph import build, write_gexf
+
+    bib, table = stage.inputs[:2]
+    previous = stage.params["previous"]
+    graph = build(
+        [bib],
+        previous if previous and os.path.exists(previous) else None,
+        authors=AuthorIndex.load(table),
+    )
+    write_gexf(stage.outputs[0], graph["nodes"], graph["edges"])
+
+
+def snapshot_previous(build_dir: str = BUILD_DIR, refresh: bool = False) -> Dict[str, str]:
+    """
+    Copy the published author table and graph to build/previous/ unless
+    they are there already (or `refresh`), returns their paths
+    """
+    previous_dir = os.path.join(in_root(build_dir), PREVIOUS_DIR)
+    paths = {}
+    for name, published in (("authors.json", AUTHORS_TABLE), ("force_atlas_new.gexf", SITE_GEXF)):
+        path = paths[name] = os.path.join(previous_dir, name)
+        if os.path.exists(in_root(published)) and (refresh or not os.path.exists(path)):
+            os.makedirs(previous_dir, exist_ok=True)
+            shutil.copyfile(in_root(published), path)
+            print(f"[INFO] {published} -> {path}")
+    return paths
+
+
+def default_stages(spreadsheet: str = SPREADSHEET, build_dir: str = BUILD_DIR) -> List[Stage]:
+    from .build_corpus import shard_paths
+
+    def out(name):
+        return os.path.join(in_root(build_dir), name)
+
+    def code(*paths):
+        return [in_root(path) for path in paths]
+
+    spreadsheet = in_root(spreadsheet)
+    articles, bib = out("articles.csv"), out("publications_bibtex.bib")
+    authors, gexf = out("authors.json"), out("force_atlas_new.gexf")
+    generate_bibtex = code(
+        "scripts/GenerateBibtex/bib_gen.py",
+        "scripts/GenerateBibtex/bib_api.py",
+        "scripts/GenerateBibtex/utils.py",
+        "scripts/utils/spreadsheet.py",
+    )
+    corpus = out("publications_bibtex.corpus.json")
+    previous = snapshot_previous(build_dir)
+    previous_table, previous_graph = previous["authors.json"], previous["force_atlas_new.gexf"]
+    return [
+        Stage("urls", run_urls, [spreadsheet], [articles], generate_bibtex + code("scripts/utils/doi.py")),
+        Stage("bib", run_bib, [articles], [bib], generate_bibtex),
+        Stage(
+            "core",
+            run_core,
+            [bib],
+            [out("CORES_formated.json")],
+            code("scripts/utils/bibtex_to_CORE.py", "scripts/utils/CORE_template.json"),
+        ),
+        Stage(
+            "corpus",
+            run_corpus,
+            [bib],
+            [corpus] + shard_paths(corpus),
+            code("scripts/utils/build_corpus.py", "scripts/utils/bib_parser.py"),
+        ),
+        Stage(
+            "authors",
+            run_authors,
+            [bib, spreadsheet] + ([previous_table] if os.path.exists(previous_table) else []),
+            [authors],
+            code("scripts/utils/authors.py"),
+            {"table": previous_table},
+        ),
+        Stage(
+            "graph",
+            run_graph,
+            [bib, authors] + ([previous_graph] if os.path.exists(previous_graph) else []),
+            [gexf],
+            code(
+                "scripts/utils/coauthor_graph.py",
+                "scripts/utils/force_atlas.py",
+                "scripts/utils/authors.py",
+            ),
+            {"previous": previous_graph},
+        ),
+    ]
+
+
+def publish(build_dir: str = BUILD_DIR) -> int:
+    """
+    Copy the outputs to where the site reads them, returns the number of
+    files that changed
+    """
+    from .build_corpus import shard_paths
+
+    hashes = FileHashes()
+    corpus_files = ["publications_bibtex.corpus.json"] + [
+        os.path.basename(path) for path in shard_paths("publications_bibtex.corpus.json")
+    ]
+    targets = {
+        "publications_bibtex.bib": "data/publications_bibtex.bib",
+        **{name: "data/" + name for name in corpus_files},
+        "authors.json": AUTHORS_TABLE,
+        "force_atlas_new.gexf": SITE_GEXF,
+    }
+    changed = 0
+    for name, target in targets.items():
+        source, target = os.path.join(in_root(build_dir), name), in_root(target)
+        if not os.path.exists(source):
+            print(f"[ERROR] {source} was not built")
+            continue
+        if hashes(source) != hashes(target):
+            shutil.copyfile(source, target)
+            changed += 1
+            print(f"[INFO] {source} -> {target}")
+    refresh_msgpack_corpus(in_root("data/publications_bibtex.corpus.json"))
+    return changed
+
+
+def refresh_msgpack_corpus(json_path: str):
+    """
+    Rewrite the .corpus.msgpack next to `json_path` when it is older than
+    the json corpus, or remove it when msgpack is not installed, so Python
+    consumers never read a corpus of an older bib file
+    """
+    from .build_corpus import read_corpus
+
+    msgpack_path = json_path[: -len("json")] + "msgpack"
+    if not os.path.exists(json_path) or (
+        os.path.exists(msgpack_path) and os.path.getmtime(msgpack_path) >= os.path.getmtime(json_path)
+    ):
+        return
+    try:
+        import msgpack
+    except ImportError:
+        if os.path.exists(msgpack_path):
+            os.remove(msgpack_path)
+            print(f"[INFO] msgpack is not installed, removed the outdated {msgpack_path}")
+        return
+    corpus = read_corpus(json_path)
+    with open(msgpack_path, "wb") as file:
+        file.write(msgpack.packb(corpus, use_bin_type=True))
+    print(f"[INFO] {json_path} -> {msgpack_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("targets", nargs="*", help="stages to bring up to date, all by default")
+    parser.add_argument("--input", default=in_root(SPREADSHEET), help="publication spreadsheet")
+    parser.add_argument("--build", default=in_root(BUILD_DIR))
+    parser.add_argument("--force", nargs="*", default=[], help="stages to rerun anyway")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--publish", action="store_true", help="copy the outputs into the site")
+    parser.add_argument(
+        "--refresh-previous",
+        action="store_true",
+        help="copy the published author table and graph to build/previous/ again",
+    )
+    args = parser.parse_args()
+    # paths given on the command line are relative to the working directory
+    args.input, args.build = os.path.abspath(args.input), os.path.abspath(args.build)
+
+    if args.publish:
+        print(f"[INFO] {publish(args.build)} files published")
+        sys.exit(0)
+
+    if args.refresh_previous:
+        snapshot_previous(args.build, refresh=True)
+    start = time.perf_counter()
+    pipeline = Pipeline(default_stages(args.input, args.build), args.build)
+    ok = pipeline.run(args.targets, args.force, args.workers, args.dry_run)
+    print(f"[INFO] pipeline finished in {time.perf_counter() - start:.2f}s")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,51 @@
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    Token bucket used to keep request rates under an API budget.
+
+    Tokens are refilled continuously at `rate` tokens per second up to
+    `capacity`; each request consumes one token. `acquire` is the asyncio
+    entry point and `acquire_sync` the blocking one, so the same bucket can
+    be shared by coroutines and worker threads.
+
+    Args:
+    rate: requests per second allowed on average
+    capacity: maximum burst size (defaults to max(1, rate))
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        assert rate > 0, "[INFO] rate must be positive"
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """
+        Take one token and return how long the caller has to wait for it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,188 @@
+import os
+import json
+import threading
+from typing import Iterable, Iterator, List, Tuple
+
+# a flush compacts the file once this fraction of its lines is superseded
+COMPACT_RATIO = 0.5
+COMPACT_MIN_LINES = 64
+
+
+class RecordStore:
+    """
+    Append-only JSON lines store of records addressed by position.
+
+    Every line is {"i": index, "r": record}. Writing a record appends a
+    new line and points the in-memory offset index at it, so updates are
+    O(1) no matter how large the store is; reading a record is one seek.
+    Superseded lines are dropped by `compact`, which `flush` and `close`
+    run once COMPACT_RATIO of the lines are superseded. A torn last line
+    (crash during a write) is ignored when the store is opened.
+
+    The store behaves like a list: len(store), store[i], store[i] = record,
+    store.append(record) and iteration in index order. A record whose line
+    was lost (a gap) raises IndexError, iteration skips it and
+    `items()` gives the index of every record.
+
+    Args:
+    path: jsonl file, created on first write
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets: List[int] = []
+        # lines that no longer hold the current version of a record
+        self._dead = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self._reader = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as file:
+            offset = 0
+            for line in file:
+                if line.endswith(b"\n"):
+                    try:
+                        index = json.loads(line)["i"]
+                    except (ValueError, KeyError):
+                        index = None
+                    if index is None:
+                        self._dead += 1
+                    else:
+                        if index >= len(self._offsets):
+                            self._offsets.extend([-1] * (index + 1 - len(self._offsets)))
+                        if self._offsets[index] >= 0:
+                            self._dead += 1
+                        self._offsets[index] = offset
+                    offset += len(line)
+                else:
+                    # torn write, cut it off before appending after it
+                    with open(self.path, "r+b") as truncate:
+                        truncate.truncate(offset)
+
+    @classmethod
+    def open(cls, path: str, legacy_json: str = None) -> "RecordStore":
+        """
+        Open a store, importing the records of an older `legacy_json` list
+        file the first time
+        """
+        store = cls(path)
+        if len(store) == 0 and legacy_json and os.path.exists(legacy_json):
+            print(f"[INFO] Importing {legacy_json} into {path}")
+            with open(legacy_json, "r", errors="ignore") as file:
+                store.extend(json.loads(file.read()))
+            store.flush()
+        return store
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> dict:
+        with self._lock:
+            offset = self._offsets[index]
+            if offset < 0:
+                raise IndexError(f"record {index} of {self.path} is missing")
+            if self._writer is not None:
+                self._writer.flush()
+            if self._reader is None:
+                self._reader = open(self.path, "rb")
+            self._reader.seek(offset)
+            return json.loads(self._reader.readline())["r"]
+
+    def __setitem__(self, index: int, record: dict):
+        if index < 0:
+            index += len(self._offsets)
+        if not 0 <= index <= len(self._offsets):
+            raise IndexError(index)
+        line = (json.dumps({"i": index, "r": record}) + "\n").encode()
+        with self._lock:
+            if self._writer is None:
+                self._writer = open(self.path, "ab")
+            offset = self._writer.tell()
+            self._writer.write(line)
+            if index == len(self._offsets):
+                self._offsets.append(offset)
+            else:
+                if self._offsets[index] >= 0:
+                    self._dead += 1
+                self._offsets[index] = offset
+
+    def __iter__(self) -> Iterator[dict]:
+        for _, record in self.items():
+            yield record
+
+    def items(self) -> Iterator[Tuple[int, dict]]:
+        """
+        (index, record) pairs in index order, gaps are skipped
+        """
+        for index in range(len(self._offsets)):
+            if self._offsets[index] >= 0:
+                yield index, self[index]
+
+    def append(self, record: dict) -> int:
+        index = len(self._offsets)
+        self[index] = record
+        return index
+
+    def extend(self, records: Iterable[dict]):
+        for record in records:
+            self.append(record)
+
+    def update(self, index: int, **fields):
+        record = self[index]
+        record.update(fields)
+        self[index] = record
+
+    def flush(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+        lines = self._dead + sum(offset >= 0 for offset in self._offsets)
+        if self._dead >= COMPACT_MIN_LINES and self._dead >= COMPACT_RATIO * lines:
+            self.compact()
+
+    def close(self):
+        self.flush()
+        self._close_files()
+
+    def _close_files(self):
+        with self._lock:
+            for file in (self._writer, self._reader):
+                if file is not None:
+                    file.close()
+            self._writer, self._reader = None, None
+
+    def compact(self):
+        """
+        Rewrite the file with only the current version of every record
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as tmp:
+            offsets = [-1] * len(self._offsets)
+            for index, record in self.items():
+                offsets[index] = tmp.tell()
+                tmp.write((json.dumps({"i": index, "r": record}) + "\n").encode())
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._close_files()
+        os.replace(tmp_path, self.path)
+        self._offsets = offsets
+        self._dead = 0
+
+    @classmethod
+    def replace(cls, path: str, records: Iterable[dict]) -> "RecordStore":
+        """
+        Create a store holding exactly `records`, replacing any existing file
+        """
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        store = cls(tmp_path)
+        store.extend(records)
+        store.close()
+        os.replace(tmp_path, path)
+        return cls(path)
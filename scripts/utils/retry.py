@@ -0,0 +1,295 @@
+import time
+import random
+import threading
+import requests
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+from . import metrics
+from .http_cache import get_cache, encode_json
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class FetchResult:
+    """
+    Outcome of a request made under a RetryPolicy. Failed requests are kept
+    as results (see RetryPolicy.failures) instead of raising.
+    """
+
+    url: str
+    status: Optional[int] = None
+    data: Any = None
+    error: Optional[str] = None
+    attempts: int = 0
+    from_cache: bool = False
+    response: Any = field(default=None, repr=False)
+    exception: Optional[Exception] = field(default=None, repr=False)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status is not None and self.status < 400
+
+
+class RetryBudget:
+    """
+    Upper bound on the number of retries spent in one run, so a dead API
+    fails the run quickly instead of retrying every item.
+    """
+
+    def __init__(self, max_retries: int = 200):
+        self.max_retries = max_retries
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def consume(self) -> bool:
+        with self._lock:
+            if self.spent >= self.max_retries:
+                return False
+            self.spent += 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. After `failure_threshold` consecutive failures
+    the host is skipped for `reset_timeout` seconds, then a single trial
+    request is let through. Everyone else keeps being refused until the
+    trial succeeds, a failed trial opens the circuit again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures: Dict[str, int] = {}
+        self._opened: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            opened = self._opened.get(host)
+            if opened is None:
+                return True
+            now = time.monotonic()
+            if now - opened >= self.reset_timeout:
+                # half open: this caller is the trial request. The circuit
+                # stays open for the others, restarting the timer means a
+                # trial that never reports back is replaced after another
+                # reset_timeout
+                self._opened[host] = now
+                self._failures[host] = self.failure_threshold - 1
+                return True
+            return False
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures[host] = 0
+            self._opened.pop(host, None)
+
+    def record_failure(self, host: str):
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                self._opened[host] = time.monotonic()
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff that honors 429 / Retry-After.
+
+    Args:
+    max_retries: retries per request (the first attempt is not counted)
+    base_delay: backoff base in seconds, attempt n waits up to base * 2**n
+    max_delay: cap of the computed backoff
+    max_retry_after: longest Retry-After we are willing to wait, a longer
+        one gives up on the request instead of stalling the run
+    budget: retries shared by every request of the run
+    breaker: per-host circuit breaker
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 60,
+        max_retry_after: float = 120,
+        retry_status: tuple = RETRY_STATUS,
+        budget: RetryBudget = None,
+        breaker: CircuitBreaker = None,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_status = retry_status
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.failures: List[FetchResult] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def retry_after(response) -> Optional[float]:
+        """
+        Seconds to wait according to the Retry-After header, if present
+        """
+        if response is None:
+            return None
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Full jitter: uniform in [0, min(max_delay, base * 2**attempt)]
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def next_delay(
+        self,
+        url: str,
+        attempt: int,
+        response=None,
+        error: Exception = None,
+        max_retries: int = None,
+    ) -> Optional[float]:
+        """
+        Decide what to do after an attempt. Returns the number of seconds to
+        wait before retrying, or None when the request is finished (either
+        successfully or for good).
+        """
+        host = urlparse(url).netloc
+        if error is None and response.status_code not in self.retry_status:
+            self.breaker.record_success(host)
+            return None
+
+        self.breaker.record_failure(host)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if attempt >= max_retries or not self.breaker.allow(host):
+            return None
+
+        delay = self.backoff(attempt)
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            delay = max(delay, retry_after)
+        if not self.budget.consume():
+            return None
+        metrics.count_retry(url)
+        return delay
+
+    def result(
+        self, url: str, response=None, error: Exception = None, attempts: int = 0
+    ) -> FetchResult:
+        """
+        Build the FetchResult of a finished request and record it if it failed
+        """
+        result = FetchResult(url=url, attempts=attempts, response=response, exception=error)
+        if error is not None:
+            result.error = f"{type(error).__name__}: {error}"
+        else:
+            result.status = response.status_code
+            result.from_cache = getattr(response, "from_cache", False)
+            try:
+                result.data = response.json()
+            except ValueError:
+                result.data = None
+            if response.status_code >= 400:
+                result.error = f"HTTP {response.status_code}"
+        if not result.ok:
+            with self._lock:
+                self.failures.append(result)
+        return result
+
+    def call(
+        self, fn: Callable, url: str, max_retries: int = None
+    ) -> FetchResult:
+        """
+        Call `fn()` (which performs the request for `url`) until it succeeds,
+        fails permanently or runs out of retries.
+        """
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            if not self.breaker.allow(host):
+                return self.result(
+                    url, error=RuntimeError(f"circuit open for {host}"), attempts=attempt
+                )
+            response, error = None, None
+            try:
+                response = fn()
+            except requests.RequestException as e:
+                error = e
+            delay = self.next_delay(url, attempt, response, error, max_retries)
+            if delay is None:
+                return self.result(url, response, error, attempt + 1)
+            reason = error or f"HTTP {response.status_code}"
+            print(f"[ERROR] {reason}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+_policy = None
+
+
+def get_policy() -> RetryPolicy:
+    """
+    Retry policy shared by all fetch helpers of a run
+    """
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy()
+    return _policy
+
+
+def configure_policy(**kwargs) -> RetryPolicy:
+    """
+    Replace the shared retry policy, e.g. configure_policy(base_delay=0.1)
+    """
+    global _policy
+    _policy = RetryPolicy(**kwargs)
+    return _policy
+
+
+def fetch_with_retry(
+    url: str,
+    params: dict = None,
+    headers: dict = None,
+    method: str = "GET",
+    json_body=None,
+    session: requests.Session = None,
+    policy: RetryPolicy = None,
+    max_retries: int = None,
+    **kwargs,
+) -> FetchResult:
+    """
+    Cached request with retries. Cache hits never touch the policy.
+    """
+    policy = policy or get_policy()
+    cache = get_cache()
+    data = None
+    if json_body is not None:
+        data, headers = encode_json(json_body, headers)
+
+    key, cached = cache.lookup(method, url, params, headers, data)
+    if cached is not None:
+        return policy.result(url, cached, attempts=0)
+
+    def fn():
+        return cache.fetch(
+            key, method, url, params, headers, data, session=session, **kwargs
+        )
+
+    return policy.call(fn, url, max_retries=max_retries)
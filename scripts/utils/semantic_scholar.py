@@ -0,0 +1,92 @@
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+from .retry import fetch_with_retry
+
+BATCH_URL = "https://api.semanticscholar.org/graph/v1/paper/batch"
+GRAPH_PAPER_URL = "https://api.semanticscholar.org/graph/v1/paper/{paper_id}"
+BATCH_SIZE = 500
+BATCH_FIELDS = ["url", "title", "externalIds"]
+
+sha_reg = re.compile(r"^[0-9a-f]{40}$")
+arxiv_reg = re.compile(r"^(arxiv:)?\d{4}\.\d{4,5}(v\d+)?$", re.IGNORECASE)
+
+
+def to_paper_id(identifier: str) -> str:
+    """
+    Convert a DOI, arXiv id or Semantic Scholar id into the prefixed form
+    accepted by the graph API, e.g. "10.1/x" => "DOI:10.1/x"
+    """
+    identifier = identifier.strip()
+    prefix = identifier.split(":")[0].upper()
+    if prefix in ("DOI", "ARXIV", "CORPUSID", "MAG", "ACL", "PMID", "PMCID", "URL"):
+        return prefix + identifier[len(prefix) :]
+    if sha_reg.match(identifier.lower()):
+        return identifier.lower()
+    if arxiv_reg.match(identifier):
+        return "ARXIV:" + identifier
+    if identifier.startswith("10."):
+        return "DOI:" + identifier
+    return identifier
+
+
+def fetch_single_paper(paper_id: str, fields: List[str] = BATCH_FIELDS):
+    """
+    Fetch one paper from the graph API, returns None if it is not found
+    """
+    url = GRAPH_PAPER_URL.replace("{paper_id}", paper_id)
+    result = fetch_with_retry(url, params={"fields": ",".join(fields)})
+    if result.ok and isinstance(result.data, dict) and "error" not in result.data:
+        return result.data
+    return None
+
+
+def fetch_papers_batch(
+    identifiers: Iterable[str],
+    fields: List[str] = BATCH_FIELDS,
+    batch_size: int = BATCH_SIZE,
+    batch_url: str = BATCH_URL,
+    fallback: Optional[Callable] = fetch_single_paper,
+) -> Dict[str, Optional[dict]]:
+    """
+    Resolve many papers with POST /paper/batch, `batch_size` ids per request.
+
+    Identifiers can be DOIs, arXiv ids or Semantic Scholar ids and are
+    de-duplicated before querying. An explicit null in the batch answer means
+    the paper is not found; only the ids the batch call did not answer (a
+    failed chunk or a short response) are retried one at a time with
+    `fallback`.
+
+    Returns a dict mapping each input identifier to the paper json or None
+    """
+    identifiers = [i for i in dict.fromkeys(identifiers) if i]
+    paper_ids = {i: to_paper_id(i) for i in identifiers}
+    papers = {}
+
+    unique_ids = list(dict.fromkeys(paper_ids.values()))
+    for start in range(0, len(unique_ids), batch_size):
+        chunk = unique_ids[start : start + batch_size]
+        print(f"[INFO] batch {start // batch_size + 1}: {len(chunk)} papers")
+        result = fetch_with_retry(
+            batch_url,
+            method="POST",
+            params={"fields": ",".join(fields)},
+            json_body={"ids": chunk},
+        )
+        if result.ok and isinstance(result.data, list):
+            papers.update(zip(chunk, result.data))
+
+    missing = [pid for pid in unique_ids if pid not in papers]
+    if missing and fallback is not None:
+        print(f"[INFO] {len(missing)} papers not answered by batch, fetching one by one")
+        for pid in missing:
+            papers[pid] = fallback(pid, fields)
+
+    return {i: papers.get(pid) for i, pid in paper_ids.items()}
+
+
+def resolve_urls(identifiers: Iterable[str], **kwargs) -> Dict[str, Optional[str]]:
+    """
+    Semantic Scholar landing page url for every identifier (None if unknown)
+    """
+    papers = fetch_papers_batch(identifiers, **kwargs)
+    return {i: (paper or {}).get("url") for i, paper in papers.items()}
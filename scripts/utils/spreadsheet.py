@@ -0,0 +1,201 @@
+"""
+Streaming access to the publication spreadsheets.
+
+Institutional exports covering all the GWF years have hundreds of
+thousands of rows, so they are read in chunks of `CHUNK_SIZE` rows with
+only the columns a stage needs, and results are appended to the output
+as each chunk is done. Memory stays flat whatever the input size.
+
+The encoding of a csv file is detected once, before any row is read:
+utf-8 (with or without a BOM) when the whole file decodes as such,
+iso8859_16 (what the GWF exports use) otherwise. The check streams the
+file in blocks, an export that only leaves ASCII after its first 40k rows
+is still read as iso8859_16. Cells are read as strings, a missing value
+is "".
+
+    for chunk in read_chunks("data/gwf_2019_peer_review_articles.csv", [0, "semantic_scholar_url"]):
+        ...
+"""
+import os
+import csv
+import codecs
+from typing import Iterator, List, Optional, Sequence, Union
+
+import pandas as pd
+
+CHUNK_SIZE = 10000
+FALLBACK_ENCODING = "iso8859_16"
+BLOCK_BYTES = 1 << 20
+
+Column = Union[int, str]
+
+
+def detect_encoding(path: str, block_bytes: int = BLOCK_BYTES) -> str:
+    """
+    "utf-8-sig" if the whole file is valid utf-8, FALLBACK_ENCODING otherwise
+    """
+    # a block may end in the middle of a character, the incremental
+    # decoder carries it over to the next one
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    with open(path, "rb") as file:
+        try:
+            for block in iter(lambda: file.read(block_bytes), b""):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return FALLBACK_ENCODING
+    return "utf-8-sig"
+
+
+def read_header(path: str, encoding: str = None) -> List[str]:
+    """
+    Column names of a csv/xlsx spreadsheet
+    """
+    if path.endswith(".xlsx"):
+        rows = _xlsx_rows(path)
+        header = next(rows, ())
+        rows.close()
+        return ["" if cell is None else str(cell) for cell in header]
+    with open(path, "r", encoding=encoding or detect_encoding(path), newline="") as file:
+        return next(csv.reader(file), [])
+
+
+def _select(header: List[str], columns: Optional[Sequence[Column]]) -> List[str]:
+    # positions are resolved against the header, names that are not in
+    # the file are left out
+    if columns is None:
+        return list(header)
+    selected = []
+    for column in columns:
+        name = header[column] if isinstance(column, int) and column < len(header) else column
+        if name in header and name not in selected:
+            selected.append(name)
+    return selected
+
+
+def _xlsx_rows(path: str):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _xlsx_chunks(path: str, columns: Optional[Sequence[Column]], chunksize: int) -> Iterator[pd.DataFrame]:
+    rows = _xlsx_rows(path)
+    header = ["" if cell is None else str(cell) for cell in next(rows, ())]
+    names = _select(header, columns)
+    positions = [header.index(name) for name in names]
+
+    def frame(batch):
+        return pd.DataFrame(batch, columns=names, dtype=str)
+
+    batch = []
+    for row in rows:
+        batch.append(["" if i >= len(row) or row[i] is None else str(row[i]) for i in positions])
+        if len(batch) == chunksize:
+            yield frame(batch)
+            batch = []
+    if batch:
+        yield frame(batch)
+
+
+def read_chunks(
+    path: str,
+    columns: Optional[Sequence[Column]] = None,
+    chunksize: int = CHUNK_SIZE,
+    encoding: str = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a csv/xlsx spreadsheet as DataFrames of at most `chunksize` rows
+
+    Args:
+    path: csv or xlsx file, the first row is the header
+    columns: names or positions of the columns to load, all when None.
+    Columns that are not in the file are skipped, the others come in
+    the order of `columns`.
+    encoding: encoding of a csv file, detected when None
+
+    The index of the chunks continues from one chunk to the next.
+    """
+    assert os.path.exists(path), f"[INFO] Input file {path} does not exist"
+    if path.endswith(".xlsx"):
+        start = 0
+        for chunk in _xlsx_chunks(path, columns, chunksize):
+            chunk.index += start
+            start += len(chunk)
+            yield chunk
+        return
+
+    encoding = encoding or detect_encoding(path)
+    names = _select(read_header(path, encoding), columns)
+    chunks = pd.read_csv(
+        path,
+        header=0,
+        usecols=names,
+        dtype=str,
+        keep_default_na=False,
+        encoding=encoding,
+        chunksize=chunksize,
+    )
+    for chunk in chunks:
+        # usecols keeps the order of the file
+        yield chunk[names]
+
+
+def read_column(path: str, column: Column, encoding: str = None, **kwargs) -> Iterator[str]:
+    """
+    The values of one column, "" where the cell is empty or the column is missing
+    """
+    if not path.endswith(".xlsx"):
+        encoding = encoding or detect_encoding(path)
+    header = read_header(path, encoding)
+    name = header[column] if isinstance(column, int) and column < len(header) else column
+    # the first column is loaded too, to count the rows when `column` is missing
+    for chunk in read_chunks(path, [name, 0], encoding=encoding, **kwargs):
+        if name in chunk.columns:
+            yield from chunk[name]
+        else:
+            yield from [""] * len(chunk)
+
+
+class ChunkWriter:
+    """
+    Append DataFrame chunks to a csv file. The rows go to `<path>.tmp`,
+    which replaces `path` once the writer is closed without an error, so
+    an interrupted run never leaves half a spreadsheet behind.
+
+        with ChunkWriter("articles.csv") as writer:
+            for chunk in read_chunks(...):
+                writer.write(chunk)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._file = open(path + ".tmp", "w", encoding="utf-8", newline="")
+        self._columns = None
+
+    def write(self, chunk: pd.DataFrame):
+        header = self._columns is None
+        if header:
+            self._columns = list(chunk.columns)
+        chunk.to_csv(self._file, header=header, index=False, columns=self._columns)
+        self.rows += len(chunk)
+
+    def close(self, commit: bool = True):
+        if self._file.closed:
+            return
+        self._file.close()
+        if commit:
+            os.replace(self.path + ".tmp", self.path)
+        else:
+            os.remove(self.path + ".tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
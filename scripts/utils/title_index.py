@@ -0,0 +1,171 @@
+import os
+import json
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from .bib_parser import iter_entries
+from .paths import in_root
+from .title_scoring import TitleScorer, normalize_title, title_tokens
+
+DEFAULT_INDEX_PATH = os.environ.get("GWF_TITLE_INDEX") or in_root(".title_index.json")
+DEFAULT_SOURCES = [
+    in_root("data/publications_bibtex.bib"),
+    in_root("data/new_publications_bibtex.bib"),
+    in_root("data/ref_CORE.json"),
+]
+MIN_SCORE = 0.9
+
+
+class TitleIndex:
+    """
+    Inverted index from title tokens to known publications.
+
+    A citation string is matched by collecting the documents that share
+    the most (idf weighted) tokens with it and verifying the best ones:
+    a document matches when almost all of its title tokens and title
+    trigrams appear in the citation (authors, venue and year around the
+    title do not hurt).
+
+    Documents are {"title", "doi", "url"} dicts, de-duplicated on the
+    normalized title. `sources` remembers the size/mtime of every indexed
+    file so `update_from_files` only re-reads files that changed.
+    """
+
+    def __init__(self):
+        self.docs: List[dict] = []
+        self.sources: Dict[str, list] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._titles: Dict[str, int] = {}
+        self.changed = False
+
+    def add(self, title: str, doi: str = "", url: str = "") -> bool:
+        key = normalize_title(title or "")
+        if not key:
+            return False
+        if key in self._titles:
+            doc = self.docs[self._titles[key]]
+            # complete what an earlier source did not know
+            changed = False
+            for field, value in (("doi", doi), ("url", url)):
+                if value and not doc.get(field):
+                    doc[field] = value
+                    changed = True
+            self.changed = self.changed or changed
+            return changed
+
+        doc_id = len(self.docs)
+        self.docs.append({"title": title, "doi": doi or "", "url": url or ""})
+        self._titles[key] = doc_id
+        for token in set(title_tokens(title)):
+            self._postings.setdefault(token, []).append(doc_id)
+        self.changed = True
+        return True
+
+    def lookup(
+        self, citation: str, min_score: float = MIN_SCORE, candidates: int = 5
+    ) -> Optional[dict]:
+        """
+        Best matching document for a free text citation, or None
+        """
+        scorer = TitleScorer(citation)
+        weights = Counter()
+        n_docs = max(len(self.docs), 1)
+        for token in scorer.tokens:
+            posting = self._postings.get(token)
+            if posting:
+                idf = math.log(1 + n_docs / len(posting))
+                for doc_id in posting:
+                    weights[doc_id] += idf
+        if not weights:
+            return None
+
+        doc_ids = [doc_id for doc_id, _ in weights.most_common(candidates)]
+        best, best_score = scorer.best([self.docs[doc_id]["title"] for doc_id in doc_ids])
+        if best_score < min_score:
+            return None
+        return dict(self.docs[doc_ids[best]], score=best_score)
+
+    def update_from_files(self, paths: Iterable[str]) -> int:
+        """
+        (Re-)index the .bib / CORE json files that changed since the last
+        call. Returns the number of new documents.
+        """
+        added = 0
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            signature = [stat.st_size, stat.st_mtime]
+            if self.sources.get(path) == signature:
+                continue
+            print(f"[INFO] Indexing titles of {path}")
+            for record in read_title_records(path):
+                added += self.add(**record)
+            self.sources[path] = signature
+            self.changed = True
+        return added
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"sources": self.sources, "docs": self.docs}, file)
+        self.changed = False
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> "TitleIndex":
+        index = cls()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            for doc in data["docs"]:
+                index.add(doc["title"], doc.get("doi", ""), doc.get("url", ""))
+            index.sources = data["sources"]
+        index.changed = False
+        return index
+
+
+def read_title_records(path: str) -> List[dict]:
+    """
+    title/doi/url records of a .bib file or a CORE json lines file
+    """
+    records = []
+    if path.endswith(".bib"):
+        for entry in iter_entries(path):
+            records.append(
+                {
+                    "title": entry.get("title", ""),
+                    "doi": entry.get("doi", ""),
+                    "url": entry.get("url", ""),
+                }
+            )
+    else:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                core = json.loads(line)
+                records.append(
+                    {
+                        "title": core.get("title") or "",
+                        "doi": core.get("doi") or "",
+                        "url": core.get("downloadUrl") or "",
+                    }
+                )
+    return records
+
+
+_index = None
+
+
+def get_title_index(
+    path: str = DEFAULT_INDEX_PATH, sources: List[str] = DEFAULT_SOURCES
+) -> TitleIndex:
+    """
+    Shared index, loaded from disk and refreshed from the changed sources
+    """
+    global _index
+    if _index is None:
+        _index = TitleIndex.load(path)
+        _index.update_from_files(sources)
+        if _index.changed:
+            _index.save(path)
+    return _index
@@ -0,0 +1,140 @@
+import re
+import difflib
+from typing import Callable, Dict, List, Tuple
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or the to with "
+    "its their this that these those using via over under between".split()
+)
+
+
+def normalize_title(text: str) -> str:
+    """
+    lowercase, drop latex braces/accents commands and punctuation
+    """
+    text = re.sub(r"\\[a-zA-Z]+|[{}]", "", text.lower())
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def title_tokens(text: str) -> List[str]:
+    return [
+        t
+        for t in normalize_title(text).split()
+        if len(t) > 2 and t not in STOPWORDS and not t.isdigit()
+    ]
+
+
+def trigrams(text: str) -> set:
+    text = normalize_title(text).replace(" ", "")
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def banded_edit_distance(a: str, b: str, band: int) -> int:
+    """
+    Levenshtein distance restricted to a diagonal band of width `band`,
+    O(len(a) * band). Returns band + 1 when the distance exceeds the band.
+    """
+    if abs(len(a) - len(b)) > band:
+        return band + 1
+    inf = band + 1
+    previous = {j: j for j in range(0, min(len(b), band) + 1)}
+    for i in range(1, len(a) + 1):
+        current = {}
+        lo, hi = max(0, i - band), min(len(b), i + band)
+        if lo == 0:
+            current[0] = i
+        row_min = current.get(0, inf)
+        for j in range(max(lo, 1), hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(
+                previous.get(j, inf) + 1,
+                current.get(j - 1, inf) + 1,
+                previous.get(j - 1, inf) + cost,
+            )
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > band:
+            return band + 1
+        previous = current
+    return min(previous.get(len(b), inf), inf)
+
+
+class TitleScorer:
+    """
+    Scores candidate titles against one citation string.
+
+    Everything derived from the citation (normalized text, tokens and
+    trigrams) is computed once in the constructor, so ranking the 50 hits
+    of a search costs set intersections rather than 50 quadratic
+    SequenceMatcher runs over the whole citation.
+
+    All scores are in [0, 1] and measure how much of the *title* is found
+    in the citation, as the citation also holds authors, venue and year.
+
+    Args:
+    citation: free text reference of the publication
+    method: "token_set", "trigram", "edit" or "combined"
+    """
+
+    def __init__(self, citation: str, method: str = "combined"):
+        assert method in SCORERS, f"[INFO] Unknown scoring method {method}"
+        self.citation = citation
+        self.method = method
+        self.text = normalize_title(citation)
+        self.tokens = set(title_tokens(citation))
+        self.trigrams = trigrams(citation)
+        self._compact = self.text.replace(" ", "")
+
+    def token_set(self, title: str) -> float:
+        tokens = set(title_tokens(title))
+        return len(tokens & self.tokens) / max(len(tokens), 1)
+
+    def trigram(self, title: str) -> float:
+        grams = trigrams(title)
+        return len(grams & self.trigrams) / max(len(grams), 1)
+
+    def edit(self, title: str) -> float:
+        """
+        Edit similarity between the title and the part of the citation
+        that starts where the title does
+        """
+        title = normalize_title(title).replace(" ", "")
+        if not title:
+            return 0.0
+        start = self._compact.find(title[:8])
+        if start == -1:
+            return 0.0
+        window = self._compact[start : start + len(title)]
+        band = max(2, len(title) // 5)
+        distance = banded_edit_distance(title, window, band)
+        return max(0.0, 1 - distance / len(title))
+
+    def combined(self, title: str) -> float:
+        return min(self.token_set(title), self.trigram(title))
+
+    def score(self, title: str) -> float:
+        return getattr(self, self.method)(title)
+
+    def best(self, titles: List[str]) -> Tuple[int, float]:
+        """
+        Index and score of the best matching title. The containment scores
+        saturate at 1.0, titles tied for the best score are ranked by the
+        difflib ratio of the whole title against the citation.
+        """
+        scores = [self.score(title) for title in titles]
+        top = max(scores)
+        tied = [i for i, score in enumerate(scores) if score == top]
+        if len(tied) > 1:
+            tied.sort(key=lambda i: -self.tie_break(titles[i]))
+        return tied[0], top
+
+    def tie_break(self, title: str) -> float:
+        return difflib.SequenceMatcher(None, normalize_title(title), self.text).ratio()
+
+
+SCORERS: Dict[str, Callable] = {
+    "token_set": TitleScorer.token_set,
+    "trigram": TitleScorer.trigram,
+    "edit": TitleScorer.edit,
+    "combined": TitleScorer.combined,
+}
@@ -0,0 +1,18 @@
+import pytest
+
+from scripts.benchmarks.mock_server import MockServer
+from scripts.utils import http_cache
+
+
+@pytest.fixture(autouse=True)
+def no_http_cache(tmp_path):
+    # every test talks to the mock server, never to a cached answer
+    http_cache.configure(path=str(tmp_path / "cache.sqlite"), bypass=True)
+    yield
+    http_cache._cache = None
+
+
+@pytest.fixture(scope="session")
+def mock_server():
+    with MockServer() as server:
+        yield server
@@ -0,0 +1,13 @@
+from scripts.GenerateBibtex.bib_api import fetch_bib_doi
+
+
+def test_fetch_bib_doi(mock_server):
+    doi = next(iter(mock_server.data.bibtex))
+    bib = fetch_bib_doi(doi, "an abstract", base_url=mock_server.url + "/")
+    assert bib["doi"].lower() == doi
+    assert bib["abstract"] == "an abstract"
+    assert " and " not in bib["author"]
+
+
+def test_fetch_bib_doi_not_found(mock_server):
+    assert fetch_bib_doi("10.0000/missing", base_url=mock_server.url + "/") is None
@@ -0,0 +1,34 @@
+import pytest
+
+from scripts.utils.bib_parser import iter_entries, split_persons
+
+JARDINE = ["Razak Abu", "Maureen G. Reed", "Timothy D. Jardine"]
+
+
+@pytest.mark.parametrize(
+    "value, names",
+    [
+        ("Razak Abu, Maureen G. Reed, Timothy D. Jardine", JARDINE),
+        ("Razak Abu, Maureen G. Reed, and Timothy D. Jardine", JARDINE),
+        ("Razak Abu, Maureen G. Reed and Timothy D. Jardine", JARDINE),
+        ("Razak Abu, and Timothy D. Jardine", ["Razak Abu", "Timothy D. Jardine"]),
+        ("John Smith and Jane Doe", ["John Smith", "Jane Doe"]),
+        (
+            "Abu, Razak and Reed, Maureen G. and Jardine, Timothy D.",
+            ["Abu, Razak", "Reed, Maureen G.", "Jardine, Timothy D."],
+        ),
+        ("Van Der Berg, John Paul and Doe, Jane", ["Van Der Berg, John Paul", "Doe, Jane"]),
+        ("de Souza, João", ["de Souza, João"]),
+        ("Smith, Jr, John", ["Smith, Jr, John"]),
+        ("{Barenboim and Sons}, Inc.", ["{Barenboim and Sons}, Inc."]),
+    ],
+)
+def test_split_persons(value, names):
+    assert split_persons(value) == names
+
+
+def test_persons_of_a_bib_entry():
+    bib = b"@article{abu2019, author = {Razak Abu, Maureen G. Reed, and Timothy D. Jardine}, title = {T}}"
+    (entry,) = iter_entries(bib, persons=True)
+    assert len(entry["author"]) == 3
+    assert not any(name.endswith(",") for name in entry["author"])
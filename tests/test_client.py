@@ -0,0 +1,58 @@
+import pytest
+
+from scripts.benchmarks.mock_server import MockServer, PAGE_LIMIT
+from scripts.GenerateMetadata.helper import fetch_citations, fetch_references
+from scripts.utils.retry import RetryPolicy
+
+
+def _urls(server):
+    listing = server.url + "/graph/v1/paper/{paper_id}/%s?fields={fields}&offset={offset}&limit=999"
+    return {"citation_url": listing % "citations", "references_url": listing % "references"}
+
+
+def _fetch_citations(server, paper_id, **kwargs):
+    return fetch_citations(
+        paper_id,
+        citation_url=_urls(server)["citation_url"],
+        requests_per_second=1000,
+        policy=RetryPolicy(base_delay=0.01, max_retries=10),
+        **kwargs,
+    )
+
+
+@pytest.fixture(scope="module")
+def big_paper(mock_server):
+    counts = mock_server.data.citation_count
+    return max(counts, key=counts.get)
+
+
+def test_citations_are_paged_past_the_page_limit(mock_server, big_paper):
+    count = mock_server.data.citation_count[big_paper]
+    assert count > PAGE_LIMIT
+    citations = _fetch_citations(mock_server, big_paper)
+    assert len(citations) == count
+    assert len({paper["paperId"] for paper in citations}) == count
+
+
+@pytest.mark.parametrize("stale", [PAGE_LIMIT + 1, 10])
+def test_a_stale_count_still_fetches_every_page(mock_server, big_paper, stale):
+    citations = _fetch_citations(mock_server, big_paper, count=stale)
+    assert len(citations) == mock_server.data.citation_count[big_paper]
+
+
+def test_429s_are_retried(mock_server, big_paper):
+    with MockServer(mock_server.data, rate_429=0.5, retry_after=0.01, seed=1) as server:
+        citations = _fetch_citations(server, big_paper)
+        assert server.snapshot().get("429", 0) > 0
+    assert len(citations) == mock_server.data.citation_count[big_paper]
+
+
+def test_missing_paper_is_none(mock_server):
+    assert _fetch_citations(mock_server, "0" * 40) is None
+
+
+def test_references(mock_server, big_paper):
+    references = fetch_references(
+        big_paper, references_url=_urls(mock_server)["references_url"], requests_per_second=1000
+    )
+    assert references and all("paperId" in paper for paper in references)
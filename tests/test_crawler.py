@@ -0,0 +1,42 @@
+import numpy as np
+
+from scripts.GenerateMetadata.crawler import CitationGraph
+
+
+def _graph(n):
+    graph = CitationGraph()
+    for i in range(n):
+        graph.add_paper({"paperId": f"p{i}"}, 0)
+    return graph
+
+
+def test_edges_of_a_single_batch_are_unique():
+    # two seeds citing each other, found from both ends in one add_edges call
+    graph = _graph(2)
+    graph.add_edges([0, 0], [1, 1])
+    citing, cited = graph.edges
+    assert citing.tolist() == [0] and cited.tolist() == [1]
+    assert graph.citations_in_graph().tolist() == [0, 1]
+
+
+def test_edges_are_merged_across_batches():
+    graph = _graph(3)
+    graph.add_edges([0, 1], [1, 2])
+    assert len(graph.edges[0]) == 2
+    graph.add_edges([1, 0], [2, 2])
+    citing, cited = graph.edges
+    assert sorted(zip(citing.tolist(), cited.tolist())) == [(0, 1), (0, 2), (1, 2)]
+    assert graph.citations_in_graph().tolist() == [0, 1, 2]
+
+
+def test_empty_graph_has_no_edges():
+    citing, cited = CitationGraph().edges
+    assert citing.dtype == np.int32 and len(citing) == len(cited) == 0
+
+
+def test_saved_graph_loads_the_same_edges(tmp_path):
+    graph = _graph(2)
+    graph.add_edges([0, 0, 1], [1, 1, 0])
+    graph.save(str(tmp_path / "graph"))
+    loaded = CitationGraph.load(str(tmp_path / "graph"))
+    assert [a.tolist() for a in loaded.edges] == [a.tolist() for a in graph.edges]
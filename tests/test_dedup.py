@@ -0,0 +1,43 @@
+from scripts.utils.bibtex_to_CORE import bibdict_to_CORE
+from scripts.utils.dedup import find_duplicates
+
+TITLE = "Monthly Gridded Data Product of Northern Wetland Methane Emissions Based on Upscaling Eddy Covariance Observations"
+
+
+def _record(title, entry_type="article", year="2020", doi=""):
+    record = bibdict_to_CORE({"title": title, "year": year, "doi": doi})
+    record["enrichments"]["documentType"]["type"] = entry_type
+    return record
+
+
+def _clusters(records):
+    clusters, _ = find_duplicates(records)
+    return [clusters.find(i) for i in range(len(records))]
+
+
+def test_near_duplicate_titles_are_merged():
+    records = [_record(TITLE), _record(TITLE.lower() + ".")]
+    assert _clusters(records) == [0, 0]
+
+
+def test_dataset_is_not_merged_with_its_paper():
+    # similarity 0.931, above the threshold
+    records = [_record(f'Dataset for "{TITLE}"'), _record(TITLE)]
+    assert _clusters(records) == [0, 1]
+    records = [_record(f"Data for {TITLE}", entry_type=None), _record(TITLE, entry_type=None)]
+    assert _clusters(records) == [0, 1]
+
+
+def test_different_entry_types_are_not_merged():
+    assert _clusters([_record(TITLE, "misc"), _record(TITLE, "article")]) == [0, 1]
+
+
+def test_entry_types_are_kept_per_cluster():
+    # the untyped record joins the article on its doi, the misc one
+    # must not join through it
+    records = [
+        _record(TITLE, "article", doi="10.1/a"),
+        _record(TITLE, None, doi="10.1/a"),
+        _record(TITLE, "misc"),
+    ]
+    assert _clusters(records) == [0, 0, 2]
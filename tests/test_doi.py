@@ -0,0 +1,7 @@
+from scripts.utils.doi import ref_extract
+
+
+def test_ref_extract():
+    extract = ref_extract(" Smith, J. (2019). Snow. J. Hydrol. doi:10.1016/j.jhydrol.2019.01.001 ")
+    assert extract == {"doi": "10.1016/j.jhydrol.2019.01.001", "text": "Smith, J. (2019). Snow. J. Hydrol."}
+    assert ref_extract("No doi here") == {"doi": "", "text": "No doi here"}
@@ -0,0 +1,8 @@
+from scripts.benchmarks.load_test import _end_to_end
+
+
+def test_end_to_end_builds_an_entry_per_paper(mock_server):
+    dois = list(mock_server.data.by_doi)[:20]
+    timings = _end_to_end(mock_server, dois)
+    assert len(timings) == len(dois)
+    assert all(ok and seconds >= 0 for seconds, ok in timings)
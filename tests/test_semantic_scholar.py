@@ -0,0 +1,46 @@
+from scripts.benchmarks.mock_server import MockServer
+from scripts.utils.semantic_scholar import fetch_papers_batch
+
+
+def _fetch(server, ids, batch_url=None):
+    calls = []
+
+    def fallback(pid, fields):
+        calls.append(pid)
+        return {"paperId": pid}
+
+    papers = fetch_papers_batch(
+        ids, batch_url=batch_url or server.url + "/graph/v1/paper/batch", fallback=fallback
+    )
+    return papers, calls
+
+
+def test_null_batch_entries_are_not_refetched(mock_server):
+    known = mock_server.data.ids[0]
+    papers, calls = _fetch(mock_server, [known, "0" * 40])
+    assert papers[known]["paperId"] == known
+    assert papers["0" * 40] is None
+    assert calls == []
+
+
+def test_failed_batch_falls_back_to_single_fetches(mock_server):
+    ids = mock_server.data.ids[:3]
+    papers, calls = _fetch(mock_server, ids, batch_url=mock_server.url + "/missing")
+    assert calls == ids
+    assert all(papers[i] == {"paperId": i} for i in ids)
+
+
+class _ShortBatchServer(MockServer):
+    def respond(self, endpoint, path, query, body):
+        status, payload, content_type = super().respond(endpoint, path, query, body)
+        if endpoint == "batch":
+            payload = payload[:-1]
+        return status, payload, content_type
+
+
+def test_ids_cut_from_a_short_batch_answer_fall_back(mock_server):
+    ids = mock_server.data.ids[:3]
+    with _ShortBatchServer(mock_server.data) as server:
+        papers, calls = _fetch(server, ids)
+    assert calls == ids[-1:]
+    assert papers[ids[0]]["paperId"] == ids[0]